@@ -1,53 +1,178 @@
 from amaranth import *
 from amaranth.lib import wiring
 from amaranth.lib.wiring import In, Out
-from amaranth_soc import wishbone
-from amaranth_soc.csr.wishbone import WishboneCSRBridge
-from .axi_to_wishbone import Axi2Wishbone
+from amaranth_soc import csr, wishbone
+from typing import Optional
+from .axi import AxiArbiter
+from .axi_to_wishbone import Axi2Wishbone, PipelinedAxi2Wishbone
 from .cpu import Cpu
-from .zynq_ifaces import MAxiGP, SAxiGP
+from .csr_bridge import CSRBridge
+from .decoder import PipelinedDecoder
+from .timestamp import Timestamp
+from .zynq_ifaces import MAxiGP, SAxiACP, SAxiGP, SAxiHP
 
 
 __all__ = ["SoC"]
 
 
 class SoC(wiring.Component):
-    ext_jtag: In(wiring.Signature({
-        "tck": Out(1),
-        "tms": Out(1),
-        "tdi": Out(1),
-        "tdo": In(1),
-    }))
-    ext_uart: Out(wiring.Signature({
-        "tx": Out(1),
-        "rx": In(1),
-    }))
-    cpu_to_sys: Out(SAxiGP)
-    sys_to_csr: Out(MAxiGP)
-
-    def __init__(self):
-        super().__init__()
+    # Each core has its CSRs at 0x4000_0000 + 0x2000 * n, and above them its fetch profiler at
+    # 0x200, its performance counters at 0x400, its latency monitor at 0x800, its trace unit at
+    # 0xc00 and its mailbox window at 0x1000. The host side of its shared memory is at
+    # 0x4100_0000 + 0x1_0000 * n.
+    # With several cores, their system, ring and trace buses share the PS ports through arbiters.
+    # Without `cpu_domain`, a core stopped or reset by the host finishes its transactions first, so
+    # the others never wait on one it left half done.
+    # The 64-bit timestamp the cores see at 0x0006_0000 is at 0x4080_0100 for the host.
+    # With `posted_writes`, host writes are answered as soon as the bridge has buffered them, and
+    # bridge_status at 0x4080_0000 keeps whether any of them failed since it was last cleared.
+    class BridgeStatus(csr.Register, access="rw"):
+        write_error: csr.Field(csr.action.RW1C, 1)
+
+    def __init__(self, *, bridge: str = "fsm", cpu_port: str = "gp", cpu_domain: Optional[str] = None,
+                 cores: int = 1, scheduling: str = "round_robin", posted_writes: bool = False):
+        if bridge not in ("fsm", "pipelined"):
+            raise ValueError(f"Bridge must be one of fsm or pipelined, not {bridge!r}")
+        if cpu_port not in ("gp", "hp", "acp"):
+            raise ValueError(f"CPU port must be one of gp, hp or acp, not {cpu_port!r}")
+        if scheduling not in ("round_robin", "priority"):
+            raise ValueError(f"Scheduling must be one of round_robin or priority, not {scheduling!r}")
+        if cores < 1:
+            raise ValueError(f"Core count must be at least 1, not {cores!r}")
+        self._bridge = bridge
+        self._cpu_port = cpu_port
+        self._cpu_domain = cpu_domain
+        self._cores = cores
+        self._scheduling = scheduling
+        self._posted_writes = posted_writes
+        super().__init__({
+            "ext_jtag": In(wiring.Signature({
+                "tck": Out(1),
+                "tms": Out(1),
+                "tdi": Out(1),
+                "tdo": In(1),
+            })),
+            "ext_uart": Out(wiring.Signature({
+                "tx": Out(1),
+                "rx": In(1),
+            })),
+            "mailbox_irq": Out(wiring.Signature({
+                "read_not_empty": Out(1),
+                "read_watermark": Out(1),
+                "write_watermark": Out(1),
+            })).array(cores),
+            "cpu_to_sys": Out({"gp": SAxiGP, "hp": SAxiHP, "acp": SAxiACP}[cpu_port]),
+            "mailbox_to_sys": Out(SAxiHP),
+            "trace_to_sys": Out(SAxiHP),
+            "sys_to_csr": Out(MAxiGP),
+        })
 
     def elaborate(self, platform):
         m = Module()
 
-        m.submodules.cpu = cpu = Cpu()
-        wiring.connect(m, cpu.ext_jtag, wiring.flipped(self.ext_jtag))
-        wiring.connect(m, cpu.ext_uart, wiring.flipped(self.ext_uart))
-        wiring.connect(m, cpu.sys_bus, wiring.flipped(self.cpu_to_sys))
+        # A single core keeps the unprefixed names
+        prefixes = [()] if self._cores == 1 else [(f"cpu{n}",) for n in range(self._cores)]
+
+        cpus = []
+        for n, prefix in enumerate(prefixes):
+            # Cores get the BSCANE2 USER4 chain down to USER1
+            cpu = Cpu(
+                sys_port=self._cpu_port,
+                cpu_domain=self._cpu_domain,
+                prefix=prefix,
+                bscan_chain=4 - n if n < 4 else None,
+            )
+            m.submodules[prefix[0] if prefix else "cpu"] = cpu
+            wiring.connect(m, cpu.mailbox_irq, wiring.flipped(self.mailbox_irq[n]))
+            cpus.append(cpu)
+
+        # The board only has one UART and one set of JTAG pins, they go to the first core
+        wiring.connect(m, cpus[0].ext_jtag, wiring.flipped(self.ext_jtag))
+        wiring.connect(m, cpus[0].ext_uart, wiring.flipped(self.ext_uart))
+        for cpu in cpus[1:]:
+            m.d.comb += cpu.ext_uart.rx.eq(1)
 
-        m.submodules.axi2wb = axi2wb = Axi2Wishbone()
+        m.submodules.timestamp = timestamp = Timestamp()
+        for cpu in cpus:
+            m.d.comb += cpu.timestamp.eq(timestamp.count)
+
+        if self._cores == 1:
+            wiring.connect(m, cpus[0].sys_bus, wiring.flipped(self.cpu_to_sys))
+            wiring.connect(m, cpus[0].ring_bus, wiring.flipped(self.mailbox_to_sys))
+            wiring.connect(m, cpus[0].trace_bus, wiring.flipped(self.trace_to_sys))
+        else:
+            m.submodules.sys_arbiter = sys_arbiter = AxiArbiter(
+                self.cpu_to_sys.signature,
+                scheduling=self._scheduling,
+            )
+            m.submodules.ring_arbiter = ring_arbiter = AxiArbiter(SAxiHP, scheduling=self._scheduling)
+            m.submodules.trace_arbiter = trace_arbiter = AxiArbiter(SAxiHP, scheduling=self._scheduling)
+            for cpu in cpus:
+                sys_arbiter.add(cpu.sys_bus)
+                ring_arbiter.add(cpu.ring_bus)
+                trace_arbiter.add(cpu.trace_bus)
+            wiring.connect(m, sys_arbiter.bus, wiring.flipped(self.cpu_to_sys))
+            wiring.connect(m, ring_arbiter.bus, wiring.flipped(self.mailbox_to_sys))
+            wiring.connect(m, trace_arbiter.bus, wiring.flipped(self.trace_to_sys))
+
+        # The pipelined bridge runs Wishbone B4 pipelined cycles all the way to the CSRs, so several
+        # accesses can be in flight
+        if self._bridge == "pipelined":
+            m.submodules.axi2wb = axi2wb = PipelinedAxi2Wishbone(features={"err", "stall"},
+                                                                 posted=self._posted_writes)
+            m.submodules.decoder = decoder = PipelinedDecoder(
+                addr_width=30,
+                data_width=32,
+                granularity=8,
+                features={"err", "stall"},
+            )
+            csr_features = {"stall"}
+        else:
+            m.submodules.axi2wb = axi2wb = Axi2Wishbone(posted=self._posted_writes)
+            m.submodules.decoder = decoder = wishbone.Decoder(
+                addr_width=30,
+                data_width=32,
+                granularity=8,
+                features={"err"},
+            )
+            csr_features = set()
         wiring.connect(m, axi2wb.axi, wiring.flipped(self.sys_to_csr))
-        m.submodules.decoder = decoder = wishbone.Decoder(
-            addr_width=30,
-            data_width=32,
-            granularity=8,
-            features={"err"},
-        )
 
-        m.submodules.csr_wb = csr_wb = WishboneCSRBridge(cpu.csr_bus, data_width=32)
+        for n, (cpu, prefix) in enumerate(zip(cpus, prefixes)):
+            csr_wb = CSRBridge(cpu.csr_bus, data_width=32, granularity=8, features=csr_features, prefix=prefix)
+            m.submodules["_".join(prefix + ("csr_wb",))] = csr_wb
+            decoder.add(csr_wb.wb_bus, addr=0x4000_0000 + 0x2000 * n)
+            profiler_wb = CSRBridge(cpu.profiler_bus, data_width=32, granularity=8, features=csr_features,
+                                    prefix=prefix + ("profiler",))
+            m.submodules["_".join(prefix + ("profiler_wb",))] = profiler_wb
+            decoder.add(profiler_wb.wb_bus, addr=0x4000_0200 + 0x2000 * n)
+            perf_wb = CSRBridge(cpu.perf_bus, data_width=32, granularity=8, features=csr_features,
+                                prefix=prefix + ("perf",))
+            m.submodules["_".join(prefix + ("perf_wb",))] = perf_wb
+            decoder.add(perf_wb.wb_bus, addr=0x4000_0400 + 0x2000 * n)
+            latency_wb = CSRBridge(cpu.latency_bus, data_width=32, granularity=8, features=csr_features,
+                                   prefix=prefix + ("latency",))
+            m.submodules["_".join(prefix + ("latency_wb",))] = latency_wb
+            decoder.add(latency_wb.wb_bus, addr=0x4000_0800 + 0x2000 * n)
+            trace_wb = CSRBridge(cpu.trace_csr_bus, data_width=32, granularity=8, features=csr_features,
+                                 prefix=prefix + ("trace",))
+            m.submodules["_".join(prefix + ("trace_wb",))] = trace_wb
+            decoder.add(trace_wb.wb_bus, addr=0x4000_0C00 + 0x2000 * n)
+            decoder.add(cpu.mailbox_bus, addr=0x4000_1000 + 0x2000 * n)
+            decoder.add(cpu.shared_bus, addr=0x4100_0000 + 0x1_0000 * n)
+
+        m.submodules.timestamp_wb = timestamp_wb = CSRBridge(timestamp.csr_bus, data_width=32, granularity=8,
+                                                             features=csr_features, prefix=("timestamp",))
+        decoder.add(timestamp_wb.wb_bus, addr=0x4080_0100)
 
-        decoder.add(csr_wb.wb_bus, addr=0x4000_0000)
+        if self._posted_writes:
+            regs = csr.Builder(addr_width=2, data_width=32)
+            bridge_status = regs.add("bridge_status", self.BridgeStatus())
+            m.submodules.status_bridge = status_bridge = csr.Bridge(regs.as_memory_map())
+            m.submodules.status_wb = status_wb = CSRBridge(status_bridge.bus, data_width=32, granularity=8,
+                                                           features=csr_features)
+            decoder.add(status_wb.wb_bus, addr=0x4080_0000)
+            m.d.comb += bridge_status.f.write_error.set.eq(axi2wb.write_error)
         wiring.connect(m, axi2wb.wishbone, decoder.bus)
 
         for resource in decoder.bus.memory_map.all_resources():
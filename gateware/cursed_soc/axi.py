@@ -0,0 +1,937 @@
+from amaranth import *
+from amaranth.lib import wiring
+from amaranth.lib.fifo import AsyncFIFO, SyncFIFO
+from amaranth.lib.memory import Memory
+from amaranth.lib.wiring import In, Out
+from amaranth.utils import exact_log2
+
+
+__all__ = ["AxiDecoder", "AxiArbiter", "AxiCrossbar", "AxiUpsizer", "AxiAsyncBridge", "AxiDrain", "AxiReadCache"]
+
+
+AXI_BURST_FIXED = 0b00
+AXI_BURST_INCR = 0b01
+AXI_BURST_WRAP = 0b10
+AXI_RESP_OKAY = 0b00
+AXI_RESP_DECERR = 0b11
+
+
+def _channel_members(signature, channel, flow):
+    # Payload members of a channel going in `flow` direction as seen by the manager
+    members = signature.members[channel].signature.members
+    return [name for name, member in members.items() if member.flow == flow and name not in ("valid", "ready")]
+
+
+def _data_width(signature):
+    return Shape.cast(signature.members["read"].signature.members["data"].shape).width
+
+
+def _forward(m, signature, manager, subordinate,
+             channels=("read_address", "read", "write_address", "write_data", "write_response")):
+    # Connects two views of a bus by member name, whichever side of a component they are on
+    for channel in channels:
+        manager_channel = getattr(manager, channel)
+        subordinate_channel = getattr(subordinate, channel)
+        for name, member in signature.members[channel].signature.members.items():
+            if member.flow == Out:
+                m.d.comb += getattr(subordinate_channel, name).eq(getattr(manager_channel, name))
+            else:
+                m.d.comb += getattr(manager_channel, name).eq(getattr(subordinate_channel, name))
+
+
+def _next_beat_addr(addr, size, burst):
+    return Mux(burst == AXI_BURST_FIXED, addr, addr + (Const(1, 8) << size))
+
+
+def _burst_span(addr, beats, size, burst):
+    # First and last byte a burst of `beats` + 1 beats touches, a WRAP burst covers its whole
+    # aligned block
+    length = (beats + 1) << size
+    start = Mux(burst == AXI_BURST_WRAP, addr - (addr & (length - 1)), addr)
+    end = Mux(burst == AXI_BURST_FIXED, addr + (Const(1, 8) << size) - 1, start + length - 1)
+    return start[:32], end[:32]
+
+
+class AxiDecoder(wiring.Component):
+    # Routes the transactions of `bus` to subordinates by address. Responses must come back in
+    # order per direction, which only a single subordinate guarantees, so a request for another
+    # subordinate is held until everything in flight in its direction has completed.
+    # Subordinates are AXI interfaces the decoder drives from the manager side, their payload
+    # members may be wider or narrower than the decoder's (e.g. IDs) and extra members are left
+    # alone. Transactions nothing is mapped for go to the default subordinate, if there is one,
+    # or get a DECERR.
+    def __init__(self, signature, *, max_outstanding: int = 7):
+        super().__init__({
+            "bus": In(signature),
+        })
+        self._bus_signature = signature
+        self._max_outstanding = max_outstanding
+        self._subs = []
+        self._default = None
+
+    def add(self, sub_bus, *, addr: int = None, size: int = None):
+        if addr is None:
+            if size is not None:
+                raise ValueError("The default subordinate has no size")
+            if self._default is not None:
+                raise ValueError("Decoder already has a default subordinate")
+            self._default = sub_bus
+            return
+        if size is None or size <= 0:
+            raise ValueError(f"Size must be a positive integer, not {size!r}")
+        for _, start, end in self._subs:
+            if addr < end and start < addr + size:
+                raise ValueError(f"Range 0x{addr:08x}-0x{addr + size:08x} overlaps 0x{start:08x}-0x{end:08x}")
+        self._subs.append((sub_bus, addr, addr + size))
+
+    def elaborate(self, platform):
+        m = Module()
+
+        subs = [sub_bus for sub_bus, _, _ in self._subs]
+        if self._default is not None:
+            subs.append(self._default)
+        # Index len(subs) is the DECERR responder, it's only decoded to without a default
+        error = len(subs)
+
+        def decode(addr):
+            target = Signal(range(len(subs) + 1))
+            m.d.comb += target.eq(len(self._subs) if self._default is not None else error)
+            for i, (_, start, end) in reversed(list(enumerate(self._subs))):
+                with m.If((addr >= start) & (addr < end)):
+                    m.d.comb += target.eq(i)
+            return target
+
+        def forward(channel, sub_bus, target):
+            sub_channel = getattr(sub_bus, channel)
+            bus_channel = getattr(self.bus, channel)
+            sub_members = sub_channel.signature.members
+            for name in _channel_members(self._bus_signature, channel, Out):
+                if name in sub_members:
+                    m.d.comb += getattr(sub_channel, name).eq(getattr(bus_channel, name))
+            with m.If(target):
+                for name in _channel_members(self._bus_signature, channel, In):
+                    if name in sub_members:
+                        m.d.comb += getattr(bus_channel, name).eq(getattr(sub_channel, name))
+
+        ar = self.bus.read_address
+        r = self.bus.read
+        aw = self.bus.write_address
+        w = self.bus.write_data
+        b = self.bus.write_response
+
+        # Reads
+        ar_target = decode(ar.addr)
+        rd_outstanding = Signal(range(self._max_outstanding + 1))
+        rd_current = Signal.like(ar_target)
+        ar_allowed = (((rd_outstanding == 0) | (ar_target == rd_current)) &
+                      (rd_outstanding != self._max_outstanding))
+
+        for i, sub_bus in enumerate(subs):
+            forward("read_address", sub_bus, ar_target == i)
+            forward("read", sub_bus, rd_current == i)
+            m.d.comb += [
+                sub_bus.read_address.valid.eq(ar.valid & ar_allowed & (ar_target == i)),
+                sub_bus.read.ready.eq(r.ready & (rd_current == i)),
+            ]
+            with m.If(ar_target == i):
+                m.d.comb += ar.ready.eq(ar_allowed & sub_bus.read_address.ready)
+            with m.If(rd_current == i):
+                m.d.comb += r.valid.eq(sub_bus.read.valid)
+
+        rd_err_busy = Signal()
+        rd_err_id = Signal.like(ar.id)
+        rd_err_len = Signal.like(ar.len)
+        with m.If(ar_target == error):
+            m.d.comb += ar.ready.eq(ar_allowed & ~rd_err_busy)
+        with m.If(ar.valid & ar.ready & (ar_target == error)):
+            m.d.sync += [
+                rd_err_busy.eq(1),
+                rd_err_id.eq(ar.id),
+                rd_err_len.eq(ar.len),
+            ]
+        with m.If(rd_current == error):
+            m.d.comb += [
+                r.valid.eq(rd_err_busy),
+                r.id.eq(rd_err_id),
+                r.resp.eq(AXI_RESP_DECERR),
+                r.last.eq(rd_err_len == 0),
+            ]
+            with m.If(r.valid & r.ready):
+                m.d.sync += rd_err_len.eq(rd_err_len - 1)
+                with m.If(r.last):
+                    m.d.sync += rd_err_busy.eq(0)
+
+        ar_done = ar.valid & ar.ready
+        r_done = r.valid & r.ready & r.last
+        m.d.sync += rd_outstanding.eq(rd_outstanding + ar_done - r_done)
+        with m.If(ar_done):
+            m.d.sync += rd_current.eq(ar_target)
+
+        # Writes, the data of a burst is only passed on once its address went through, which is
+        # what tells where it goes
+        aw_target = decode(aw.addr)
+        wr_outstanding = Signal(range(self._max_outstanding + 1))
+        wr_current = Signal.like(aw_target)
+        w_pending = Signal(range(self._max_outstanding + 1))
+        aw_allowed = (((wr_outstanding == 0) | (aw_target == wr_current)) &
+                      (wr_outstanding != self._max_outstanding))
+
+        for i, sub_bus in enumerate(subs):
+            forward("write_address", sub_bus, aw_target == i)
+            forward("write_data", sub_bus, wr_current == i)
+            forward("write_response", sub_bus, wr_current == i)
+            m.d.comb += [
+                sub_bus.write_address.valid.eq(aw.valid & aw_allowed & (aw_target == i)),
+                sub_bus.write_data.valid.eq(w.valid & (w_pending != 0) & (wr_current == i)),
+                sub_bus.write_response.ready.eq(b.ready & (wr_current == i)),
+            ]
+            with m.If(aw_target == i):
+                m.d.comb += aw.ready.eq(aw_allowed & sub_bus.write_address.ready)
+            with m.If(wr_current == i):
+                m.d.comb += [
+                    w.ready.eq((w_pending != 0) & sub_bus.write_data.ready),
+                    b.valid.eq(sub_bus.write_response.valid),
+                ]
+
+        wr_err_busy = Signal()
+        wr_err_data = Signal()
+        wr_err_id = Signal.like(aw.id)
+        with m.If(aw_target == error):
+            m.d.comb += aw.ready.eq(aw_allowed & ~wr_err_busy)
+        with m.If(aw.valid & aw.ready & (aw_target == error)):
+            m.d.sync += [
+                wr_err_busy.eq(1),
+                wr_err_data.eq(1),
+                wr_err_id.eq(aw.id),
+            ]
+        with m.If(wr_current == error):
+            m.d.comb += [
+                w.ready.eq((w_pending != 0) & wr_err_data),
+                b.valid.eq(wr_err_busy & ~wr_err_data),
+                b.id.eq(wr_err_id),
+                b.resp.eq(AXI_RESP_DECERR),
+            ]
+            with m.If(w.valid & w.ready & w.last):
+                m.d.sync += wr_err_data.eq(0)
+            with m.If(b.valid & b.ready):
+                m.d.sync += wr_err_busy.eq(0)
+
+        aw_done = aw.valid & aw.ready
+        w_done = w.valid & w.ready & w.last
+        b_done = b.valid & b.ready
+        m.d.sync += [
+            wr_outstanding.eq(wr_outstanding + aw_done - b_done),
+            w_pending.eq(w_pending + aw_done - w_done),
+        ]
+        with m.If(aw_done):
+            m.d.sync += wr_current.eq(aw_target)
+
+        return m
+
+
+class AxiArbiter(wiring.Component):
+    # Shares `bus` between the managers added to it, with round robin or fixed priority (lowest
+    # first) scheduling of the read and write addresses. A manager's transactions go out with its
+    # port number as ID, so its responses come back in order and are routed by ID; its own IDs are
+    # kept in FIFOs and put back on R/B. Write data follows the order the write addresses were
+    # granted in. Members that aren't part of a transfer and flow against their channel are shared:
+    # the subordinate's go to every manager, and only the first manager's reach the subordinate.
+    def __init__(self, signature, *, scheduling: str = "round_robin", depth: int = 8):
+        if scheduling not in ("round_robin", "priority"):
+            raise ValueError(f"Scheduling must be one of round_robin or priority, not {scheduling!r}")
+        super().__init__({
+            "bus": Out(signature),
+        })
+        self._bus_signature = signature
+        self._scheduling = scheduling
+        self._depth = depth
+        self._managers = []
+
+    def add(self, manager_bus):
+        self._managers.append(manager_bus)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        managers = self._managers
+        if not managers:
+            raise ValueError("Arbiter has no managers")
+        if len(managers) > 2 ** len(self.bus.read_address.id):
+            raise ValueError(f"{len(managers)} managers don't fit in {len(self.bus.read_address.id)} ID bits")
+        port_width = max(1, (len(managers) - 1).bit_length())
+
+        def arbitrate(channel, rooms):
+            # Returns the granted port, which is kept while the subordinate stalls it
+            bus_channel = getattr(self.bus, channel)
+            requests = Cat(getattr(manager, channel).valid & room for manager, room in zip(managers, rooms))
+            last = Signal(port_width)
+            held = Signal()
+            held_port = Signal(port_width)
+            port = Signal(port_width)
+
+            with m.If(held):
+                m.d.comb += port.eq(held_port)
+            if self._scheduling == "priority":
+                with m.Else():
+                    for i in reversed(range(len(managers))):
+                        with m.If(requests[i]):
+                            m.d.comb += port.eq(i)
+            else:
+                with m.Else():
+                    with m.Switch(last):
+                        for j in range(len(managers)):
+                            with m.Case(j):
+                                order = [(j + 1 + k) % len(managers) for k in range(len(managers))]
+                                for i in reversed(order):
+                                    with m.If(requests[i]):
+                                        m.d.comb += port.eq(i)
+
+            for i, manager in enumerate(managers):
+                manager_channel = getattr(manager, channel)
+                with m.If(port == i):
+                    for name in _channel_members(self._bus_signature, channel, Out):
+                        if name != "id":
+                            m.d.comb += getattr(bus_channel, name).eq(getattr(manager_channel, name))
+                    m.d.comb += [
+                        bus_channel.valid.eq(requests[i]),
+                        manager_channel.ready.eq(bus_channel.ready & rooms[i]),
+                    ]
+                for name in _channel_members(self._bus_signature, channel, In):
+                    m.d.comb += getattr(manager_channel, name).eq(getattr(bus_channel, name))
+            m.d.comb += bus_channel.id.eq(port)
+
+            m.d.sync += [
+                held.eq(bus_channel.valid & ~bus_channel.ready),
+                held_port.eq(port),
+            ]
+            with m.If(bus_channel.valid & bus_channel.ready):
+                m.d.sync += last.eq(port)
+            return port
+
+        def respond(channel, id_fifos):
+            bus_channel = getattr(self.bus, channel)
+            port = bus_channel.id[:port_width]
+            for i, (manager, id_fifo) in enumerate(zip(managers, id_fifos)):
+                manager_channel = getattr(manager, channel)
+                selected = (port == i) & id_fifo.r_rdy
+                for name in _channel_members(self._bus_signature, channel, In):
+                    if name != "id":
+                        m.d.comb += getattr(manager_channel, name).eq(getattr(bus_channel, name))
+                m.d.comb += [
+                    manager_channel.id.eq(id_fifo.r_data),
+                    manager_channel.valid.eq(bus_channel.valid & selected),
+                ]
+                with m.If(selected):
+                    m.d.comb += bus_channel.ready.eq(manager_channel.ready)
+            for name in _channel_members(self._bus_signature, channel, Out):
+                m.d.comb += getattr(bus_channel, name).eq(getattr(getattr(managers[0], channel), name))
+
+        # Reads
+        rd_ids = []
+        for i, manager in enumerate(managers):
+            rd_ids.append(SyncFIFO(width=len(manager.read_address.id), depth=self._depth))
+            m.submodules[f"rd_ids_{i}"] = rd_ids[i]
+        ar_port = arbitrate("read_address", [rd_id.w_rdy for rd_id in rd_ids])
+        for i, (manager, rd_id) in enumerate(zip(managers, rd_ids)):
+            ar = manager.read_address
+            r = manager.read
+            m.d.comb += [
+                rd_id.w_data.eq(ar.id),
+                rd_id.w_en.eq(ar.valid & ar.ready),
+                rd_id.r_en.eq(r.valid & r.ready & r.last),
+            ]
+        respond("read", rd_ids)
+
+        # Writes
+        m.submodules.w_order = w_order = SyncFIFO(width=port_width, depth=self._depth)
+        wr_ids = []
+        for i, manager in enumerate(managers):
+            wr_ids.append(SyncFIFO(width=len(manager.write_address.id), depth=self._depth))
+            m.submodules[f"wr_ids_{i}"] = wr_ids[i]
+        aw_port = arbitrate("write_address", [wr_id.w_rdy & w_order.w_rdy for wr_id in wr_ids])
+        m.d.comb += [
+            w_order.w_data.eq(aw_port),
+            w_order.w_en.eq(self.bus.write_address.valid & self.bus.write_address.ready),
+        ]
+        for i, (manager, wr_id) in enumerate(zip(managers, wr_ids)):
+            aw = manager.write_address
+            b = manager.write_response
+            m.d.comb += [
+                wr_id.w_data.eq(aw.id),
+                wr_id.w_en.eq(aw.valid & aw.ready),
+                wr_id.r_en.eq(b.valid & b.ready),
+            ]
+        respond("write_response", wr_ids)
+
+        bus_w = self.bus.write_data
+        for i, manager in enumerate(managers):
+            w = manager.write_data
+            selected = (w_order.r_data == i) & w_order.r_rdy
+            with m.If(selected):
+                for name in _channel_members(self._bus_signature, "write_data", Out):
+                    if name != "id":
+                        m.d.comb += getattr(bus_w, name).eq(getattr(w, name))
+                m.d.comb += bus_w.valid.eq(w.valid)
+            m.d.comb += w.ready.eq(bus_w.ready & selected)
+            for name in _channel_members(self._bus_signature, "write_data", In):
+                m.d.comb += getattr(w, name).eq(getattr(bus_w, name))
+        m.d.comb += [
+            bus_w.id.eq(w_order.r_data),
+            w_order.r_en.eq(bus_w.valid & bus_w.ready & bus_w.last),
+        ]
+
+        m.d.comb += self.bus.aclk.eq(ClockSignal())
+
+        return m
+
+
+class AxiCrossbar(Elaboratable):
+    # Connects every manager to every subordinate: an AxiDecoder per manager routes by address and
+    # an AxiArbiter per subordinate schedules the managers and gives each one its own ID, so they
+    # don't collide whatever IDs they use. Reads and writes go through independently, each manager
+    # has at most `max_outstanding` transactions in flight per direction. Transactions to another
+    # subordinate wait for the outstanding ones of their direction, as with AxiDecoder.
+    def __init__(self, signature, *, scheduling: str = "round_robin", max_outstanding: int = 7):
+        if scheduling not in ("round_robin", "priority"):
+            raise ValueError(f"Scheduling must be one of round_robin or priority, not {scheduling!r}")
+        self._bus_signature = signature
+        self._scheduling = scheduling
+        self._max_outstanding = max_outstanding
+        self._managers = []
+        self._subs = []
+
+    def add_manager(self, manager_bus):
+        self._managers.append(manager_bus)
+
+    def add_subordinate(self, sub_bus, *, addr: int = None, size: int = None):
+        # Without an address, the subordinate gets whatever no other one is mapped for
+        self._subs.append((sub_bus, addr, size))
+
+    def elaborate(self, platform):
+        m = Module()
+
+        arbiters = []
+        for j, (sub_bus, _, _) in enumerate(self._subs):
+            arbiter = AxiArbiter(self._bus_signature, scheduling=self._scheduling, depth=self._max_outstanding)
+            m.submodules[f"arbiter_{j}"] = arbiter
+            _forward(m, self._bus_signature, arbiter.bus, sub_bus)
+            m.d.comb += sub_bus.aclk.eq(arbiter.bus.aclk)
+            arbiters.append(arbiter)
+
+        for i, manager_bus in enumerate(self._managers):
+            decoder = AxiDecoder(self._bus_signature, max_outstanding=self._max_outstanding)
+            m.submodules[f"decoder_{i}"] = decoder
+            _forward(m, self._bus_signature, manager_bus, decoder.bus)
+            for j, ((_, addr, size), arbiter) in enumerate(zip(self._subs, arbiters)):
+                link = self._bus_signature.create(path=(f"link_{i}_{j}",))
+                decoder.add(link, addr=addr, size=size)
+                arbiter.add(link)
+
+        return m
+
+
+class AxiUpsizer(wiring.Component):
+    # Puts a narrow AXI manager on a wider bus. Transfers keep their size, each beat is moved to the
+    # byte lanes of its address. Everything goes out with ID 0, so the responses come back in order
+    # and the original IDs and beat addresses are kept in FIFOs. Bursts must be FIXED or INCR, or
+    # WRAP with full narrow width beats.
+    def __init__(self, narrow, wide, *, depth: int = 8):
+        if _data_width(wide) <= _data_width(narrow):
+            raise ValueError(f"Wide bus must be wider than the narrow one, not {_data_width(wide)} bits "
+                             f"for {_data_width(narrow)} bits")
+        super().__init__({
+            "narrow": In(narrow),
+            "wide": Out(wide),
+        })
+        self._narrow_signature = narrow
+        self._depth = depth
+
+    def elaborate(self, platform):
+        m = Module()
+
+        narrow_width = _data_width(self._narrow_signature)
+        ratio = len(self.wide.read.data) // narrow_width
+        lane_lsb = exact_log2(narrow_width // 8)
+        addr_bits = lane_lsb + exact_log2(ratio)
+        id_width = len(self.narrow.read_address.id)
+
+        def forward(channel):
+            narrow_channel = getattr(self.narrow, channel)
+            wide_channel = getattr(self.wide, channel)
+            wide_members = wide_channel.signature.members
+            for name in _channel_members(self._narrow_signature, channel, Out):
+                if name in wide_members and name not in ("id", "data", "strb"):
+                    m.d.comb += getattr(wide_channel, name).eq(getattr(narrow_channel, name))
+            for name in _channel_members(self._narrow_signature, channel, In):
+                if name in wide_members and name not in ("id", "data"):
+                    m.d.comb += getattr(narrow_channel, name).eq(getattr(wide_channel, name))
+
+        for channel in ("read_address", "read", "write_address", "write_data", "write_response"):
+            forward(channel)
+        m.d.comb += self.wide.aclk.eq(ClockSignal())
+
+        ar = self.narrow.read_address
+        r = self.narrow.read
+        aw = self.narrow.write_address
+        w = self.narrow.write_data
+        b = self.narrow.write_response
+
+        # Reads
+        m.submodules.rd_fifo = rd_fifo = SyncFIFO(width=id_width + addr_bits + 4, depth=self._depth)
+        m.d.comb += [
+            self.wide.read_address.valid.eq(ar.valid & rd_fifo.w_rdy),
+            ar.ready.eq(self.wide.read_address.ready & rd_fifo.w_rdy),
+            rd_fifo.w_data.eq(Cat(ar.id, ar.addr[:addr_bits], ar.size, ar.burst)),
+            rd_fifo.w_en.eq(ar.valid & ar.ready),
+        ]
+
+        rd_id = rd_fifo.r_data[:id_width]
+        rd_start = rd_fifo.r_data[id_width:id_width + addr_bits]
+        rd_size = rd_fifo.r_data[id_width + addr_bits:id_width + addr_bits + 2]
+        rd_burst = rd_fifo.r_data[id_width + addr_bits + 2:]
+        rd_busy = Signal()
+        rd_next = Signal(addr_bits)
+        rd_addr = Mux(rd_busy, rd_next, rd_start)
+        m.d.comb += [
+            r.valid.eq(self.wide.read.valid & rd_fifo.r_rdy),
+            self.wide.read.ready.eq(r.ready & rd_fifo.r_rdy),
+            r.id.eq(rd_id),
+            r.data.eq(self.wide.read.data.word_select(rd_addr[lane_lsb:], narrow_width)),
+        ]
+        with m.If(r.valid & r.ready):
+            m.d.sync += [
+                rd_busy.eq(~r.last),
+                rd_next.eq(_next_beat_addr(rd_addr, rd_size, rd_burst)),
+            ]
+            m.d.comb += rd_fifo.r_en.eq(r.last)
+
+        # Writes, a beat is held until the address it belongs to went through
+        m.submodules.wr_fifo = wr_fifo = SyncFIFO(width=addr_bits + 4, depth=self._depth)
+        m.submodules.b_fifo = b_fifo = SyncFIFO(width=id_width, depth=self._depth)
+        aw_room = wr_fifo.w_rdy & b_fifo.w_rdy
+        m.d.comb += [
+            self.wide.write_address.valid.eq(aw.valid & aw_room),
+            aw.ready.eq(self.wide.write_address.ready & aw_room),
+            wr_fifo.w_data.eq(Cat(aw.addr[:addr_bits], aw.size, aw.burst)),
+            wr_fifo.w_en.eq(aw.valid & aw.ready),
+            b_fifo.w_data.eq(aw.id),
+            b_fifo.w_en.eq(aw.valid & aw.ready),
+        ]
+
+        wr_start = wr_fifo.r_data[:addr_bits]
+        wr_size = wr_fifo.r_data[addr_bits:addr_bits + 2]
+        wr_burst = wr_fifo.r_data[addr_bits + 2:]
+        wr_busy = Signal()
+        wr_next = Signal(addr_bits)
+        wr_addr = Mux(wr_busy, wr_next, wr_start)
+        wr_lane = wr_addr[lane_lsb:]
+        m.d.comb += [
+            self.wide.write_data.valid.eq(w.valid & wr_fifo.r_rdy),
+            w.ready.eq(self.wide.write_data.ready & wr_fifo.r_rdy),
+            self.wide.write_data.data.eq(Cat(w.data for _ in range(ratio))),
+            self.wide.write_data.strb.eq(Cat(Mux(wr_lane == i, w.strb, 0) for i in range(ratio))),
+        ]
+        with m.If(w.valid & w.ready):
+            m.d.sync += [
+                wr_busy.eq(~w.last),
+                wr_next.eq(_next_beat_addr(wr_addr, wr_size, wr_burst)),
+            ]
+            m.d.comb += wr_fifo.r_en.eq(w.last)
+
+        m.d.comb += [
+            b.valid.eq(self.wide.write_response.valid & b_fifo.r_rdy),
+            self.wide.write_response.ready.eq(b.ready & b_fifo.r_rdy),
+            b.id.eq(b_fifo.r_data),
+            b_fifo.r_en.eq(b.valid & b.ready),
+        ]
+
+        return m
+
+
+class AxiAsyncBridge(wiring.Component):
+    # Moves an AXI interface from `upstream_domain`, where its manager is, to `downstream_domain`
+    # through an asynchronous FIFO per channel. Members that aren't part of a transfer and flow
+    # against their channel (the HP port FIFO levels and issue capability) are passed straight
+    # across, they're either static or only informational.
+    def __init__(self, signature, *, upstream_domain: str = "sync", downstream_domain: str = "sync",
+                 depth: int = 4):
+        super().__init__({
+            "upstream": In(signature),
+            "downstream": Out(signature),
+        })
+        self._bus_signature = signature
+        self._upstream_domain = upstream_domain
+        self._downstream_domain = downstream_domain
+        self._depth = depth
+
+    def elaborate(self, platform):
+        m = Module()
+
+        for channel, flow in (
+            ("read_address", Out),
+            ("write_address", Out),
+            ("write_data", Out),
+            ("read", In),
+            ("write_response", In),
+        ):
+            upstream = getattr(self.upstream, channel)
+            downstream = getattr(self.downstream, channel)
+            if flow == Out:
+                src, dst = upstream, downstream
+                w_domain, r_domain = self._upstream_domain, self._downstream_domain
+            else:
+                src, dst = downstream, upstream
+                w_domain, r_domain = self._downstream_domain, self._upstream_domain
+
+            payload = _channel_members(self._bus_signature, channel, flow)
+            fifo = AsyncFIFO(
+                width=sum(len(getattr(src, name)) for name in payload),
+                depth=self._depth,
+                w_domain=w_domain,
+                r_domain=r_domain,
+            )
+            m.submodules[f"{channel}_fifo"] = fifo
+            m.d.comb += [
+                fifo.w_data.eq(Cat(getattr(src, name) for name in payload)),
+                fifo.w_en.eq(src.valid),
+                src.ready.eq(fifo.w_rdy),
+                Cat(getattr(dst, name) for name in payload).eq(fifo.r_data),
+                dst.valid.eq(fifo.r_rdy),
+                fifo.r_en.eq(dst.ready),
+            ]
+
+            for name in _channel_members(self._bus_signature, channel, Out if flow == In else In):
+                m.d.comb += getattr(src, name).eq(getattr(dst, name))
+
+        m.d.comb += self.downstream.aclk.eq(ClockSignal(self._downstream_domain))
+
+        return m
+
+
+class AxiDrain(wiring.Component):
+    # Passes `upstream` through to `downstream` until `stop`, then holds back the read and write
+    # addresses, once the one being offered on each has been taken so valid is never dropped, and
+    # raises `idle` when every transaction taken has been answered. Write data and responses keep
+    # flowing meanwhile, so the transactions in flight finish. Everything is held back after reset.
+    def __init__(self, signature):
+        super().__init__({
+            "upstream": In(signature),
+            "downstream": Out(signature),
+            "stop": In(1),
+            "idle": Out(1),
+        })
+        self._bus_signature = signature
+
+    def elaborate(self, platform):
+        m = Module()
+
+        _forward(m, self._bus_signature, self.upstream, self.downstream,
+                 channels=("read", "write_data", "write_response"))
+        m.d.comb += self.downstream.aclk.eq(ClockSignal())
+
+        blocked = []
+        for channel in ("read_address", "write_address"):
+            upstream = getattr(self.upstream, channel)
+            downstream = getattr(self.downstream, channel)
+            block = Signal(name=f"{channel}_blocked", init=1)
+            for name in _channel_members(self._bus_signature, channel, Out):
+                m.d.comb += getattr(downstream, name).eq(getattr(upstream, name))
+            for name in _channel_members(self._bus_signature, channel, In):
+                m.d.comb += getattr(upstream, name).eq(getattr(downstream, name))
+            m.d.comb += [
+                downstream.valid.eq(upstream.valid & ~block),
+                upstream.ready.eq(downstream.ready & ~block),
+            ]
+            with m.If(~self.stop):
+                m.d.sync += block.eq(0)
+            with m.Elif(~upstream.valid | downstream.ready):
+                m.d.sync += block.eq(1)
+            blocked.append(block)
+
+        ar = self.downstream.read_address
+        r = self.downstream.read
+        aw = self.downstream.write_address
+        b = self.downstream.write_response
+        reads = Signal(16)
+        writes = Signal(16)
+        m.d.sync += [
+            reads.eq(reads + (ar.valid & ar.ready) - (r.valid & r.ready & r.last)),
+            writes.eq(writes + (aw.valid & aw.ready) - (b.valid & b.ready)),
+        ]
+        m.d.comb += self.idle.eq(Cat(blocked).all() & (reads == 0) & (writes == 0))
+
+        return m
+
+
+class AxiReadCache(wiring.Component):
+    # Keeps the data of reads in `lines` direct mapped lines of `line_size` bytes of BRAM. A read
+    # that misses fetches its whole line in a single full width INCR burst, so the single beats and
+    # short bursts of the manager turn into line bursts downstream, and reads of the line after
+    # that are served from BRAM. Reads are cached while enabled if they're INCR or WRAP bursts of
+    # full width beats within a line, and with `fetch_only` if they're also instruction fetches
+    # (AxPROT[2]). Everything else goes through as is.
+    # Nothing is ever dirty: writes go through and drop the lines they touch on the way, what
+    # other managers write to memory is only seen after an `invalidate`. Lines are also dropped on
+    # reset and while disabled. While enabled reads are handled one at a time, and enabling or
+    # disabling waits for the bus to be quiet.
+    def __init__(self, signature, *, line_size: int = 32, lines: int = 64, max_outstanding: int = 15):
+        data_bytes = _data_width(signature) // 8
+        if line_size & (line_size - 1) or not 2 * data_bytes <= line_size <= 16 * data_bytes:
+            raise ValueError(f"Line size must be a power of two from 2 to 16 beats of {data_bytes} bytes, "
+                             f"not {line_size!r}")
+        if lines < 1 or lines & (lines - 1):
+            raise ValueError(f"Number of lines must be a power of two, not {lines!r}")
+        super().__init__({
+            "upstream": In(signature),
+            "downstream": Out(signature),
+            "control": In(wiring.Signature({
+                "enable": Out(1),
+                "fetch_only": Out(1),
+                "invalidate": Out(1),
+            })),
+        })
+        self._bus_signature = signature
+        self._line_size = line_size
+        self._lines = lines
+        self._max_outstanding = max_outstanding
+
+    def elaborate(self, platform):
+        m = Module()
+
+        data_width = _data_width(self._bus_signature)
+        lane_bits = exact_log2(data_width // 8)
+        line_bits = exact_log2(self._line_size)
+        index_bits = exact_log2(self._lines)
+        words = self._line_size * 8 // data_width
+
+        def index(addr):
+            return addr[line_bits:line_bits + index_bits]
+
+        def tag(addr):
+            return addr[line_bits + index_bits:]
+
+        ar = self.upstream.read_address
+        r = self.upstream.read
+        aw = self.upstream.write_address
+        down_ar = self.downstream.read_address
+        down_r = self.downstream.read
+
+        _forward(m, self._bus_signature, self.upstream, self.downstream,
+                 channels=("write_data", "write_response"))
+        m.d.comb += self.downstream.aclk.eq(ClockSignal())
+
+        valid = Signal(self._lines)
+        m.submodules.tags = tags = Memory(shape=32 - line_bits - index_bits, depth=self._lines, init=[])
+        m.submodules.data = data = Memory(shape=data_width, depth=self._lines * words, init=[])
+        tag_rd = tags.read_port()
+        tag_wr = tags.write_port()
+        data_rd = data.read_port()
+        data_wr = data.write_port()
+
+        # Writes start dropping lines before reads may fill any, and stop after reads stopped. Reads
+        # switch with nothing in flight, new ones are held back meanwhile, writes switch between
+        # write addresses.
+        active = Signal()
+        wr_active = Signal()
+        with m.If(~aw.valid | aw.ready):
+            with m.If(self.control.enable | ~active):
+                m.d.sync += wr_active.eq(self.control.enable)
+
+        rd_idle = Signal()
+        rd_outstanding = Signal(range(self._max_outstanding + 1))
+        rd_enable = self.control.enable & wr_active
+        rd_switching = rd_enable != active
+        with m.If(rd_idle & rd_switching & (rd_outstanding == 0) & ~down_ar.valid):
+            m.d.sync += active.eq(rd_enable)
+
+        # A line refilled while it gets dropped isn't kept, its data may predate the drop
+        refilling = Signal()
+        refill_index = Signal(index_bits)
+        refill_stale = Signal()
+        refill_drop = Signal()
+        with m.If(refill_drop):
+            m.d.sync += refill_stale.eq(1)
+
+        # Writes, the lines a burst touches are dropped one per cycle before it goes on
+        aw_start, aw_end = _burst_span(aw.addr, aw.len, aw.size, aw.burst)
+        wr_walking = Signal()
+        wr_walked = Signal()
+        wr_line = Signal(32 - line_bits)
+        wr_pass = wr_walked | ~wr_active
+        _forward(m, self._bus_signature, self.upstream, self.downstream, channels=("write_address",))
+        m.d.comb += [
+            self.downstream.write_address.valid.eq(aw.valid & wr_pass),
+            aw.ready.eq(self.downstream.write_address.ready & wr_pass),
+        ]
+        with m.If(aw.valid & aw.ready):
+            m.d.sync += wr_walked.eq(0)
+        with m.Elif(wr_walking):
+            m.d.sync += valid.bit_select(wr_line[:index_bits], 1).eq(0)
+            with m.If(refilling & (wr_line[:index_bits] == refill_index)):
+                m.d.comb += refill_drop.eq(1)
+            with m.If(wr_line == aw_end[line_bits:]):
+                m.d.sync += [
+                    wr_walking.eq(0),
+                    wr_walked.eq(1),
+                ]
+            with m.Else():
+                m.d.sync += wr_line.eq(wr_line + 1)
+        with m.Elif(aw.valid & wr_active & ~wr_walked):
+            m.d.sync += [
+                wr_line.eq(aw_start[line_bits:]),
+                wr_walking.eq(1),
+            ]
+
+        with m.If(self.control.invalidate | ~active):
+            m.d.sync += valid.eq(0)
+            with m.If(refilling):
+                m.d.comb += refill_drop.eq(1)
+
+        # Reads, straight through while the cache is off. An address already offered downstream
+        # stays there until it's taken.
+        ar_held = Signal()
+        m.d.sync += ar_held.eq(down_ar.valid & ~down_ar.ready)
+        with m.If(~active):
+            _forward(m, self._bus_signature, self.upstream, self.downstream, channels=("read_address", "read"))
+            ar_allowed = (rd_outstanding != self._max_outstanding) & (~rd_switching | ar_held)
+            m.d.comb += [
+                down_ar.valid.eq(ar.valid & ar_allowed),
+                ar.ready.eq(down_ar.ready & ar_allowed),
+            ]
+            m.d.sync += rd_outstanding.eq(rd_outstanding + (ar.valid & ar.ready) - (r.valid & r.ready & r.last))
+
+        ar_members = _channel_members(self._bus_signature, "read_address", Out)
+        ar_start, ar_end = _burst_span(ar.addr, ar.len, ar.size, ar.burst)
+        cacheable = Signal()
+        m.d.comb += cacheable.eq(
+            ((ar.burst == AXI_BURST_INCR) | (ar.burst == AXI_BURST_WRAP)) &
+            (ar.size == lane_bits) &
+            (ar_start[line_bits:] == ar_end[line_bits:]) &
+            (~self.control.fetch_only | ar.prot[2])
+        )
+
+        rd_request = Signal(sum(len(getattr(ar, name)) for name in ar_members))
+        rd_fields = {}
+        offset = 0
+        for name in ar_members:
+            rd_fields[name] = rd_request[offset:offset + len(getattr(ar, name))]
+            offset += len(getattr(ar, name))
+        rd_addr = Signal(32)
+        rd_wrap_mask = Signal(32)
+        rd_count = Signal(4)
+        rd_resp = Signal(2)
+        fill_count = Signal(range(words))
+
+        rd_next = Signal(32)
+        m.d.comb += rd_next.eq(Mux(
+            rd_fields["burst"] == AXI_BURST_WRAP,
+            (rd_addr & ~rd_wrap_mask) | ((rd_addr + (data_width // 8)) & rd_wrap_mask),
+            rd_addr + (data_width // 8),
+        ))
+        rd_hit = valid.bit_select(index(rd_addr), 1) & (tag_rd.data == tag(rd_addr))
+        m.d.comb += [
+            tag_rd.addr.eq(Mux(rd_idle, index(ar.addr), index(rd_addr))),
+            data_rd.addr.eq(Cat(rd_addr[lane_bits:line_bits], index(rd_addr))),
+            tag_wr.addr.eq(index(rd_addr)),
+            tag_wr.data.eq(tag(rd_addr)),
+            data_wr.addr.eq(Cat(fill_count, index(rd_addr))),
+            data_wr.data.eq(down_r.data),
+        ]
+
+        with m.FSM():
+            with m.State("Idle"):
+                m.d.comb += rd_idle.eq(1)
+                with m.If(active & ~rd_switching):
+                    m.d.comb += ar.ready.eq(1)
+                    with m.If(ar.valid):
+                        m.d.sync += [
+                            rd_request.eq(Cat(getattr(ar, name) for name in ar_members)),
+                            rd_addr.eq(ar.addr),
+                            rd_wrap_mask.eq(((ar.len + 1) << ar.size) - 1),
+                            rd_count.eq(ar.len),
+                            rd_resp.eq(AXI_RESP_OKAY),
+                        ]
+                        with m.If(cacheable):
+                            m.next = "Lookup"
+                        with m.Else():
+                            m.next = "Pass-Address"
+
+            with m.State("Lookup"):
+                with m.If(rd_hit):
+                    m.next = "Serve"
+                with m.Else():
+                    m.next = "Refill-Address"
+
+            with m.State("Refill-Address"):
+                for name in ar_members:
+                    m.d.comb += getattr(down_ar, name).eq(rd_fields[name])
+                m.d.comb += [
+                    down_ar.valid.eq(1),
+                    down_ar.addr.eq(Cat(Const(0, line_bits), rd_addr[line_bits:])),
+                    down_ar.len.eq(words - 1),
+                    down_ar.burst.eq(AXI_BURST_INCR),
+                ]
+                with m.If(down_ar.ready):
+                    m.d.sync += [
+                        fill_count.eq(0),
+                        refilling.eq(1),
+                        refill_index.eq(index(rd_addr)),
+                        refill_stale.eq(0),
+                    ]
+                    m.next = "Refill-Data"
+
+            with m.State("Refill-Data"):
+                m.d.comb += down_r.ready.eq(1)
+                with m.If(down_r.valid):
+                    m.d.comb += data_wr.en.eq(1)
+                    m.d.sync += fill_count.eq(fill_count + 1)
+                    with m.If(down_r.resp != AXI_RESP_OKAY):
+                        m.d.sync += rd_resp.eq(down_r.resp)
+                    with m.If(down_r.last):
+                        m.d.sync += refilling.eq(0)
+                        # A line that came back with an error is handed out once and not kept
+                        with m.If(~refill_stale & ~refill_drop & (rd_resp == AXI_RESP_OKAY) &
+                                  (down_r.resp == AXI_RESP_OKAY)):
+                            m.d.comb += tag_wr.en.eq(1)
+                            m.d.sync += valid.bit_select(index(rd_addr), 1).eq(1)
+                        m.next = "Refill-Done"
+
+            with m.State("Refill-Done"):
+                # The last beat of the line is readable from here on
+                m.next = "Serve"
+
+            with m.State("Serve"):
+                m.d.comb += [
+                    r.valid.eq(1),
+                    r.id.eq(rd_fields["id"]),
+                    r.data.eq(data_rd.data),
+                    r.resp.eq(rd_resp),
+                    r.last.eq(rd_count == 0),
+                ]
+                with m.If(r.ready):
+                    m.d.comb += data_rd.addr.eq(Cat(rd_next[lane_bits:line_bits], index(rd_next)))
+                    m.d.sync += [
+                        rd_addr.eq(rd_next),
+                        rd_count.eq(rd_count - 1),
+                    ]
+                    with m.If(rd_count == 0):
+                        m.next = "Idle"
+
+            with m.State("Pass-Address"):
+                for name in ar_members:
+                    m.d.comb += getattr(down_ar, name).eq(rd_fields[name])
+                m.d.comb += down_ar.valid.eq(1)
+                with m.If(down_ar.ready):
+                    m.next = "Pass-Data"
+
+            with m.State("Pass-Data"):
+                for name in _channel_members(self._bus_signature, "read", In):
+                    m.d.comb += getattr(r, name).eq(getattr(down_r, name))
+                m.d.comb += [
+                    r.valid.eq(down_r.valid),
+                    down_r.ready.eq(r.ready),
+                ]
+                with m.If(r.valid & r.ready & r.last):
+                    m.next = "Idle"
+
+        return m
@@ -1,11 +1,26 @@
 from amaranth import *
 from amaranth.lib import wiring
-from amaranth.lib.wiring import Component, Signature, Out
+from amaranth.lib.fifo import SyncFIFO
+from amaranth.lib.wiring import Component, Signature, In, Out
 from amaranth_soc import wishbone
 from .zynq_ifaces import MAxiGP
 
 
-__all__ = ["Axi2Wishbone"]
+__all__ = ["Axi2Wishbone", "PipelinedAxi2Wishbone", "AxiPostedWrite"]
+
+
+AXI_BURST_FIXED = 0b00
+AXI_BURST_INCR = 0b01
+
+
+def _burst_unsupported(addr, size, burst):
+    # Beats must be naturally aligned and fit in the 32-bit bus, WRAP bursts aren't supported
+    unaligned = Mux(size == 0b01, addr[0], Mux(size == 0b10, addr[:2].any(), size == 0b11))
+    return unaligned | ((burst != AXI_BURST_FIXED) & (burst != AXI_BURST_INCR))
+
+
+def _next_beat_addr(addr, size, burst):
+    return Mux(burst == AXI_BURST_FIXED, addr, addr + (Const(1, 4) << size))
 
 
 class AxiReadToWishbone(Component):
@@ -17,28 +32,36 @@ class AxiReadToWishbone(Component):
         m = Module()
 
         rid = Signal(12)
+        addr = Signal(32)
+        size = Signal(2)
+        burst = Signal(2)
+        burst_len = Signal(4)
+
+        m.d.comb += self.wishbone.adr.eq(addr[2:])
+        with m.Switch(size):
+            with m.Case(0b00):
+                m.d.comb += self.wishbone.sel.eq(1 << addr[:2])
+            with m.Case(0b01):
+                m.d.comb += self.wishbone.sel.eq(0b11 << addr[:2])
+            with m.Case(0b10):
+                m.d.comb += self.wishbone.sel.eq(0b1111)
+
         with m.FSM():
             with m.State("AXI_WAIT"):
                 m.d.comb += self.ar.ready.eq(1)
                 with m.If(self.ar.valid):
                     m.d.sync += [
                         rid.eq(self.ar.id),
-                        self.wishbone.adr.eq(self.ar.addr[2:]),
+                        addr.eq(self.ar.addr),
+                        size.eq(self.ar.size),
+                        burst.eq(self.ar.burst),
+                        burst_len.eq(self.ar.len),
                     ]
-                    sel = Signal(4)
-                    unaligned = Signal()
-                    with m.Switch(self.ar.size):
-                        with m.Case(0b00):
-                            m.d.comb += sel.eq(1 << self.ar.addr[:2])
-                        with m.Case(0b01):
-                            m.d.comb += sel.eq(0b11 << self.ar.addr[:2]), unaligned.eq(self.ar.addr[0])
-                        with m.Case(0b10):
-                            m.d.comb += sel.eq(0b1111), unaligned.eq(self.ar.addr[:2].any())
-                    m.d.sync += self.wishbone.sel.eq(sel)
-
-                    with m.If((self.ar.len != 0) | unaligned):
+
+                    # Unsupported bursts still return every beat, all of them with SLVERR
+                    with m.If(_burst_unsupported(self.ar.addr, self.ar.size, self.ar.burst)):
                         m.d.sync += self.r.resp.eq(0b10)
-                        m.next = "AXI_RESPONSE"
+                        m.next = "DUMP_FAILURE"
                     with m.Else():
                         m.next = "WISHBONE"
             with m.State("WISHBONE"):
@@ -55,10 +78,23 @@ class AxiReadToWishbone(Component):
             with m.State("AXI_RESPONSE"):
                 m.d.comb += self.r.valid.eq(1)
                 with m.If(self.r.ready):
-                    m.next = "AXI_WAIT"
+                    with m.If(burst_len == 0):
+                        m.next = "AXI_WAIT"
+                    with m.Else():
+                        m.d.sync += [
+                            burst_len.eq(burst_len - 1),
+                            addr.eq(_next_beat_addr(addr, size, burst)),
+                        ]
+                        m.next = "WISHBONE"
+            with m.State("DUMP_FAILURE"):
+                m.d.comb += self.r.valid.eq(1)
+                with m.If(self.r.ready):
+                    m.d.sync += burst_len.eq(burst_len - 1)
+                    with m.If(burst_len == 0):
+                        m.next = "AXI_WAIT"
 
         m.d.comb += [
-            self.r.last.eq(1),
+            self.r.last.eq(burst_len == 0),
             self.r.id.eq(rid),
         ]
 
@@ -77,25 +113,27 @@ class AxiWriteToWishbone(Component):
         m.d.comb += self.wishbone.we.eq(1)
 
         wid = Signal(12)
+        addr = Signal(32)
+        size = Signal(2)
+        burst = Signal(2)
         burst_len = Signal(4)
+
+        m.d.comb += self.wishbone.adr.eq(addr[2:])
+
         with m.FSM():
             with m.State("AXI_WAIT_ADDR"):
                 m.d.comb += self.aw.ready.eq(1)
                 with m.If(self.aw.valid):
                     m.d.sync += [
                         wid.eq(self.aw.id),
+                        addr.eq(self.aw.addr),
+                        size.eq(self.aw.size),
+                        burst.eq(self.aw.burst),
                         burst_len.eq(self.aw.len),
-                        self.wishbone.adr.eq(self.aw.addr[2:]),
+                        self.b.resp.eq(0b00),
                     ]
 
-                    unaligned = Signal()
-                    with m.Switch(self.aw.size):
-                        with m.Case(0b01):
-                            m.d.comb += unaligned.eq(self.aw.addr[0])
-                        with m.Case(0b10):
-                            m.d.comb += unaligned.eq(self.aw.addr[:2].any())
-
-                    with m.If((self.aw.len != 0) | unaligned):
+                    with m.If(_burst_unsupported(self.aw.addr, self.aw.size, self.aw.burst)):
                         m.d.sync += self.b.resp.eq(0b10)
                         m.next = "DUMP_FAILURE"
                     with m.Else():
@@ -113,17 +151,35 @@ class AxiWriteToWishbone(Component):
                         self.wishbone.dat_w.eq(self.w.data),
                         self.wishbone.sel.eq(self.w.strb),
                     ]
-                    m.next = "WISHBONE"
+                    # CSRs ignore sel, so beats without any strobe must not reach the bus at all
+                    with m.If(self.w.strb.any()):
+                        m.next = "WISHBONE"
+                    with m.Elif(burst_len == 0):
+                        m.next = "AXI_RESPONSE"
+                    with m.Else():
+                        m.d.sync += [
+                            burst_len.eq(burst_len - 1),
+                            addr.eq(_next_beat_addr(addr, size, burst)),
+                        ]
             with m.State("WISHBONE"):
                 m.d.comb += [
                     self.wishbone.cyc.eq(1),
                     self.wishbone.stb.eq(1),
                 ]
                 with m.If(self.wishbone.err | self.wishbone.ack):
-                    m.d.sync += [
-                        self.b.resp.eq(Mux(self.wishbone.err, 0b10, 0b00)),
-                    ]
-                    m.next = "AXI_RESPONSE"
+                    with m.If(burst_len == 0):
+                        m.next = "AXI_RESPONSE"
+                    with m.Else():
+                        m.d.sync += [
+                            burst_len.eq(burst_len - 1),
+                            addr.eq(_next_beat_addr(addr, size, burst)),
+                        ]
+                        m.next = "AXI_WAIT_DATA"
+                    # The rest of the burst is dropped after an error, B reports it for the whole burst
+                    with m.If(self.wishbone.err):
+                        m.d.sync += self.b.resp.eq(0b10)
+                        with m.If(burst_len != 0):
+                            m.next = "DUMP_FAILURE"
             with m.State("AXI_RESPONSE"):
                 m.d.comb += self.b.valid.eq(1)
                 with m.If(self.b.ready):
@@ -136,9 +192,111 @@ class AxiWriteToWishbone(Component):
         return m
 
 
+class AxiPostedWrite(Component):
+    # Answers writes as soon as their address and all their beats are buffered, and passes them on
+    # to the `posted_*` channels. Their responses are dropped, `error` pulses for each one that
+    # isn't OKAY. `idle` is set once every write taken so far has been answered downstream.
+    def __init__(self, *, depth: int = 4):
+        self._depth = depth
+        super().__init__({
+            "aw": Out(MAxiGP.members["write_address"].signature),
+            "w": Out(MAxiGP.members["write_data"].signature),
+            "b": Out(MAxiGP.members["write_response"].signature),
+            "posted_aw": In(MAxiGP.members["write_address"].signature),
+            "posted_w": In(MAxiGP.members["write_data"].signature),
+            "posted_b": In(MAxiGP.members["write_response"].signature),
+            "idle": Out(1),
+            "error": Out(1),
+        })
+
+    def elaborate(self, platform):
+        m = Module()
+
+        # Writes taken from the host that haven't been answered downstream yet
+        in_flight = Signal(range(2 * self._depth + 1))
+
+        m.submodules.aw_fifo = aw_fifo = SyncFIFO(width=12 + 32 + 2 + 2 + 4, depth=self._depth)
+        m.submodules.b_fifo = b_fifo = SyncFIFO(width=12, depth=self._depth)
+        aw_room = aw_fifo.w_rdy & b_fifo.w_rdy & (in_flight != 2 * self._depth)
+        m.d.comb += [
+            aw_fifo.w_data.eq(Cat(self.aw.id, self.aw.addr, self.aw.size, self.aw.burst, self.aw.len)),
+            aw_fifo.w_en.eq(self.aw.valid & aw_room),
+            b_fifo.w_data.eq(self.aw.id),
+            b_fifo.w_en.eq(self.aw.valid & aw_room),
+            self.aw.ready.eq(aw_room),
+            Cat(self.posted_aw.id, self.posted_aw.addr, self.posted_aw.size, self.posted_aw.burst,
+                self.posted_aw.len).eq(aw_fifo.r_data),
+            self.posted_aw.valid.eq(aw_fifo.r_rdy),
+            aw_fifo.r_en.eq(self.posted_aw.ready),
+        ]
+
+        # Bursts whose last beat is in but that haven't been answered yet, W may come before AW
+        w_bursts = Signal(range(self._depth + 1))
+        m.submodules.w_fifo = w_fifo = SyncFIFO(width=32 + 4 + 1, depth=16)
+        w_room = w_fifo.w_rdy & (w_bursts != self._depth)
+        m.d.comb += [
+            w_fifo.w_data.eq(Cat(self.w.data, self.w.strb, self.w.last)),
+            w_fifo.w_en.eq(self.w.valid & w_room),
+            self.w.ready.eq(w_room),
+            Cat(self.posted_w.data, self.posted_w.strb, self.posted_w.last).eq(w_fifo.r_data),
+            self.posted_w.valid.eq(w_fifo.r_rdy),
+            w_fifo.r_en.eq(self.posted_w.ready),
+        ]
+
+        m.d.comb += [
+            self.b.valid.eq(b_fifo.r_rdy & (w_bursts != 0)),
+            self.b.id.eq(b_fifo.r_data),
+            self.b.resp.eq(0b00),
+            b_fifo.r_en.eq(self.b.valid & self.b.ready),
+        ]
+        m.d.sync += w_bursts.eq(w_bursts + (self.w.valid & self.w.ready & self.w.last) -
+                                (self.b.valid & self.b.ready))
+
+        m.d.comb += [
+            self.posted_b.ready.eq(1),
+            self.error.eq(self.posted_b.valid & (self.posted_b.resp != 0b00)),
+        ]
+        m.d.sync += in_flight.eq(in_flight + (self.aw.valid & self.aw.ready) - self.posted_b.valid)
+        m.d.comb += self.idle.eq(in_flight == 0)
+
+        return m
+
+
+def _post_writes(m, axi, read2wb, write2wb, *, depth, write_error):
+    # Reads wait for the posted writes to be done, so they can't overtake a write already answered
+    m.submodules.posted = posted = AxiPostedWrite(depth=depth)
+    wiring.connect(m, posted.aw, wiring.flipped(axi.write_address))
+    wiring.connect(m, posted.w, wiring.flipped(axi.write_data))
+    wiring.connect(m, posted.b, wiring.flipped(axi.write_response))
+    wiring.connect(m, posted.posted_aw, write2wb.aw)
+    wiring.connect(m, posted.posted_w, write2wb.w)
+    wiring.connect(m, posted.posted_b, write2wb.b)
+    m.d.comb += write_error.eq(posted.error)
+
+    ar = axi.read_address
+    for name, member in ar.signature.members.items():
+        if name not in ("valid", "ready"):
+            m.d.comb += getattr(read2wb.ar, name).eq(getattr(ar, name))
+    m.d.comb += [
+        read2wb.ar.valid.eq(ar.valid & posted.idle),
+        ar.ready.eq(read2wb.ar.ready & posted.idle),
+    ]
+    wiring.connect(m, read2wb.r, wiring.flipped(axi.read))
+
+
 class Axi2Wishbone(Component):
-    axi: Out(MAxiGP)
-    wishbone: Out(wishbone.Signature(addr_width=30, data_width=32, granularity=8, features={"err"}))
+    # With `posted` writes are answered once buffered, `write_error` pulses for each of them that
+    # failed on the bus
+    def __init__(self, *, posted: bool = False, depth: int = 4):
+        self._posted = posted
+        self._depth = depth
+        members = {
+            "axi": Out(MAxiGP),
+            "wishbone": Out(wishbone.Signature(addr_width=30, data_width=32, granularity=8, features={"err"})),
+        }
+        if posted:
+            members["write_error"] = Out(1)
+        super().__init__(members)
 
     def elaborate(self, platform):
         m = Module()
@@ -157,13 +315,410 @@ class Axi2Wishbone(Component):
         arbiter.add(read2wb.wishbone)
         arbiter.add(write2wb.wishbone)
 
-        wiring.connect(m, read2wb.ar, wiring.flipped(self.axi.read_address))
-        wiring.connect(m, read2wb.r, wiring.flipped(self.axi.read))
+        if self._posted:
+            _post_writes(m, self.axi, read2wb, write2wb, depth=self._depth, write_error=self.write_error)
+        else:
+            wiring.connect(m, read2wb.ar, wiring.flipped(self.axi.read_address))
+            wiring.connect(m, read2wb.r, wiring.flipped(self.axi.read))
 
-        wiring.connect(m, write2wb.aw, wiring.flipped(self.axi.write_address))
-        wiring.connect(m, write2wb.w, wiring.flipped(self.axi.write_data))
-        wiring.connect(m, write2wb.b, wiring.flipped(self.axi.write_response))
+            wiring.connect(m, write2wb.aw, wiring.flipped(self.axi.write_address))
+            wiring.connect(m, write2wb.w, wiring.flipped(self.axi.write_data))
+            wiring.connect(m, write2wb.b, wiring.flipped(self.axi.write_response))
 
         wiring.connect(m, arbiter.bus, wiring.flipped(self.wishbone))
 
         return m
+
+
+def _wishbone_features(features) -> frozenset:
+    features = frozenset(features)
+    if not {"err"} <= features <= {"err", "stall"}:
+        raise ValueError(f"Wishbone features must be {{'err'}} or {{'err', 'stall'}}, not {set(features)!r}")
+    return features
+
+
+class PipelinedAxiReadToWishbone(Component):
+    def __init__(self, *, depth: int = 4, features=frozenset({"err"})):
+        self._depth = depth
+        self._features = _wishbone_features(features)
+        super().__init__({
+            "ar": Out(MAxiGP.members["read_address"].signature),
+            "r": Out(MAxiGP.members["read"].signature),
+            "wishbone": Out(wishbone.Signature(addr_width=30, data_width=32, granularity=8,
+                                               features=self._features)),
+        })
+
+    def elaborate(self, platform):
+        m = Module()
+
+        # Skid buffer for AR, lets the next bursts be accepted while the current one is on the bus
+        m.submodules.ar_fifo = ar_fifo = SyncFIFO(width=12 + 32 + 2 + 2 + 4, depth=self._depth)
+        m.d.comb += [
+            ar_fifo.w_data.eq(Cat(self.ar.id, self.ar.addr, self.ar.size, self.ar.burst, self.ar.len)),
+            ar_fifo.w_en.eq(self.ar.valid),
+            self.ar.ready.eq(ar_fifo.w_rdy),
+        ]
+
+        # Enough room for a whole burst, so slow R consumers don't hold the bus mid-burst
+        m.submodules.r_fifo = r_fifo = SyncFIFO(width=32 + 2 + 12 + 1, depth=16)
+        m.d.comb += [
+            Cat(self.r.data, self.r.resp, self.r.id, self.r.last).eq(r_fifo.r_data),
+            self.r.valid.eq(r_fifo.r_rdy),
+            r_fifo.r_en.eq(self.r.ready),
+        ]
+
+        active = Signal()
+        error = Signal()
+        rid = Signal(12)
+        addr = Signal(32)
+        size = Signal(2)
+        burst = Signal(2)
+        burst_len = Signal(4)
+
+        m.d.comb += self.wishbone.adr.eq(addr[2:])
+        with m.Switch(size):
+            with m.Case(0b00):
+                m.d.comb += self.wishbone.sel.eq(1 << addr[:2])
+            with m.Case(0b01):
+                m.d.comb += self.wishbone.sel.eq(0b11 << addr[:2])
+            with m.Case(0b10):
+                m.d.comb += self.wishbone.sel.eq(0b1111)
+
+        # Asserted when the current beat is done with, the address moves on to the next one
+        beat_done = Signal()
+        beat_resp = Signal(2)
+        if "stall" not in self._features:
+            with m.If(active & r_fifo.w_rdy):
+                with m.If(error):
+                    m.d.comb += [
+                        beat_done.eq(1),
+                        beat_resp.eq(0b10),
+                    ]
+                with m.Else():
+                    m.d.comb += [
+                        self.wishbone.cyc.eq(1),
+                        self.wishbone.stb.eq(1),
+                        beat_done.eq(self.wishbone.ack | self.wishbone.err),
+                        beat_resp.eq(Mux(self.wishbone.err, 0b10, 0b00)),
+                    ]
+
+            m.d.comb += [
+                r_fifo.w_data.eq(Cat(self.wishbone.dat_r, beat_resp, rid, burst_len == 0)),
+                r_fifo.w_en.eq(beat_done),
+            ]
+        else:
+            # Requests are issued without waiting for the acks, the ID and RLAST of every beat in
+            # flight are kept in order to build the R beats once the acks come back
+            m.submodules.pending = pending = SyncFIFO(width=12 + 1, depth=self._depth)
+
+            # Every beat in flight must have a place to go in r_fifo once its ack arrives
+            credit = (r_fifo.level + pending.level) < r_fifo.depth
+            responded = self.wishbone.ack | self.wishbone.err
+            with m.If(active & ~error & credit & pending.w_rdy):
+                m.d.comb += [
+                    self.wishbone.stb.eq(1),
+                    beat_done.eq(~self.wishbone.stall),
+                ]
+            # Error beats must not overtake the beats still in flight
+            with m.Elif(active & error & ~pending.r_rdy & r_fifo.w_rdy):
+                m.d.comb += beat_done.eq(1)
+
+            # An ack in the same cycle as the request (a classic slave behind the decoder) bypasses
+            # the pending FIFO
+            bypass = ~pending.r_rdy & responded
+            m.d.comb += [
+                self.wishbone.cyc.eq(self.wishbone.stb | pending.r_rdy),
+                pending.w_data.eq(Cat(rid, burst_len == 0)),
+                pending.w_en.eq(beat_done & ~error & ~bypass),
+                pending.r_en.eq(responded),
+            ]
+
+            with m.If(responded):
+                m.d.comb += [
+                    r_fifo.w_data.eq(Cat(self.wishbone.dat_r, Mux(self.wishbone.err, 0b10, 0b00),
+                                         Mux(bypass, Cat(rid, burst_len == 0), pending.r_data))),
+                    r_fifo.w_en.eq(1),
+                ]
+            with m.Elif(beat_done & error):
+                m.d.comb += [
+                    r_fifo.w_data.eq(Cat(Const(0, 32), Const(0b10, 2), rid, burst_len == 0)),
+                    r_fifo.w_en.eq(1),
+                ]
+
+        with m.If(beat_done):
+            m.d.sync += [
+                burst_len.eq(burst_len - 1),
+                addr.eq(_next_beat_addr(addr, size, burst)),
+            ]
+            with m.If(burst_len == 0):
+                m.d.sync += active.eq(0)
+
+        # The next burst is loaded in the same cycle the last beat is done with, so there's no
+        # bubble between back-to-back transactions
+        next_id = Signal(12)
+        next_addr = Signal(32)
+        next_size = Signal(2)
+        next_burst = Signal(2)
+        next_len = Signal(4)
+        m.d.comb += Cat(next_id, next_addr, next_size, next_burst, next_len).eq(ar_fifo.r_data)
+        with m.If(~active | (beat_done & (burst_len == 0))):
+            m.d.comb += ar_fifo.r_en.eq(1)
+            with m.If(ar_fifo.r_rdy):
+                m.d.sync += [
+                    active.eq(1),
+                    error.eq(_burst_unsupported(next_addr, next_size, next_burst)),
+                    rid.eq(next_id),
+                    addr.eq(next_addr),
+                    size.eq(next_size),
+                    burst.eq(next_burst),
+                    burst_len.eq(next_len),
+                ]
+
+        return m
+
+
+class PipelinedAxiWriteToWishbone(Component):
+    def __init__(self, *, depth: int = 4, features=frozenset({"err"})):
+        self._depth = depth
+        self._features = _wishbone_features(features)
+        super().__init__({
+            "aw": Out(MAxiGP.members["write_address"].signature),
+            "w": Out(MAxiGP.members["write_data"].signature),
+            "b": Out(MAxiGP.members["write_response"].signature),
+            "wishbone": Out(wishbone.Signature(addr_width=30, data_width=32, granularity=8,
+                                               features=self._features)),
+        })
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.d.comb += self.wishbone.we.eq(1)
+
+        m.submodules.aw_fifo = aw_fifo = SyncFIFO(width=12 + 32 + 2 + 2 + 4, depth=self._depth)
+        m.d.comb += [
+            aw_fifo.w_data.eq(Cat(self.aw.id, self.aw.addr, self.aw.size, self.aw.burst, self.aw.len)),
+            aw_fifo.w_en.eq(self.aw.valid),
+            self.aw.ready.eq(aw_fifo.w_rdy),
+        ]
+
+        m.submodules.w_fifo = w_fifo = SyncFIFO(width=32 + 4, depth=16)
+        m.d.comb += [
+            w_fifo.w_data.eq(Cat(self.w.data, self.w.strb)),
+            w_fifo.w_en.eq(self.w.valid),
+            self.w.ready.eq(w_fifo.w_rdy),
+        ]
+
+        m.submodules.b_fifo = b_fifo = SyncFIFO(width=12 + 2, depth=self._depth)
+        m.d.comb += [
+            Cat(self.b.id, self.b.resp).eq(b_fifo.r_data),
+            self.b.valid.eq(b_fifo.r_rdy),
+            b_fifo.r_en.eq(self.b.ready),
+        ]
+
+        active = Signal()
+        error = Signal()
+        wid = Signal(12)
+        addr = Signal(32)
+        size = Signal(2)
+        burst = Signal(2)
+        burst_len = Signal(4)
+        resp = Signal(2)
+
+        strb = Signal(4)
+        m.d.comb += [
+            Cat(self.wishbone.dat_w, strb).eq(w_fifo.r_data),
+            self.wishbone.sel.eq(strb),
+            self.wishbone.adr.eq(addr[2:]),
+        ]
+
+        beat_done = Signal()
+        if "stall" not in self._features:
+            beat_err = Signal()
+            with m.If(active & w_fifo.r_rdy & (b_fifo.w_rdy | (burst_len != 0))):
+                # CSRs ignore sel, so beats without any strobe must not reach the bus at all
+                with m.If(error | ~strb.any()):
+                    m.d.comb += beat_done.eq(1)
+                with m.Else():
+                    m.d.comb += [
+                        self.wishbone.cyc.eq(1),
+                        self.wishbone.stb.eq(1),
+                        beat_done.eq(self.wishbone.ack | self.wishbone.err),
+                        beat_err.eq(self.wishbone.err),
+                    ]
+
+            m.d.comb += [
+                b_fifo.w_data.eq(Cat(wid, Mux(beat_err, 0b10, resp))),
+                b_fifo.w_en.eq(beat_done & (burst_len == 0)),
+            ]
+            # The rest of the burst is dropped after an error, B reports it for the whole burst
+            with m.If(beat_err):
+                m.d.sync += [
+                    error.eq(1),
+                    resp.eq(0b10),
+                ]
+        else:
+            # Beats already issued when an error comes back can't be dropped anymore, so errors are
+            # only accumulated into the B response of their burst
+            m.submodules.pending = pending = SyncFIFO(width=12 + 1, depth=self._depth)
+
+            credit = (b_fifo.level + pending.level) < b_fifo.depth
+            responded = self.wishbone.ack | self.wishbone.err
+            with m.If(active & w_fifo.r_rdy & credit):
+                with m.If(~error & strb.any()):
+                    with m.If(pending.w_rdy):
+                        m.d.comb += [
+                            self.wishbone.stb.eq(1),
+                            beat_done.eq(~self.wishbone.stall),
+                        ]
+                # B for a burst ending in a dropped beat must wait for the beats still in flight
+                with m.Elif((burst_len != 0) | ~pending.r_rdy):
+                    m.d.comb += beat_done.eq(1)
+
+            bypass = ~pending.r_rdy & responded
+            head_id = Signal(12)
+            head_last = Signal()
+            m.d.comb += [
+                self.wishbone.cyc.eq(self.wishbone.stb | pending.r_rdy),
+                pending.w_data.eq(Cat(wid, burst_len == 0)),
+                pending.w_en.eq(self.wishbone.stb & beat_done & ~bypass),
+                pending.r_en.eq(responded),
+                Cat(head_id, head_last).eq(Mux(bypass, Cat(wid, burst_len == 0), pending.r_data)),
+            ]
+
+            with m.If(responded):
+                with m.If(head_last):
+                    m.d.comb += [
+                        b_fifo.w_data.eq(Cat(head_id, Mux(self.wishbone.err, 0b10, resp))),
+                        b_fifo.w_en.eq(1),
+                    ]
+                    m.d.sync += resp.eq(0b00)
+                with m.Elif(self.wishbone.err):
+                    m.d.sync += resp.eq(0b10)
+            with m.Elif(beat_done & ~self.wishbone.stb & (burst_len == 0)):
+                m.d.comb += [
+                    b_fifo.w_data.eq(Cat(wid, Mux(error, 0b10, resp))),
+                    b_fifo.w_en.eq(1),
+                ]
+                m.d.sync += resp.eq(0b00)
+
+        m.d.comb += w_fifo.r_en.eq(beat_done)
+        with m.If(beat_done):
+            m.d.sync += [
+                burst_len.eq(burst_len - 1),
+                addr.eq(_next_beat_addr(addr, size, burst)),
+            ]
+            with m.If(burst_len == 0):
+                m.d.sync += active.eq(0)
+
+        next_id = Signal(12)
+        next_addr = Signal(32)
+        next_size = Signal(2)
+        next_burst = Signal(2)
+        next_len = Signal(4)
+        m.d.comb += Cat(next_id, next_addr, next_size, next_burst, next_len).eq(aw_fifo.r_data)
+        with m.If(~active | (beat_done & (burst_len == 0))):
+            m.d.comb += aw_fifo.r_en.eq(1)
+            with m.If(aw_fifo.r_rdy):
+                unsupported = _burst_unsupported(next_addr, next_size, next_burst)
+                m.d.sync += [
+                    active.eq(1),
+                    error.eq(unsupported),
+                    wid.eq(next_id),
+                    addr.eq(next_addr),
+                    size.eq(next_size),
+                    burst.eq(next_burst),
+                    burst_len.eq(next_len),
+                ]
+                if "stall" not in self._features:
+                    m.d.sync += resp.eq(Mux(unsupported, 0b10, 0b00))
+
+        return m
+
+
+class PipelinedAxi2Wishbone(Component):
+    def __init__(self, *, depth: int = 4, features=frozenset({"err"}), posted: bool = False):
+        self._depth = depth
+        self._features = _wishbone_features(features)
+        self._posted = posted
+        members = {
+            "axi": Out(MAxiGP),
+            "wishbone": Out(wishbone.Signature(addr_width=30, data_width=32, granularity=8,
+                                               features=self._features)),
+        }
+        if posted:
+            members["write_error"] = Out(1)
+        super().__init__(members)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.d.comb += self.axi.aclk.eq(ClockSignal())
+
+        m.submodules.read2wb = read2wb = PipelinedAxiReadToWishbone(depth=self._depth, features=self._features)
+        m.submodules.write2wb = write2wb = PipelinedAxiWriteToWishbone(depth=self._depth, features=self._features)
+
+        if self._posted:
+            _post_writes(m, self.axi, read2wb, write2wb, depth=self._depth, write_error=self.write_error)
+        else:
+            wiring.connect(m, read2wb.ar, wiring.flipped(self.axi.read_address))
+            wiring.connect(m, read2wb.r, wiring.flipped(self.axi.read))
+
+            wiring.connect(m, write2wb.aw, wiring.flipped(self.axi.write_address))
+            wiring.connect(m, write2wb.w, wiring.flipped(self.axi.write_data))
+            wiring.connect(m, write2wb.b, wiring.flipped(self.axi.write_response))
+
+        # Unlike wishbone.Arbiter, the bus can change hands after every request, so reads and writes
+        # interleave instead of one direction holding the bus for a whole stream of bursts
+        initiators = [read2wb.wishbone, write2wb.wishbone]
+        grant = Signal(range(len(initiators)))
+        with m.Switch(grant):
+            for i, bus in enumerate(initiators):
+                with m.Case(i):
+                    m.d.comb += [
+                        self.wishbone.adr.eq(bus.adr),
+                        self.wishbone.dat_w.eq(bus.dat_w),
+                        self.wishbone.sel.eq(bus.sel),
+                        self.wishbone.we.eq(bus.we),
+                        self.wishbone.stb.eq(bus.stb),
+                    ]
+        for bus in initiators:
+            m.d.comb += bus.dat_r.eq(self.wishbone.dat_r)
+
+        if "stall" not in self._features:
+            accepted = self.wishbone.ack | self.wishbone.err
+            with m.Switch(grant):
+                for i, bus in enumerate(initiators):
+                    with m.Case(i):
+                        m.d.comb += [
+                            self.wishbone.cyc.eq(bus.cyc),
+                            bus.ack.eq(self.wishbone.ack),
+                            bus.err.eq(self.wishbone.err),
+                        ]
+        else:
+            accepted = self.wishbone.stb & ~self.wishbone.stall
+            m.d.comb += self.wishbone.cyc.eq(Cat(bus.cyc for bus in initiators).any())
+            for i, bus in enumerate(initiators):
+                m.d.comb += bus.stall.eq((grant != i) | self.wishbone.stall)
+
+            # Acks come back in request order, remember who issued each request to route them
+            m.submodules.tags = tags = SyncFIFO(width=len(grant), depth=2 * self._depth)
+            responded = self.wishbone.ack | self.wishbone.err
+            bypass = ~tags.r_rdy & responded
+            owner = Mux(bypass, grant, tags.r_data)
+            m.d.comb += [
+                tags.w_data.eq(grant),
+                tags.w_en.eq(accepted & ~bypass),
+                tags.r_en.eq(responded),
+            ]
+            for i, bus in enumerate(initiators):
+                m.d.comb += [
+                    bus.ack.eq(self.wishbone.ack & (owner == i)),
+                    bus.err.eq(self.wishbone.err & (owner == i)),
+                ]
+
+        with m.If(~self.wishbone.stb | accepted):
+            for i, bus in reversed(list(enumerate(initiators))):
+                with m.If(bus.stb & (grant != i)):
+                    m.d.sync += grant.eq(i)
+
+        return m
@@ -0,0 +1,68 @@
+from amaranth import *
+from amaranth.lib.cdc import ResetSynchronizer
+
+
+__all__ = ["ClockGenerator"]
+
+
+# MMCME2 limits for the slowest Zynq-7000 speed grade
+_VCO_RANGE = (600e6, 1200e6)
+_PFD_RANGE = (10e6, 450e6)
+
+
+class ClockGenerator(Elaboratable):
+    # Drives the `domain` clock at (about) `freq` from the `in_domain` clock running at `in_freq`
+    # with an MMCM. The domain is held in reset until the MMCM is locked, and follows the reset of
+    # `in_domain`. Only integer multipliers and dividers are used, `actual_freq` is what it gets.
+    def __init__(self, domain: str, *, freq: float, in_freq: float, in_domain: str = "sync"):
+        best = None
+        for divclk in range(1, 107):
+            pfd = in_freq / divclk
+            if not _PFD_RANGE[0] <= pfd <= _PFD_RANGE[1]:
+                continue
+            for mult in range(2, 65):
+                vco = pfd * mult
+                if not _VCO_RANGE[0] <= vco <= _VCO_RANGE[1]:
+                    continue
+                div = min(max(round(vco / freq), 1), 128)
+                # Closest frequency first, then the fastest VCO for the least jitter
+                key = (abs(vco / div - freq), -vco)
+                if best is None or key < best[0]:
+                    best = key, divclk, mult, div
+        if best is None:
+            raise ValueError(f"No MMCM configuration for {freq / 1e6:.3f} MHz from {in_freq / 1e6:.3f} MHz")
+        _, self._divclk, self._mult, self._div = best
+
+        self._domain = domain
+        self._in_domain = in_domain
+        self._in_freq = in_freq
+        self.actual_freq = in_freq / self._divclk * self._mult / self._div
+
+    def elaborate(self, platform):
+        m = Module()
+
+        feedback = Signal()
+        clkout = Signal()
+        locked = Signal()
+        m.submodules.mmcm = Instance(
+            "MMCME2_BASE",
+            p_CLKIN1_PERIOD=1e9 / self._in_freq,
+            p_DIVCLK_DIVIDE=self._divclk,
+            p_CLKFBOUT_MULT_F=float(self._mult),
+            p_CLKOUT0_DIVIDE_F=float(self._div),
+            i_CLKIN1=ClockSignal(self._in_domain),
+            i_RST=ResetSignal(self._in_domain),
+            i_PWRDWN=0,
+            i_CLKFBIN=feedback,
+            o_CLKFBOUT=feedback,
+            o_CLKOUT0=clkout,
+            o_LOCKED=locked,
+        )
+        m.submodules.clkbuf = Instance(
+            "BUFG",
+            i_I=clkout,
+            o_O=ClockSignal(self._domain),
+        )
+        m.submodules.reset_sync = ResetSynchronizer(~locked, domain=self._domain)
+
+        return m
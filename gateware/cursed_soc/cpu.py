@@ -1,25 +1,58 @@
 from amaranth import *
 from amaranth.lib import wiring
-from amaranth.lib.cdc import FFSynchronizer
-from amaranth.lib.fifo import SyncFIFOBuffered
+from amaranth.lib.cdc import FFSynchronizer, PulseSynchronizer, ResetSynchronizer
+from amaranth.lib.fifo import AsyncFIFO, SyncFIFOBuffered
 from amaranth.lib.wiring import In, Out
-from amaranth_soc import csr
-from .zynq_ifaces import SAxiGP
+from amaranth_soc import csr, wishbone
+from typing import Optional
+from .axi import AxiAsyncBridge, AxiDecoder, AxiDrain, AxiReadCache, AxiUpsizer
+from .axi_to_wishbone import Axi2Wishbone
+from .csr_bridge import CSRBridge
+from .irq import IrqController
+from .jtag import JtagShifter
+from .mailbox import MailboxWindow
+from .monitor import AxiLatencyMonitor, FetchProfiler, connect_tap
+from .perf import PerfCounters
+from .ring import MailboxRing
+from .sram import SharedMemory
+from .timestamp import TimestampSynchronizer, TimestampTimer
+from .trace import AxiTrace
+from .zynq_ifaces import SAxiACP, SAxiGP, SAxiHP
+
+
+class _SetClearToggle(csr.FieldAction):
+    # RW whose bits can also be set, cleared and toggled from the fabric, a CSR write takes priority
+    def __init__(self, shape, *, init=0):
+        super().__init__(shape, access="rw", members=(
+            ("data", Out(shape)),
+            ("set", In(shape)),
+            ("clear", In(shape)),
+            ("toggle", In(shape)),
+        ))
+        self._storage = Signal(shape, init=init)
+        self._init = init
+
+    @property
+    def init(self):
+        return self._init
 
+    def elaborate(self, platform):
+        m = Module()
 
-class Cpu(wiring.Component):
-    sys_bus: Out(SAxiGP)
-    ext_jtag: In(wiring.Signature({
-        "tck": Out(1),
-        "tms": Out(1),
-        "tdi": Out(1),
-        "tdo": In(1),
-    }))
-    ext_uart: Out(wiring.Signature({
-        "tx": Out(1),
-        "rx": In(1),
-    }))
+        with m.If(self.port.w_stb):
+            m.d.sync += self._storage.eq(self.port.w_data)
+        with m.Else():
+            m.d.sync += self._storage.eq(((self._storage | self.set) & ~self.clear) ^ self.toggle)
+
+        m.d.comb += [
+            self.port.r_data.eq(self._storage),
+            self.data.eq(self._storage),
+        ]
 
+        return m
+
+
+class Cpu(wiring.Component):
     class Clocking(csr.Register, access="rw"):
         reset: csr.Field(csr.action.RW, 1, init=1)
         clock_enable: csr.Field(csr.action.RW, 1)
@@ -41,10 +74,22 @@ class Cpu(wiring.Component):
         tdo: csr.Field(csr.action.R, 1)
 
     class GPIO(csr.Register, access="rw"):
-        read: csr.Field(csr.action.RW, 32)
+        read: csr.Field(_SetClearToggle, 32)
         write: csr.Field(csr.action.R, 32)
         write_enable: csr.Field(csr.action.R, 32)
 
+    class GpioUpdate(csr.Register, access="w"):
+        # The bits written as 1 are set, cleared or toggled in gpio.read, the others are left alone
+        bits: csr.Field(csr.action.W, 32)
+
+    class GpioEdges(csr.Register, access="rw"):
+        # Bits of gpio.write that went up (or down) since they were last written with 1
+        bits: csr.Field(csr.action.RW1C, 32)
+
+    class GpioChanges(csr.Register, access="r"):
+        # Number of times gpio.write changed, wrapping around
+        count: csr.Field(csr.action.R, 32)
+
     class MailboxReadStatus(csr.Register, access="r"):
         read_valid: csr.Field(csr.action.R, 1)
         _pad0: csr.Field(csr.action.ResR0WA, 15)
@@ -61,9 +106,116 @@ class Cpu(wiring.Component):
     class MailboxWrite(csr.Register, access="w"):
         write_data: csr.Field(csr.action.W, 32)
 
-    def __init__(self):
-        super().__init__()
-        regs = csr.Builder(addr_width=6, data_width=8)
+    class MailboxRingControl(csr.Register, access="rw"):
+        enable: csr.Field(csr.action.RW, 1)
+        error: csr.Field(csr.action.R, 1)
+        _pad2: csr.Field(csr.action.ResR0WA, 6)
+        # Both rings are 1 << size_log2 words, at least 16
+        size_log2: csr.Field(csr.action.RW, 5, init=4)
+
+    class MailboxRingBase(csr.Register, access="rw"):
+        address: csr.Field(csr.action.RW, 32)
+
+    class MailboxRingHostPointer(csr.Register, access="rw"):
+        pointer: csr.Field(csr.action.RW, 32)
+
+    class MailboxRingFabricPointer(csr.Register, access="r"):
+        pointer: csr.Field(csr.action.R, 32)
+
+    class MailboxIrqEnable(csr.Register, access="rw"):
+        read_not_empty: csr.Field(csr.action.RW, 1)
+        read_watermark: csr.Field(csr.action.RW, 1)
+        write_watermark: csr.Field(csr.action.RW, 1)
+
+    class MailboxIrqPending(csr.Register, access="rw"):
+        read_not_empty: csr.Field(csr.action.RW1C, 1)
+        read_watermark: csr.Field(csr.action.RW1C, 1)
+        write_watermark: csr.Field(csr.action.RW1C, 1)
+
+    class MailboxIrqThreshold(csr.Register, access="rw"):
+        # read_watermark is raised above read_level words, write_watermark below write_level words
+        read_level: csr.Field(csr.action.RW, 16)
+        write_level: csr.Field(csr.action.RW, 16)
+
+    class JtagControl(csr.Register, access="rw"):
+        # Writing a non-zero count shifts that many bits of jtag_tms/jtag_tdi out, up to 32, while
+        # src_mux selects the host CSRs
+        count: csr.Field(csr.action.W, 6)
+        busy: csr.Field(csr.action.R, 1)
+        _pad3: csr.Field(csr.action.ResR0WA, 9)
+        # TCK runs at fclk / (2 * (divider + 1)), a divider of 0 is taken as 1
+        divider: csr.Field(csr.action.RW, 16, init=4)
+
+    class JtagVector(csr.Register, access="rw"):
+        bits: csr.Field(csr.action.RW, 32)
+
+    class JtagCapture(csr.Register, access="r"):
+        tdo: csr.Field(csr.action.R, 32)
+
+    class SysAttributes(csr.Register, access="rw"):
+        # Memory attributes of the core's accesses to the system. The core's own ones break memory
+        # accesses through the GP port, so they're replaced, only its instruction flag (AxPROT[2]) is
+        # kept to give fetches their own QoS.
+        def __init__(self, *, cache: int):
+            super().__init__({
+                "read_cache": csr.Field(csr.action.RW, 4, init=cache),
+                "read_qos": csr.Field(csr.action.RW, 4),
+                "read_prot": csr.Field(csr.action.RW, 3),
+                "_pad4": csr.Field(csr.action.ResR0WA, 1),
+                "fetch_qos": csr.Field(csr.action.RW, 4),
+                "write_cache": csr.Field(csr.action.RW, 4, init=cache),
+                "write_qos": csr.Field(csr.action.RW, 4),
+                "write_prot": csr.Field(csr.action.RW, 3),
+            })
+
+    class ReadCache(csr.Register, access="rw"):
+        # See AxiReadCache. It's off by default and empty after each core reset. Lines never
+        # hold data that isn't in memory, so there's nothing to flush, only to invalidate after
+        # someone else wrote to memory the core reads.
+        enable: csr.Field(csr.action.RW, 1)
+        fetch_only: csr.Field(csr.action.RW, 1)
+        invalidate: csr.Field(csr.action.W, 1)
+
+    def __init__(self, *, sys_port: str = "gp", cpu_domain: Optional[str] = None, prefix: tuple = (),
+                 bscan_chain: Optional[int] = 4, shared_memory_size: int = 8192,
+                 cache_line_size: int = 32, cache_lines: int = 64):
+        if sys_port not in ("gp", "hp", "acp"):
+            raise ValueError(f"System port must be one of gp, hp or acp, not {sys_port!r}")
+        if shared_memory_size > 0x1_0000:
+            raise ValueError(f"Shared memory can't be larger than 64 KiB, not {shared_memory_size} bytes")
+        self._sys_port = sys_port
+        # The core runs from fclk by default, or from the `cpu_domain` clock through clock domain
+        # crossings to the rest of the SoC, which stays in sync
+        self._cpu_domain = cpu_domain
+        # Each BSCANE2 needs its own USER chain, without one the FPGA JTAG can't reach the core
+        self._bscan_chain = bscan_chain
+        self._cache_line_size = cache_line_size
+        self._cache_lines = cache_lines
+        super().__init__({
+            # The 32-bit core bus goes out as is on a GP port, or through an upsizer on a 64-bit HP or
+            # ACP one
+            "sys_bus": Out({"gp": SAxiGP, "hp": SAxiHP, "acp": SAxiACP}[sys_port]),
+            "ring_bus": Out(SAxiHP),
+            "trace_bus": Out(SAxiHP),
+            # The count of the SoC's Timestamp, in sync
+            "timestamp": In(64),
+            "ext_jtag": In(wiring.Signature({
+                "tck": Out(1),
+                "tms": Out(1),
+                "tdi": Out(1),
+                "tdo": In(1),
+            })),
+            "ext_uart": Out(wiring.Signature({
+                "tx": Out(1),
+                "rx": In(1),
+            })),
+            "mailbox_irq": Out(wiring.Signature({
+                "read_not_empty": Out(1),
+                "read_watermark": Out(1),
+                "write_watermark": Out(1),
+            })),
+        })
+        regs = csr.Builder(addr_width=6, data_width=32)
 
         self._clocking = regs.add("clocking", self.Clocking())
         self._reset_addr = regs.add("reset_addr", self.ResetAddress())
@@ -73,10 +225,69 @@ class Cpu(wiring.Component):
         self._mailbox_write_status = regs.add("mailbox_write_status", self.MailboxWriteStatus())
         self._mailbox_read = regs.add("mailbox_read", self.MailboxRead())
         self._mailbox_write = regs.add("mailbox_write", self.MailboxWrite())
+        self._mailbox_ring_control = regs.add("mailbox_ring_control", self.MailboxRingControl())
+        self._mailbox_ring_tx_base = regs.add("mailbox_ring_tx_base", self.MailboxRingBase())
+        self._mailbox_ring_rx_base = regs.add("mailbox_ring_rx_base", self.MailboxRingBase())
+        self._mailbox_ring_tx_head = regs.add("mailbox_ring_tx_head", self.MailboxRingHostPointer())
+        self._mailbox_ring_tx_tail = regs.add("mailbox_ring_tx_tail", self.MailboxRingFabricPointer())
+        self._mailbox_ring_rx_head = regs.add("mailbox_ring_rx_head", self.MailboxRingFabricPointer())
+        self._mailbox_ring_rx_tail = regs.add("mailbox_ring_rx_tail", self.MailboxRingHostPointer())
+        self._mailbox_irq_enable = regs.add("mailbox_irq_enable", self.MailboxIrqEnable())
+        self._mailbox_irq_pending = regs.add("mailbox_irq_pending", self.MailboxIrqPending())
+        self._mailbox_irq_threshold = regs.add("mailbox_irq_threshold", self.MailboxIrqThreshold())
+        self._jtag_control = regs.add("jtag_control", self.JtagControl())
+        self._jtag_tms = regs.add("jtag_tms", self.JtagVector())
+        self._jtag_tdi = regs.add("jtag_tdi", self.JtagVector())
+        self._jtag_tdo = regs.add("jtag_tdo", self.JtagCapture())
+        # Through the ACP, write-back allocate is what makes accesses coherent, elsewhere the
+        # attributes that are known to work are all zeroes
+        self._sys_attributes = regs.add("sys_attributes", self.SysAttributes(
+            cache=0b1111 if sys_port == "acp" else 0b0000,
+        ))
+        self._read_cache = regs.add("read_cache", self.ReadCache())
+        self._gpio_set = regs.add("gpio_set", self.GpioUpdate())
+        self._gpio_clear = regs.add("gpio_clear", self.GpioUpdate())
+        self._gpio_toggle = regs.add("gpio_toggle", self.GpioUpdate())
+        self._gpio_rise = regs.add("gpio_rise", self.GpioEdges())
+        self._gpio_fall = regs.add("gpio_fall", self.GpioEdges())
+        self._gpio_changes = regs.add("gpio_changes", self.GpioChanges())
 
         self._bridge = csr.Bridge(regs.as_memory_map())
         self.csr_bus = self._bridge.bus
 
+        self._mailbox_window = MailboxWindow(prefix=prefix)
+        self.mailbox_bus = self._mailbox_window.bus
+
+        self._shared_memory = SharedMemory(size=shared_memory_size, cpu_domain="cpu_gated", prefix=prefix)
+        self.shared_bus = self._shared_memory.host_bus
+
+        # Counted on the core's own bus, the local MMIO included. The waits are cycles with
+        # transfers outstanding and no response coming back. The mailbox FIFOs are seen from the
+        # core's side, to_riscv is ARM -> RISC-V.
+        self._perf = PerfCounters(
+            events=(
+                "ar", "aw", "r", "w",
+                "ar_stall", "aw_stall", "w_stall", "read_wait", "write_wait",
+                "to_riscv_full", "to_riscv_empty", "to_arm_full", "to_arm_empty",
+            ),
+            levels={"to_riscv": 16, "to_arm": 16},
+            domain="cpu_gated",
+        )
+        self.perf_bus = self._perf.csr_bus
+
+        # Timed past the read cache, on the way to the PS, so hits don't hide the DDR latency
+        self._latency = AxiLatencyMonitor(SAxiGP, domain="cpu_gated")
+        self.latency_bus = self._latency.csr_bus
+
+        # Traced where the latency is timed, the records go to DDR through `trace_bus`
+        self._trace = AxiTrace(SAxiGP, domain="cpu_gated")
+        self.trace_csr_bus = self._trace.csr_bus
+
+        # Sampled on the core's own bus, before the read cache, so cached fetches are seen too. The
+        # core's instruction cache still hides the fetches that hit in it.
+        self._profiler = FetchProfiler(SAxiGP, domain="cpu_gated")
+        self.profiler_bus = self._profiler.csr_bus
+
     def elaborate(self, platform):
         m = Module()
 
@@ -84,13 +295,36 @@ class Cpu(wiring.Component):
             platform.add_file("VexRiscvAxi3.v", f)
 
         m.submodules.bridge = self._bridge
+        m.submodules.mailbox_window = mailbox_window = self._mailbox_window
 
         m.domains += ClockDomain("cpu_gated", local=True)
+        if self._cpu_domain is None:
+            # The core shares the PS port, or the arbiter in front of it, with nothing between
+            # them, so its clock is only stopped and its reset only applied once its transactions
+            # on the system bus are over. None is left half way through for the others to wait on.
+            m.submodules.sys_drain = sys_drain = AxiDrain(self.sys_bus.signature)
+            cpu_clock = ClockSignal("fclk")
+            clock_enable = self._clocking.f.clock_enable.data | ~sys_drain.idle
+            m.d.comb += [
+                sys_drain.stop.eq(~self._clocking.f.clock_enable.data | self._clocking.f.reset.data),
+                ResetSignal("cpu_gated").eq(self._clocking.f.reset.data & sys_drain.idle),
+            ]
+        else:
+            # BUFGCE wants its enable synchronous to the clock it gates. The reset is released on a
+            # cpu_gated edge, so not before the clock is enabled.
+            cpu_clock = ClockSignal(self._cpu_domain)
+            clock_enable = Signal()
+            m.submodules.sync_clock_enable = FFSynchronizer(
+                self._clocking.f.clock_enable.data,
+                clock_enable,
+                o_domain=self._cpu_domain,
+            )
+            m.submodules.sync_reset = ResetSynchronizer(self._clocking.f.reset.data, domain="cpu_gated")
 
         m.submodules.clkbuf_cpu = Instance(
             "BUFGCE",
-            i_I=ClockSignal("fclk"),
-            i_CE=self._clocking.f.clock_enable.data,
+            i_I=cpu_clock,
+            i_CE=clock_enable,
             o_O=ClockSignal("cpu_gated")
         )
 
@@ -103,20 +337,33 @@ class Cpu(wiring.Component):
         bscan_tms = Signal()
         bscan_tdi = Signal()
         bscan_tdo = Signal()
-        m.submodules.bscan = Instance(
-            "BSCANE2",
-            p_JTAG_CHAIN=4,
-            o_TCK=bscan_tck,
-            o_TMS=bscan_tms,
-            o_TDI=bscan_tdi,
-            i_TDO=bscan_tdo,
-        )
+        if self._bscan_chain is not None:
+            m.submodules.bscan = Instance(
+                "BSCANE2",
+                p_JTAG_CHAIN=self._bscan_chain,
+                o_TCK=bscan_tck,
+                o_TMS=bscan_tms,
+                o_TDI=bscan_tdi,
+                i_TDO=bscan_tdo,
+            )
         platform.add_clock_constraint(tck, 12e6)
 
         tdo_sync = Signal()
         m.submodules.sync_tdo_csr = FFSynchronizer(tdo, tdo_sync)
         setattr(m.submodules.sync_tdo_csr, "_reset", 0)
 
+        m.submodules.jtag_shifter = jtag_shifter = JtagShifter()
+        m.d.comb += [
+            jtag_shifter.start.eq(self._jtag_control.f.count.w_stb),
+            jtag_shifter.count.eq(self._jtag_control.f.count.w_data),
+            jtag_shifter.divider.eq(self._jtag_control.f.divider.data),
+            jtag_shifter.tms.eq(self._jtag_tms.f.bits.data),
+            jtag_shifter.tdi.eq(self._jtag_tdi.f.bits.data),
+            jtag_shifter.jtag.tdo.eq(tdo_sync),
+            self._jtag_control.f.busy.r_data.eq(jtag_shifter.busy),
+            self._jtag_tdo.f.tdo.r_data.eq(jtag_shifter.tdo),
+        ]
+
         with m.Switch(self._debug.f.src_mux.data):
             with m.Case("0-"):
                 m.d.comb += [
@@ -126,12 +373,19 @@ class Cpu(wiring.Component):
                     bscan_tdo.eq(tdo),
                 ]
             with m.Case("10"):
-                m.d.comb += [
-                    tck.eq(self._debug.f.tck.data),
-                    tms.eq(self._debug.f.tms.data),
-                    tdi.eq(self._debug.f.tdi.data),
-                    self._debug.f.tdo.r_data.eq(tdo_sync),
-                ]
+                with m.If(jtag_shifter.busy):
+                    m.d.comb += [
+                        tck.eq(jtag_shifter.jtag.tck),
+                        tms.eq(jtag_shifter.jtag.tms),
+                        tdi.eq(jtag_shifter.jtag.tdi),
+                    ]
+                with m.Else():
+                    m.d.comb += [
+                        tck.eq(self._debug.f.tck.data),
+                        tms.eq(self._debug.f.tms.data),
+                        tdi.eq(self._debug.f.tdi.data),
+                    ]
+                m.d.comb += self._debug.f.tdo.r_data.eq(tdo_sync)
             with m.Case("11"):
                 m.d.comb += [
                     tck.eq(self.ext_jtag.tck),
@@ -166,38 +420,289 @@ class Cpu(wiring.Component):
                     tdo.eq(riscv_debug_tdo),
                 ]
 
-        m.submodules.mailbox_fifo_arm_to_riscv = mailbox_fifo_arm_to_riscv = SyncFIFOBuffered(
-            width=32,
-            depth=16,
-        )
-        m.submodules.mailbox_fifo_riscv_to_arm = mailbox_fifo_riscv_to_arm = SyncFIFOBuffered(
-            width=32,
-            depth=16,
-        )
+        if self._cpu_domain is None:
+            mailbox_fifo_arm_to_riscv = SyncFIFOBuffered(width=32, depth=16)
+            mailbox_fifo_riscv_to_arm = SyncFIFOBuffered(width=32, depth=16)
+        else:
+            mailbox_fifo_arm_to_riscv = AsyncFIFO(width=32, depth=16, w_domain="sync", r_domain="cpu_gated")
+            mailbox_fifo_riscv_to_arm = AsyncFIFO(width=32, depth=16, w_domain="cpu_gated", r_domain="sync")
+        m.submodules.mailbox_fifo_arm_to_riscv = mailbox_fifo_arm_to_riscv
+        m.submodules.mailbox_fifo_riscv_to_arm = mailbox_fifo_riscv_to_arm
+
+        # The ring engine replaces the CSRs and the window as the host side of the FIFOs while it's
+        # enabled, the host mustn't use both at once
+        m.submodules.mailbox_ring = mailbox_ring = MailboxRing()
+        wiring.connect(m, mailbox_ring.bus, wiring.flipped(self.ring_bus))
+        m.d.comb += [
+            mailbox_ring.config.enable.eq(self._mailbox_ring_control.f.enable.data),
+            mailbox_ring.config.size_log2.eq(self._mailbox_ring_control.f.size_log2.data),
+            mailbox_ring.config.tx_base.eq(self._mailbox_ring_tx_base.f.address.data),
+            mailbox_ring.config.tx_head.eq(self._mailbox_ring_tx_head.f.pointer.data),
+            mailbox_ring.config.rx_base.eq(self._mailbox_ring_rx_base.f.address.data),
+            mailbox_ring.config.rx_tail.eq(self._mailbox_ring_rx_tail.f.pointer.data),
+            self._mailbox_ring_control.f.error.r_data.eq(mailbox_ring.config.error),
+            self._mailbox_ring_tx_tail.f.pointer.r_data.eq(mailbox_ring.config.tx_tail),
+            self._mailbox_ring_rx_head.f.pointer.r_data.eq(mailbox_ring.config.rx_head),
+        ]
 
         m.d.comb += [
-            self._mailbox_read_status.f.read_level.r_data.eq(mailbox_fifo_riscv_to_arm.level),
-            self._mailbox_write_status.f.write_level.r_data.eq(mailbox_fifo_arm_to_riscv.level),
+            self._mailbox_read_status.f.read_level.r_data.eq(mailbox_fifo_riscv_to_arm.r_level),
+            self._mailbox_write_status.f.write_level.r_data.eq(mailbox_fifo_arm_to_riscv.w_level),
 
             self._mailbox_read_status.f.read_valid.r_data.eq(mailbox_fifo_riscv_to_arm.r_rdy),
             self._mailbox_read.f.read_data.r_data.eq(mailbox_fifo_riscv_to_arm.r_data),
-            mailbox_fifo_riscv_to_arm.r_en.eq(self._mailbox_read.f.read_data.r_stb),
+            mailbox_fifo_riscv_to_arm.r_en.eq(
+                self._mailbox_read.f.read_data.r_stb |
+                mailbox_window.read.ready |
+                mailbox_ring.read.ready
+            ),
 
             self._mailbox_write_status.f.write_ready.r_data.eq(mailbox_fifo_arm_to_riscv.w_rdy),
-            mailbox_fifo_arm_to_riscv.w_data.eq(self._mailbox_write.f.write_data.w_data),
-            mailbox_fifo_arm_to_riscv.w_en.eq(self._mailbox_write.f.write_data.w_stb),
+            mailbox_fifo_arm_to_riscv.w_data.eq(Mux(
+                mailbox_ring.write.valid,
+                mailbox_ring.write.data,
+                Mux(
+                    mailbox_window.write.valid,
+                    mailbox_window.write.data,
+                    self._mailbox_write.f.write_data.w_data,
+                ),
+            )),
+            mailbox_fifo_arm_to_riscv.w_en.eq(
+                self._mailbox_write.f.write_data.w_stb |
+                mailbox_window.write.valid |
+                mailbox_ring.write.valid
+            ),
+        ]
+        for port in (mailbox_window, mailbox_ring):
+            m.d.comb += [
+                port.read.data.eq(mailbox_fifo_riscv_to_arm.r_data),
+                port.read.valid.eq(mailbox_fifo_riscv_to_arm.r_rdy),
+                port.read.level.eq(mailbox_fifo_riscv_to_arm.r_level),
+                port.write.ready.eq(mailbox_fifo_arm_to_riscv.w_rdy),
+                port.write.space.eq(mailbox_fifo_arm_to_riscv.depth - mailbox_fifo_arm_to_riscv.w_level),
+            ]
+
+        # Pending bits are set for as long as their condition holds, so acknowledging one only sticks
+        # once the host has dealt with it. With the ring enabled the levels are the ring ones.
+        read_level = Signal(32)
+        write_level = Signal(32)
+        with m.If(self._mailbox_ring_control.f.enable.data):
+            m.d.comb += [
+                read_level.eq(mailbox_ring.config.rx_head - mailbox_ring.config.rx_tail),
+                write_level.eq(mailbox_ring.config.tx_head - mailbox_ring.config.tx_tail),
+            ]
+        with m.Else():
+            m.d.comb += [
+                read_level.eq(mailbox_fifo_riscv_to_arm.r_level),
+                write_level.eq(mailbox_fifo_arm_to_riscv.w_level),
+            ]
+
+        irq_pending = self._mailbox_irq_pending.f
+        irq_enable = self._mailbox_irq_enable.f
+        m.d.comb += [
+            irq_pending.read_not_empty.set.eq(read_level != 0),
+            irq_pending.read_watermark.set.eq(read_level > self._mailbox_irq_threshold.f.read_level.data),
+            irq_pending.write_watermark.set.eq(write_level < self._mailbox_irq_threshold.f.write_level.data),
+        ]
+        for name in ("read_not_empty", "read_watermark", "write_watermark"):
+            m.d.comb += getattr(self.mailbox_irq, name).eq(
+                getattr(irq_pending, name).data & getattr(irq_enable, name).data
+            )
+
+        # The RISC-V reaches the fabric peripherals through 0x0004_0000-0x0007_FFFF. The VexRiscv's
+        # own decoders only let 0x0000_0000-0x0FFF_FFFF out on its AXI bus, and in there this range
+        # is DDR only the ARM cores and the ACP can get to, S_AXI_GP and S_AXI_HP can't, and the
+        # loader never puts programs there. Everything else goes on to the PS7.
+        m.submodules.sys_decoder = sys_decoder = DomainRenamer("cpu_gated")(AxiDecoder(SAxiGP))
+        m.submodules.local_axi2wb = local_axi2wb = DomainRenamer("cpu_gated")(Axi2Wishbone())
+        m.submodules.local_decoder = local_decoder = DomainRenamer("cpu_gated")(wishbone.Decoder(
+            addr_width=30,
+            data_width=32,
+            granularity=8,
+            features={"err"},
+        ))
+        sys_decoder.add(local_axi2wb.axi, addr=0x0004_0000, size=0x4_0000)
+        if self._cpu_domain is None:
+            wiring.connect(m, sys_drain.downstream, wiring.flipped(self.sys_bus))
+            sys_bus_target = sys_drain.upstream
+        else:
+            m.submodules.sys_cdc = sys_cdc = AxiAsyncBridge(
+                self.sys_bus.signature,
+                upstream_domain="cpu_gated",
+                downstream_domain="sync",
+            )
+            wiring.connect(m, sys_cdc.downstream, wiring.flipped(self.sys_bus))
+            sys_bus_target = sys_cdc.upstream
+
+        # Reads from the system may be cached, before the upsizer so lines are filled with full 32-bit
+        # beats the core's cache also asks for
+        m.submodules.read_cache = read_cache = DomainRenamer("cpu_gated")(
+            AxiReadCache(SAxiGP, line_size=self._cache_line_size, lines=self._cache_lines)
+        )
+        sys_decoder.add(read_cache.upstream)
+        if self._sys_port in ("hp", "acp"):
+            m.submodules.sys_upsizer = sys_upsizer = DomainRenamer("cpu_gated")(
+                AxiUpsizer(SAxiGP, self.sys_bus.signature)
+            )
+            wiring.connect(m, read_cache.downstream, sys_upsizer.narrow)
+            wiring.connect(m, sys_upsizer.wide, sys_bus_target)
+        else:
+            wiring.connect(m, read_cache.downstream, sys_bus_target)
+
+        m.submodules.latency = latency = self._latency
+        connect_tap(m, latency.bus, read_cache.downstream)
+        m.submodules.trace = trace = self._trace
+        connect_tap(m, trace.tap, read_cache.downstream)
+        wiring.connect(m, trace.bus, wiring.flipped(self.trace_bus))
+
+        if self._cpu_domain is None:
+            m.d.comb += [
+                read_cache.control.enable.eq(self._read_cache.f.enable.data),
+                read_cache.control.fetch_only.eq(self._read_cache.f.fetch_only.data),
+                read_cache.control.invalidate.eq(self._read_cache.f.invalidate.w_stb &
+                                                 self._read_cache.f.invalidate.w_data),
+            ]
+        else:
+            m.submodules.sync_cache_enable = FFSynchronizer(
+                self._read_cache.f.enable.data, read_cache.control.enable, o_domain="cpu_gated")
+            m.submodules.sync_cache_fetch_only = FFSynchronizer(
+                self._read_cache.f.fetch_only.data, read_cache.control.fetch_only, o_domain="cpu_gated")
+            m.submodules.sync_cache_invalidate = sync_cache_invalidate = PulseSynchronizer(
+                i_domain="sync", o_domain="cpu_gated")
+            m.d.comb += [
+                sync_cache_invalidate.i.eq(self._read_cache.f.invalidate.w_stb &
+                                           self._read_cache.f.invalidate.w_data),
+                read_cache.control.invalidate.eq(sync_cache_invalidate.o),
+            ]
+        wiring.connect(m, local_axi2wb.wishbone, local_decoder.bus)
+
+        # Interrupt sources: ARM -> RISC-V mailbox not empty, any change on the GPIO inputs, the
+        # timestamp compare match, and the controller's own timer
+        m.submodules.irq = irq = DomainRenamer("cpu_gated")(IrqController(sources=3))
+        m.submodules.irq_wb = irq_wb = DomainRenamer("cpu_gated")(
+            CSRBridge(irq.csr_bus, data_width=32, granularity=8)
+        )
+        local_decoder.add(irq_wb.wb_bus, addr=0x0004_0000)
+
+        # The RISC-V side of the memory shared with the host
+        m.submodules.shared_memory = self._shared_memory
+        local_decoder.add(self._shared_memory.cpu_bus, addr=0x0005_0000)
+
+        # The RISC-V reads the time base shared with the host at 0x0006_0000
+        m.submodules.timestamp_timer = timestamp_timer = DomainRenamer("cpu_gated")(TimestampTimer())
+        m.submodules.timestamp_timer_wb = timestamp_timer_wb = DomainRenamer("cpu_gated")(
+            CSRBridge(timestamp_timer.csr_bus, data_width=32, granularity=8)
+        )
+        local_decoder.add(timestamp_timer_wb.wb_bus, addr=0x0006_0000)
+        if self._cpu_domain is None:
+            m.d.comb += timestamp_timer.count.eq(self.timestamp)
+        else:
+            m.submodules.sync_timestamp = sync_timestamp = TimestampSynchronizer(o_domain="cpu_gated")
+            m.d.comb += [
+                sync_timestamp.i.eq(self.timestamp),
+                timestamp_timer.count.eq(sync_timestamp.o),
+            ]
+
+        # The GPIO bits are independent, each one is synchronized on its own
+        if self._cpu_domain is None:
+            gpio_read = self._gpio.f.read.data
+            gpio_write = self._gpio.f.write.r_data
+            gpio_write_enable = self._gpio.f.write_enable.r_data
+        else:
+            gpio_read = Signal(32)
+            gpio_write = Signal(32)
+            gpio_write_enable = Signal(32)
+            m.submodules.sync_gpio_read = FFSynchronizer(self._gpio.f.read.data, gpio_read, o_domain="cpu_gated")
+            m.submodules.sync_gpio_write = FFSynchronizer(gpio_write, self._gpio.f.write.r_data)
+            m.submodules.sync_gpio_write_enable = FFSynchronizer(gpio_write_enable, self._gpio.f.write_enable.r_data)
+
+        gpio_prev = Signal(32)
+        m.d.cpu_gated += gpio_prev.eq(gpio_read)
+
+        # Single writes update some bits of gpio.read, and the host gets to see every transition of
+        # gpio.write (once synchronized) without having to poll it in time
+        gpio_read_field = self._gpio.f.read
+        m.d.comb += [
+            gpio_read_field.set.eq(Mux(self._gpio_set.f.bits.w_stb, self._gpio_set.f.bits.w_data, 0)),
+            gpio_read_field.clear.eq(Mux(self._gpio_clear.f.bits.w_stb, self._gpio_clear.f.bits.w_data, 0)),
+            gpio_read_field.toggle.eq(Mux(self._gpio_toggle.f.bits.w_stb, self._gpio_toggle.f.bits.w_data, 0)),
         ]
 
-        sys_aw = self.sys_bus.write_address
-        sys_w = self.sys_bus.write_data
-        sys_b = self.sys_bus.write_response
-        sys_ar = self.sys_bus.read_address
-        sys_r = self.sys_bus.read
-        m.d.comb += self.sys_bus.aclk.eq(ClockSignal("cpu_gated"))
+        gpio_host_write = self._gpio.f.write.r_data
+        gpio_host_prev = Signal(32)
+        gpio_changes = Signal(32)
+        m.d.sync += gpio_host_prev.eq(gpio_host_write)
+        m.d.comb += [
+            self._gpio_rise.f.bits.set.eq(gpio_host_write & ~gpio_host_prev),
+            self._gpio_fall.f.bits.set.eq(~gpio_host_write & gpio_host_prev),
+            self._gpio_changes.f.count.r_data.eq(gpio_changes),
+        ]
+        with m.If(gpio_host_write != gpio_host_prev):
+            m.d.sync += gpio_changes.eq(gpio_changes + 1)
+        m.d.comb += irq.sources.eq(Cat(
+            mailbox_fifo_arm_to_riscv.r_rdy,
+            (gpio_read != gpio_prev),
+            timestamp_timer.irq,
+        ))
+
+        sys_aw = sys_decoder.bus.write_address
+        sys_w = sys_decoder.bus.write_data
+        sys_b = sys_decoder.bus.write_response
+        sys_ar = sys_decoder.bus.read_address
+        sys_r = sys_decoder.bus.read
+
+        # The memory attributes come from sys_attributes, the local MMIO ignores them. Through the
+        # ACP, accesses marked shared (AxUSER[0]) and cacheable (AxCACHE[1]) are looked up in the ARM
+        # L1 caches by the SCU and allocate in L2, so buffers shared with Linux may stay cacheable.
+        attributes = self._sys_attributes.f
+        core_ar_prot = Signal(3)
+        m.d.comb += [
+            sys_ar.cache.eq(attributes.read_cache.data),
+            sys_ar.qos.eq(Mux(core_ar_prot[2], attributes.fetch_qos.data, attributes.read_qos.data)),
+            sys_ar.prot.eq(attributes.read_prot.data | (core_ar_prot & 0b100)),
+            sys_aw.cache.eq(attributes.write_cache.data),
+            sys_aw.qos.eq(attributes.write_qos.data),
+            sys_aw.prot.eq(attributes.write_prot.data),
+        ]
+        if self._sys_port == "acp":
+            m.d.comb += [
+                sys_upsizer.wide.read_address.user.eq(0b11111),
+                sys_upsizer.wide.write_address.user.eq(0b11111),
+            ]
+
+        m.submodules.profiler = profiler = self._profiler
+        connect_tap(m, profiler.bus, sys_decoder.bus)
+
+        m.submodules.perf = perf = self._perf
+        reads_outstanding = Signal(8)
+        writes_outstanding = Signal(8)
+        m.d.cpu_gated += [
+            reads_outstanding.eq(reads_outstanding + (sys_ar.valid & sys_ar.ready) -
+                                 (sys_r.valid & sys_r.ready & sys_r.last)),
+            writes_outstanding.eq(writes_outstanding + (sys_aw.valid & sys_aw.ready) -
+                                  (sys_b.valid & sys_b.ready)),
+        ]
+        m.d.comb += [
+            perf.events.ar.eq(sys_ar.valid & sys_ar.ready),
+            perf.events.aw.eq(sys_aw.valid & sys_aw.ready),
+            perf.events.r.eq(sys_r.valid & sys_r.ready),
+            perf.events.w.eq(sys_w.valid & sys_w.ready),
+            perf.events.ar_stall.eq(sys_ar.valid & ~sys_ar.ready),
+            perf.events.aw_stall.eq(sys_aw.valid & ~sys_aw.ready),
+            perf.events.w_stall.eq(sys_w.valid & ~sys_w.ready),
+            perf.events.read_wait.eq((reads_outstanding != 0) & ~sys_r.valid),
+            perf.events.write_wait.eq((writes_outstanding != 0) & ~sys_b.valid),
+            perf.events.to_riscv_full.eq(mailbox_fifo_arm_to_riscv.r_level == mailbox_fifo_arm_to_riscv.depth),
+            perf.events.to_riscv_empty.eq(mailbox_fifo_arm_to_riscv.r_level == 0),
+            perf.events.to_arm_full.eq(mailbox_fifo_riscv_to_arm.w_level == mailbox_fifo_riscv_to_arm.depth),
+            perf.events.to_arm_empty.eq(mailbox_fifo_riscv_to_arm.w_level == 0),
+            perf.levels.to_riscv.eq(mailbox_fifo_arm_to_riscv.r_level),
+            perf.levels.to_arm.eq(mailbox_fifo_riscv_to_arm.w_level),
+        ]
 
         m.submodules.cpu = Instance(
             "VexRiscvAxi3",
-            i_io_rst=self._clocking.f.reset.data,
+            i_io_rst=ResetSignal("cpu_gated"),
             i_io_clk=ClockSignal("cpu_gated"),
 
             i_io_reset_addr=self._reset_addr.f.address.data,
@@ -212,9 +717,9 @@ class Cpu(wiring.Component):
             i_io_riscv_jtag_tdi=riscv_debug_tdi,
             o_io_riscv_jtag_tdo=riscv_debug_tdo,
 
-            i_io_gpio_read=self._gpio.f.read.data,
-            o_io_gpio_write=self._gpio.f.write.r_data,
-            o_io_gpio_writeEnable=self._gpio.f.write_enable.r_data,
+            i_io_gpio_read=gpio_read,
+            o_io_gpio_write=gpio_write,
+            o_io_gpio_writeEnable=gpio_write_enable,
 
             i_io_mailbox_read_valid=mailbox_fifo_arm_to_riscv.r_rdy,
             o_io_mailbox_read_ready=mailbox_fifo_arm_to_riscv.r_en,
@@ -226,6 +731,8 @@ class Cpu(wiring.Component):
             o_io_uart_txd=self.ext_uart.tx,
             i_io_uart_rxd=self.ext_uart.rx,
 
+            i_io_irq=irq.irq,
+
             o_io_axi3_aw_valid=sys_aw.valid,
             i_io_axi3_aw_ready=sys_aw.ready,
             o_io_axi3_aw_payload_addr=sys_aw.addr,
@@ -233,10 +740,6 @@ class Cpu(wiring.Component):
             o_io_axi3_aw_payload_len=sys_aw.len,
             o_io_axi3_aw_payload_size=sys_aw.size,
             o_io_axi3_aw_payload_burst=sys_aw.burst,
-            # This breaks memory accesses
-            # o_io_axi3_aw_payload_cache=sys_aw.cache,
-            # o_io_axi3_aw_payload_qos=sys_aw.qos,
-            # o_io_axi3_aw_payload_prot=sys_aw.prot,
 
             o_io_axi3_w_valid=sys_w.valid,
             i_io_axi3_w_ready=sys_w.ready,
@@ -256,10 +759,7 @@ class Cpu(wiring.Component):
             o_io_axi3_ar_payload_len=sys_ar.len,
             o_io_axi3_ar_payload_size=sys_ar.size,
             o_io_axi3_ar_payload_burst=sys_ar.burst,
-            # This breaks memory accesses
-            # o_io_axi3_ar_payload_cache=sys_ar.cache,
-            # o_io_axi3_ar_payload_qos=sys_ar.qos,
-            # o_io_axi3_ar_payload_prot=sys_ar.prot,
+            o_io_axi3_ar_payload_prot=core_ar_prot,
 
             i_io_axi3_r_valid=sys_r.valid,
             o_io_axi3_r_ready=sys_r.ready,
@@ -0,0 +1,156 @@
+from amaranth import *
+from amaranth.lib import wiring
+from amaranth.lib.wiring import In
+from amaranth.utils import exact_log2
+from amaranth_soc import wishbone
+from amaranth_soc.memory import MemoryMap
+
+
+__all__ = ["CSRBridge"]
+
+
+class CSRBridge(wiring.Component):
+    def __init__(self, csr_bus, *, data_width: int = None, granularity: int = None, features=frozenset(),
+                 prefix: tuple = ()):
+        features = frozenset(features)
+        if not features <= {"stall"}:
+            raise ValueError(f"Wishbone features must be a subset of {{'stall'}}, not {set(features)!r}")
+        if data_width is None:
+            data_width = csr_bus.data_width
+        if granularity is None:
+            granularity = csr_bus.data_width
+        if data_width % csr_bus.data_width != 0:
+            raise ValueError(f"Wishbone data width {data_width} must be a multiple of the CSR data width "
+                             f"{csr_bus.data_width}")
+        if csr_bus.data_width % granularity != 0:
+            raise ValueError(f"CSR data width {csr_bus.data_width} must be a multiple of the Wishbone "
+                             f"granularity {granularity}")
+        ratio = data_width // csr_bus.data_width
+        scale = csr_bus.data_width // granularity
+
+        super().__init__({
+            "wb_bus": In(wishbone.Signature(
+                addr_width=max(0, csr_bus.addr_width - exact_log2(ratio)),
+                data_width=data_width,
+                granularity=granularity,
+                features=features,
+            )),
+        })
+        self.wb_bus.memory_map = MemoryMap(
+            addr_width=csr_bus.addr_width + exact_log2(scale),
+            data_width=granularity,
+        )
+        if scale == 1 and not prefix:
+            self.wb_bus.memory_map.add_window(csr_bus.memory_map)
+        else:
+            # A window can't be narrower than the map it's added to, so the registers of a CSR bus
+            # wider than the granularity are added one by one at their byte addresses instead. That's
+            # also how their names get a prefix, which keeps several identical blocks apart.
+            for resource in csr_bus.memory_map.all_resources():
+                name = prefix + tuple(j for i in resource.path for j in (i if isinstance(i, tuple) else (i,)))
+                self.wb_bus.memory_map.add_resource(
+                    resource.resource,
+                    name=name,
+                    size=(resource.end - resource.start) * scale,
+                    addr=resource.start * scale,
+                )
+
+        self._csr_bus = csr_bus
+
+    @property
+    def csr_bus(self):
+        return self._csr_bus
+
+    def elaborate(self, platform):
+        m = Module()
+
+        wb_bus = self.wb_bus
+        csr_bus = self._csr_bus
+        ratio = wb_bus.data_width // csr_bus.data_width
+        sel_width = csr_bus.data_width // wb_bus.granularity
+        pipelined = "stall" in wb_bus.features
+
+        # Each Wishbone access is split into `ratio` CSR accesses, one per cycle. CSR reads return
+        # their data the cycle after r_stb, so the ack goes out one cycle after the last chunk.
+        # CSR buses have no byte enables, a chunk with any byte selected is accessed as a whole.
+        busy = Signal()
+        chunk = Signal(range(ratio))
+        ack = Signal()
+
+        adr = Signal.like(wb_bus.adr)
+        we = Signal()
+        sel = Signal.like(wb_bus.sel)
+        dat_w = Signal.like(wb_bus.dat_w)
+
+        # A classic initiator keeps stb up until it sees the ack, which mustn't start a new access
+        accept = wb_bus.cyc & wb_bus.stb & ~busy
+        if pipelined:
+            m.d.comb += wb_bus.stall.eq(busy)
+        else:
+            accept &= ~ack
+
+        cur_chunk = Signal.like(chunk)
+        cur_adr = Signal.like(adr)
+        cur_we = Signal()
+        cur_sel = Signal.like(sel)
+        cur_dat_w = Signal.like(dat_w)
+        with m.If(busy):
+            m.d.comb += [
+                cur_chunk.eq(chunk),
+                cur_adr.eq(adr),
+                cur_we.eq(we),
+                cur_sel.eq(sel),
+                cur_dat_w.eq(dat_w),
+            ]
+        with m.Else():
+            m.d.comb += [
+                cur_adr.eq(wb_bus.adr),
+                cur_we.eq(wb_bus.we),
+                cur_sel.eq(wb_bus.sel),
+                cur_dat_w.eq(wb_bus.dat_w),
+            ]
+        issue = busy | accept
+
+        m.d.comb += [
+            csr_bus.addr.eq(Cat(cur_chunk, cur_adr) if ratio > 1 else cur_adr),
+            csr_bus.w_data.eq(cur_dat_w.word_select(cur_chunk, csr_bus.data_width)),
+            csr_bus.r_stb.eq(issue & cur_sel.word_select(cur_chunk, sel_width).any() & ~cur_we),
+            csr_bus.w_stb.eq(issue & cur_sel.word_select(cur_chunk, sel_width).any() & cur_we),
+        ]
+
+        with m.If(accept):
+            m.d.sync += [
+                adr.eq(wb_bus.adr),
+                we.eq(wb_bus.we),
+                sel.eq(wb_bus.sel),
+                dat_w.eq(wb_bus.dat_w),
+            ]
+        if ratio > 1:
+            with m.If(accept):
+                m.d.sync += [
+                    busy.eq(1),
+                    chunk.eq(1),
+                ]
+            with m.Elif(busy):
+                m.d.sync += chunk.eq(chunk + 1)
+                with m.If(chunk == ratio - 1):
+                    m.d.sync += busy.eq(0)
+        m.d.sync += ack.eq(issue & (cur_chunk == ratio - 1))
+
+        # All chunks but the last are captured, the last one goes straight out with the ack
+        read_data = Signal(wb_bus.data_width)
+        prev_chunk = Signal.like(chunk)
+        prev_issue = Signal()
+        m.d.sync += [
+            prev_chunk.eq(cur_chunk),
+            prev_issue.eq(issue),
+        ]
+        with m.If(prev_issue):
+            m.d.sync += read_data.word_select(prev_chunk, csr_bus.data_width).eq(csr_bus.r_data)
+
+        m.d.comb += [
+            wb_bus.dat_r.eq(Cat(read_data[:-csr_bus.data_width], csr_bus.r_data)),
+            wb_bus.ack.eq(ack),
+        ]
+
+        return m
@@ -0,0 +1,110 @@
+from amaranth import *
+from amaranth.lib import wiring
+from amaranth.lib.wiring import In
+from amaranth.utils import exact_log2
+from amaranth_soc import wishbone
+from amaranth_soc.memory import MemoryMap
+
+
+__all__ = ["PipelinedDecoder"]
+
+
+class PipelinedDecoder(wiring.Component):
+    def __init__(self, *, addr_width: int, data_width: int, granularity: int, features=frozenset(),
+                 max_outstanding: int = 8):
+        features = frozenset(features) | {"stall"}
+        super().__init__({
+            "bus": In(wishbone.Signature(
+                addr_width=addr_width,
+                data_width=data_width,
+                granularity=granularity,
+                features=features,
+            )),
+        })
+        self.bus.memory_map = MemoryMap(
+            addr_width=addr_width + exact_log2(data_width // granularity),
+            data_width=granularity,
+        )
+        self._max_outstanding = max_outstanding
+        self._subs = []
+
+    def add(self, sub_bus, *, addr=None):
+        if sub_bus.data_width != self.bus.data_width or sub_bus.granularity != self.bus.granularity:
+            raise ValueError(f"Subordinate bus has data width {sub_bus.data_width} and granularity "
+                             f"{sub_bus.granularity}, decoder has data width {self.bus.data_width} and "
+                             f"granularity {self.bus.granularity}")
+        if not sub_bus.features <= self.bus.features:
+            raise ValueError(f"Subordinate bus has optional outputs {set(sub_bus.features - self.bus.features)!r} "
+                             f"the decoder doesn't have")
+        start, end, _ = self.bus.memory_map.add_window(sub_bus.memory_map, addr=addr)
+        shift = exact_log2(self.bus.data_width // self.bus.granularity)
+        self._subs.append((sub_bus, start >> shift, end >> shift))
+
+    def elaborate(self, platform):
+        m = Module()
+
+        # Index len(self._subs) is the "nothing mapped there" target, which answers with err
+        target = Signal(range(len(self._subs) + 1))
+        m.d.comb += target.eq(len(self._subs))
+        for i, (_, start, end) in reversed(list(enumerate(self._subs))):
+            with m.If((self.bus.adr >= start) & (self.bus.adr < end)):
+                m.d.comb += target.eq(i)
+
+        # Responses must come back in request order, which is only guaranteed by a single
+        # subordinate. A request for another one is stalled until everything in flight is done.
+        outstanding = Signal(range(self._max_outstanding + 1))
+        current = Signal.like(target)
+        can_issue = ((outstanding == 0) | (target == current)) & (outstanding != self._max_outstanding)
+        responder = Mux(outstanding == 0, target, current)
+
+        unmapped_resp = Signal()
+        sub_stall = Signal()
+        m.d.comb += sub_stall.eq(0)
+
+        for i, (sub_bus, _, _) in enumerate(self._subs):
+            m.d.comb += [
+                sub_bus.adr.eq(self.bus.adr),
+                sub_bus.dat_w.eq(self.bus.dat_w),
+                sub_bus.sel.eq(self.bus.sel),
+                sub_bus.we.eq(self.bus.we),
+                sub_bus.cyc.eq(self.bus.cyc & ((outstanding != 0) & (current == i) |
+                                               can_issue & (target == i))),
+                sub_bus.stb.eq(self.bus.stb & can_issue & (target == i)),
+            ]
+            with m.If(target == i):
+                if "stall" in sub_bus.features:
+                    m.d.comb += sub_stall.eq(sub_bus.stall)
+                else:
+                    # A classic subordinate accepts a request in the cycle it answers it
+                    m.d.comb += sub_stall.eq(~(sub_bus.ack | (sub_bus.err if "err" in sub_bus.features else 0)))
+
+            with m.If(responder == i):
+                m.d.comb += [
+                    self.bus.dat_r.eq(sub_bus.dat_r),
+                    self.bus.ack.eq(sub_bus.ack),
+                ]
+                if "err" in sub_bus.features:
+                    m.d.comb += self.bus.err.eq(sub_bus.err)
+
+        m.d.comb += self.bus.stall.eq(~can_issue | sub_stall)
+
+        issued = self.bus.cyc & self.bus.stb & ~self.bus.stall
+        with m.If(issued & (target == len(self._subs))):
+            m.d.sync += unmapped_resp.eq(1)
+        with m.Else():
+            m.d.sync += unmapped_resp.eq(0)
+        with m.If(unmapped_resp):
+            if "err" in self.bus.features:
+                m.d.comb += self.bus.err.eq(1)
+            else:
+                m.d.comb += self.bus.ack.eq(1)
+
+        responded = self.bus.ack | (self.bus.err if "err" in self.bus.features else 0)
+        with m.If(~self.bus.cyc):
+            m.d.sync += outstanding.eq(0)
+        with m.Else():
+            m.d.sync += outstanding.eq(outstanding + issued - responded)
+        with m.If(issued):
+            m.d.sync += current.eq(target)
+
+        return m
@@ -0,0 +1,106 @@
+from amaranth import *
+from amaranth.lib import wiring
+from amaranth.lib.wiring import In, Out
+from amaranth_soc import csr
+
+
+__all__ = ["IrqController"]
+
+
+class _Pending(csr.FieldAction):
+    # Like RW1C, with another set of clear strobes for the claim register
+    def __init__(self, width):
+        super().__init__(width, access="rw", members=(
+            ("data", Out(width)),
+            ("set", In(width)),
+            ("clear", In(width)),
+        ))
+        self._storage = Signal(width)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        for i, storage_bit in enumerate(self._storage):
+            with m.If(self.port.w_stb & self.port.w_data[i] | self.clear[i]):
+                m.d.sync += storage_bit.eq(0)
+            with m.If(self.set[i]):
+                m.d.sync += storage_bit.eq(1)
+
+        m.d.comb += [
+            self.port.r_data.eq(self._storage),
+            self.data.eq(self._storage),
+        ]
+
+        return m
+
+
+class IrqController(wiring.Component):
+    # Collects `sources` event lines plus a built-in periodic timer, the last source, into a single
+    # interrupt. A source held high keeps its pending bit set, pulses are latched until they're
+    # acknowledged by writing 1 to it or claimed. Reading claim returns 1 + the lowest pending
+    # unmasked source, or 0 if there's none, and clears its pending bit.
+    def __init__(self, *, sources: int):
+        self._sources = sources + 1
+        super().__init__({
+            "sources": In(sources),
+            "irq": Out(1),
+        })
+
+        class Pending(csr.Register, access="rw"):
+            pending: csr.Field(_Pending, self._sources)
+
+        class Mask(csr.Register, access="rw"):
+            enable: csr.Field(csr.action.RW, self._sources)
+
+        class Claim(csr.Register, access="r"):
+            source: csr.Field(csr.action.R, 8)
+
+        class TimerPeriod(csr.Register, access="rw"):
+            # In cycles, 0 stops the timer
+            period: csr.Field(csr.action.RW, 32)
+
+        regs = csr.Builder(addr_width=4, data_width=32)
+
+        self._pending = regs.add("pending", Pending())
+        self._mask = regs.add("mask", Mask())
+        self._claim = regs.add("claim", Claim())
+        self._timer_period = regs.add("timer_period", TimerPeriod())
+
+        self._bridge = csr.Bridge(regs.as_memory_map())
+        self.csr_bus = self._bridge.bus
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.bridge = self._bridge
+
+        period = self._timer_period.f.period.data
+        timer = Signal(32)
+        timer_event = Signal()
+        with m.If((period == 0) | timer_event):
+            m.d.sync += timer.eq(0)
+        with m.Else():
+            m.d.sync += timer.eq(timer + 1)
+        m.d.comb += timer_event.eq((period != 0) & (timer == period - 1))
+
+        pending = self._pending.f.pending
+        active = Signal(self._sources)
+        m.d.comb += [
+            pending.set.eq(Cat(self.sources, timer_event)),
+            active.eq(pending.data & self._mask.f.enable.data),
+            self.irq.eq(active.any()),
+        ]
+
+        claim = Signal(8)
+        claimed = Signal(self._sources)
+        for i in reversed(range(self._sources)):
+            with m.If(active[i]):
+                m.d.comb += [
+                    claim.eq(i + 1),
+                    claimed.eq(1 << i),
+                ]
+        m.d.comb += self._claim.f.source.r_data.eq(claim)
+        with m.If(self._claim.f.source.r_stb):
+            m.d.comb += pending.clear.eq(claimed)
+
+        return m
@@ -0,0 +1,70 @@
+from amaranth import *
+from amaranth.lib import wiring
+from amaranth.lib.wiring import In, Out
+
+
+__all__ = ["JtagShifter"]
+
+
+class JtagShifter(wiring.Component):
+    # Clocks out `count` bits of `tms`/`tdi`, LSB first, when `start` is pulsed, and captures TDO
+    # into the matching bits of `tdo`. TCK stays (divider + 1) cycles in each phase, TDO is taken
+    # at the end of the high phase, so it may go through a couple of synchronizer stages. A divider
+    # of 0 is taken as 1 for that, `divider` is latched on `start`.
+    start: In(1)
+    count: In(6)
+    divider: In(16)
+    tms: In(32)
+    tdi: In(32)
+    tdo: Out(32)
+    busy: Out(1)
+    jtag: Out(wiring.Signature({
+        "tck": Out(1),
+        "tms": Out(1),
+        "tdi": Out(1),
+        "tdo": In(1),
+    }))
+
+    def elaborate(self, platform):
+        m = Module()
+
+        tms = Signal(32)
+        tdi = Signal(32)
+        last = Signal(6)
+        bit = Signal(6)
+        timer = Signal(16)
+        divider = Signal(16)
+
+        m.d.comb += [
+            self.jtag.tms.eq(tms.bit_select(bit[:5], 1)),
+            self.jtag.tdi.eq(tdi.bit_select(bit[:5], 1)),
+        ]
+
+        with m.If(~self.busy):
+            with m.If(self.start & (self.count != 0)):
+                m.d.sync += [
+                    self.busy.eq(1),
+                    tms.eq(self.tms),
+                    tdi.eq(self.tdi),
+                    self.tdo.eq(0),
+                    last.eq(Mux(self.count > 32, 31, self.count - 1)),
+                    bit.eq(0),
+                    timer.eq(0),
+                    divider.eq(Mux(self.divider == 0, 1, self.divider)),
+                ]
+        with m.Elif(timer == divider):
+            m.d.sync += timer.eq(0)
+            with m.If(~self.jtag.tck):
+                m.d.sync += self.jtag.tck.eq(1)
+            with m.Else():
+                m.d.sync += [
+                    self.jtag.tck.eq(0),
+                    self.tdo.bit_select(bit[:5], 1).eq(self.jtag.tdo),
+                    bit.eq(bit + 1),
+                ]
+                with m.If(bit == last):
+                    m.d.sync += self.busy.eq(0)
+        with m.Else():
+            m.d.sync += timer.eq(timer + 1)
+
+        return m
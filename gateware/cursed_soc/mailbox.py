@@ -0,0 +1,76 @@
+from amaranth import *
+from amaranth.lib import wiring
+from amaranth.lib.wiring import In, Out
+from amaranth_soc import wishbone
+from amaranth_soc.memory import MemoryMap
+
+
+__all__ = ["MailboxWindow"]
+
+
+class MailboxWindow(wiring.Component):
+    # The window is made of 16 word frames, so a single 16 beat burst covers exactly one frame:
+    #   word 0     : status, read_level in [15:0] and write_space in [31:16], writes are ignored
+    #   words 1-15 : reads pop the RISC-V -> ARM FIFO, writes push the ARM -> RISC-V FIFO
+    # Reading the status latches read_level, and only words 1 to read_level (at most 15) read in
+    # order after it pop, anything else reads zero, so a burst starting at word 0 returns exactly
+    # read_level valid words and the FIFO never loses any past them. Writes to a full FIFO are
+    # answered with err.
+    bus: In(wishbone.Signature(addr_width=10, data_width=32, granularity=8, features={"err"}))
+    read: In(wiring.Signature({
+        "data": Out(32),
+        "valid": Out(1),
+        "ready": In(1),
+        "level": Out(16),
+    }))
+    write: Out(wiring.Signature({
+        "data": Out(32),
+        "valid": Out(1),
+        "ready": In(1),
+        "space": In(16),
+    }))
+
+    def __init__(self, *, prefix: tuple = ()):
+        super().__init__()
+        self.bus.memory_map = MemoryMap(addr_width=12, data_width=8)
+        self.bus.memory_map.add_resource(self, name=prefix + ("mailbox",), size=1 << 12)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        access = self.bus.cyc & self.bus.stb
+        word = self.bus.adr[:4]
+
+        # The words left to pop in the frame, and the next one that pops
+        available = Signal(4)
+        next_word = Signal(4)
+
+        overflow = Signal()
+        m.d.comb += [
+            overflow.eq(access & self.bus.we & (word != 0) & self.bus.sel.any() & ~self.write.ready),
+            self.bus.ack.eq(access & ~overflow),
+            self.bus.err.eq(overflow),
+        ]
+
+        with m.If(word == 0):
+            m.d.comb += self.bus.dat_r.eq(Cat(self.read.level, self.write.space))
+            with m.If(access & ~self.bus.we):
+                m.d.sync += [
+                    available.eq(Mux(self.read.level > 15, 15, self.read.level)),
+                    next_word.eq(1),
+                ]
+        with m.Else():
+            with m.If((word == next_word) & (available != 0)):
+                m.d.comb += [
+                    self.bus.dat_r.eq(self.read.data),
+                    self.read.ready.eq(access & ~self.bus.we & self.read.valid),
+                ]
+                with m.If(access & ~self.bus.we):
+                    m.d.sync += [
+                        available.eq(available - 1),
+                        next_word.eq(next_word + 1),
+                    ]
+            m.d.comb += self.write.valid.eq(access & self.bus.we & self.bus.sel.any() & self.write.ready)
+        m.d.comb += self.write.data.eq(self.bus.dat_w)
+
+        return m
@@ -0,0 +1,397 @@
+from amaranth import *
+from amaranth.lib import wiring
+from amaranth.lib.cdc import FFSynchronizer
+from amaranth.lib.memory import Memory
+from amaranth.lib.wiring import In, Out
+from amaranth_soc import csr
+from .perf import RequestSynchronizer
+
+
+__all__ = ["tap_signature", "connect_tap", "AxiLatencyMonitor", "FetchProfiler"]
+
+
+_CHANNELS = ("read_address", "read", "write_address", "write_data", "write_response")
+
+
+def tap_signature(signature):
+    # The channel members of an AXI `signature`, all of them going into a component watching the bus
+    return wiring.Signature({
+        channel: Out(wiring.Signature({
+            name: Out(member.shape)
+            for name, member in signature.members[channel].signature.members.items()
+        }))
+        for channel in _CHANNELS
+    })
+
+
+def connect_tap(m, tap, bus):
+    for channel in _CHANNELS:
+        tap_channel = getattr(tap, channel)
+        bus_channel = getattr(bus, channel)
+        for name in tap_channel.signature.members:
+            m.d.comb += getattr(tap_channel, name).eq(getattr(bus_channel, name))
+
+
+def _histogram(m, name, *, depth, domain, bin, count, clearing, clear_bin, host_bin):
+    # Counts `bin` into a BRAM of `depth` 32-bit counters when `count` is high, or zeroes `clear_bin`
+    # while `clearing`, both in `domain`. Returns the counter at `host_bin`, read in sync.
+    # The bin is read-modify-written over two cycles, the read port sees a write to the same bin in
+    # the same cycle, so back-to-back counts aren't lost.
+    hist = Memory(shape=32, depth=depth, init=[])
+    m.submodules[name] = hist
+    hist_wr = hist.write_port(domain=domain)
+    hist_rd = hist.read_port(domain=domain, transparent_for=(hist_wr,))
+    host_rd = hist.read_port(domain="sync")
+
+    update = Signal(name=f"{name}_update")
+    update_bin = Signal.like(bin, name=f"{name}_update_bin")
+    m.d[domain] += [
+        update.eq(count),
+        update_bin.eq(bin),
+    ]
+    m.d.comb += hist_rd.addr.eq(bin)
+    with m.If(clearing):
+        m.d.comb += [
+            hist_wr.addr.eq(clear_bin),
+            hist_wr.data.eq(0),
+            hist_wr.en.eq(1),
+        ]
+    with m.Else():
+        m.d.comb += [
+            hist_wr.addr.eq(update_bin),
+            hist_wr.data.eq(hist_rd.data + 1),
+            hist_wr.en.eq(update),
+        ]
+
+    m.d.comb += host_rd.addr.eq(host_bin)
+    return host_rd.data
+
+
+class AxiLatencyMonitor(wiring.Component):
+    # Times the transactions seen on `bus`, reads from AR to the last R beat and writes from AW to
+    # B, and counts them into histograms of `bins` bins, bin n > 0 holding latencies (in cycles,
+    # shifted right by `shift`) from 1 << (n - 1), the last bin holding everything above. Up to
+    # `depth` transactions per ID are timed, more of them are left out until the ID is quiet.
+    # Like PerfCounters the count, total, min and max registers hold a snapshot, while the
+    # histograms are read live, one bin at a time through hist_select and hist_data. Everything is
+    # cleared on reset of `domain` and by clear, which takes `bins` cycles. Busy stays high from a
+    # snapshot or clear write until it's been taken up in `domain`.
+    def __init__(self, signature, *, bins: int = 16, depth: int = 4, domain: str = "sync"):
+        if depth < 1 or depth & (depth - 1):
+            raise ValueError(f"Depth must be a power of two, not {depth!r}")
+        self._bins = bins
+        self._depth = depth
+        self._domain = domain
+        super().__init__({
+            "bus": In(tap_signature(signature)),
+        })
+
+        class Control(csr.Register, access="rw"):
+            freeze: csr.Field(csr.action.RW, 1)
+            snapshot: csr.Field(csr.action.W, 1)
+            clear: csr.Field(csr.action.W, 1)
+            busy: csr.Field(csr.action.R, 1)
+            _pad0: csr.Field(csr.action.ResR0WA, 4)
+            shift: csr.Field(csr.action.RW, 5)
+
+        class HistSelect(csr.Register, access="rw"):
+            bin: csr.Field(csr.action.RW, 8)
+            write: csr.Field(csr.action.RW, 1)
+
+        class Value(csr.Register, access="r"):
+            value: csr.Field(csr.action.R, 32)
+
+        class Total(csr.Register, access="r"):
+            value: csr.Field(csr.action.R, 64)
+
+        regs = csr.Builder(addr_width=4, data_width=32)
+
+        self._control = regs.add("control", Control())
+        self._hist_select = regs.add("hist_select", HistSelect())
+        self._hist_data = regs.add("hist_data", Value())
+        self._stats = {}
+        for direction in ("read", "write"):
+            # Ordered so the 64-bit total doesn't need any padding
+            if direction == "read":
+                count = regs.add("read_count", Value())
+                total = regs.add("read_total", Total())
+            else:
+                total = regs.add("write_total", Total())
+                count = regs.add("write_count", Value())
+            minimum = regs.add(f"{direction}_min", Value())
+            maximum = regs.add(f"{direction}_max", Value())
+            self._stats[direction] = count, total, minimum, maximum
+
+        self._bridge = csr.Bridge(regs.as_memory_map())
+        self.csr_bus = self._bridge.bus
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.bridge = self._bridge
+
+        domain = self._domain
+        freeze = Signal()
+        shift = Signal(5)
+        m.submodules.sync_freeze = FFSynchronizer(self._control.f.freeze.data, freeze, o_domain=domain)
+        m.submodules.sync_shift = FFSynchronizer(self._control.f.shift.data, shift, o_domain=domain)
+        m.submodules.sync_snapshot = sync_snapshot = RequestSynchronizer(o_domain=domain)
+        m.submodules.sync_clear = sync_clear = RequestSynchronizer(o_domain=domain)
+        m.d.comb += [
+            sync_snapshot.i.eq(self._control.f.snapshot.w_stb & self._control.f.snapshot.w_data),
+            sync_clear.i.eq(self._control.f.clear.w_stb & self._control.f.clear.w_data),
+            self._control.f.busy.r_data.eq(sync_snapshot.busy | sync_clear.busy),
+        ]
+
+        now = Signal(32)
+        m.d[domain] += now.eq(now + 1)
+
+        # The histograms are swept to zero after reset and on clear
+        clearing = Signal(init=1)
+        clear_bin = Signal(range(self._bins))
+        with m.If(sync_clear.o):
+            m.d[domain] += [
+                clearing.eq(1),
+                clear_bin.eq(0),
+            ]
+        with m.Elif(clearing):
+            m.d[domain] += clear_bin.eq(clear_bin + 1)
+            with m.If(clear_bin == self._bins - 1):
+                m.d[domain] += clearing.eq(0)
+
+        ar = self.bus.read_address
+        r = self.bus.read
+        aw = self.bus.write_address
+        b = self.bus.write_response
+        transactions = {
+            "read": (ar.valid & ar.ready, ar.id, r.valid & r.ready & r.last, r.id),
+            "write": (aw.valid & aw.ready, aw.id, b.valid & b.ready, b.id),
+        }
+
+        hist_data = []
+        for direction, (start, start_id, end, end_id) in transactions.items():
+            done, latency = self._time(m, direction, start, start_id, end, end_id, now)
+            counted = done & ~freeze & ~clearing
+
+            scaled = Signal(32)
+            bin = Signal(range(self._bins))
+            m.d.comb += scaled.eq(latency >> shift)
+            for i in range(1, self._bins):
+                with m.If(scaled[i - 1:].any()):
+                    m.d.comb += bin.eq(i)
+
+            hist_data.append(_histogram(
+                m, f"{direction}_hist", depth=self._bins, domain=domain,
+                bin=bin, count=counted, clearing=clearing, clear_bin=clear_bin,
+                host_bin=self._hist_select.f.bin.data,
+            ))
+
+            count_reg, total_reg, min_reg, max_reg = self._stats[direction]
+            count = Signal(32)
+            total = Signal(64)
+            minimum = Signal(32, init=~0)
+            maximum = Signal(32)
+            with m.If(clearing):
+                m.d[domain] += [
+                    count.eq(0),
+                    total.eq(0),
+                    minimum.eq(~0),
+                    maximum.eq(0),
+                ]
+            with m.Elif(counted):
+                m.d[domain] += [
+                    count.eq(count + 1),
+                    total.eq(total + latency),
+                ]
+                with m.If(latency < minimum):
+                    m.d[domain] += minimum.eq(latency)
+                with m.If(latency > maximum):
+                    m.d[domain] += maximum.eq(latency)
+
+            for reg, value in ((count_reg, count), (total_reg, total), (min_reg, minimum), (max_reg, maximum)):
+                snapshot = Signal.like(value)
+                with m.If(sync_snapshot.o):
+                    m.d[domain] += snapshot.eq(value)
+                m.d.comb += reg.f.value.r_data.eq(snapshot)
+
+        m.d.comb += self._hist_data.f.value.r_data.eq(
+            Mux(self._hist_select.f.write.data, hist_data[1], hist_data[0])
+        )
+
+        return m
+
+    def _time(self, m, name, start, start_id, end, end_id, now):
+        # The start time of each transaction goes into a FIFO per ID, responses to an ID come back in
+        # order. A transaction that doesn't fit is skipped, and so are the later ones of its ID until
+        # its response went by, they'd be matched with the wrong start times otherwise.
+        domain = self._domain
+        ids = 1 << len(start_id)
+        depth = self._depth
+
+        heads = [Signal(range(depth), name=f"{name}_head_{i}") for i in range(ids)]
+        tails = [Signal(range(depth), name=f"{name}_tail_{i}") for i in range(ids)]
+        counts = [Signal(range(depth + 1), name=f"{name}_count_{i}") for i in range(ids)]
+        skips = [Signal(8, name=f"{name}_skip_{i}") for i in range(ids)]
+
+        stamps = Memory(shape=32, depth=ids * depth, init=[])
+        m.submodules[f"{name}_stamps"] = stamps
+        stamp_wr = stamps.write_port(domain=domain)
+        stamp_rd = stamps.read_port(domain=domain)
+
+        push = start & (Array(counts)[start_id] != depth) & (Array(skips)[start_id] == 0)
+        skip = start & ~push
+        pop = end & (Array(counts)[end_id] != 0)
+        unskip = end & ~pop
+        m.d.comb += [
+            stamp_wr.addr.eq(Cat(Array(tails)[start_id], start_id)),
+            stamp_wr.data.eq(now),
+            stamp_wr.en.eq(push),
+            stamp_rd.addr.eq(Cat(Array(heads)[end_id], end_id)),
+        ]
+        for i in range(ids):
+            pushed = push & (start_id == i)
+            popped = pop & (end_id == i)
+            m.d[domain] += [
+                counts[i].eq(counts[i] + pushed - popped),
+                skips[i].eq(skips[i] + (skip & (start_id == i)) - (unskip & (end_id == i) & (skips[i] != 0))),
+            ]
+            with m.If(pushed):
+                m.d[domain] += tails[i].eq(tails[i] + 1)
+            with m.If(popped):
+                m.d[domain] += heads[i].eq(heads[i] + 1)
+
+        # The start time comes out of the FIFO the cycle after the response
+        done = Signal()
+        latency = Signal(32)
+        m.d[domain] += done.eq(pop)
+        m.d.comb += latency.eq(now - stamp_rd.data - 1)
+        return done, latency
+
+
+class FetchProfiler(wiring.Component):
+    # Samples the addresses of the reads seen on `bus` into a histogram of `buckets` counters, bucket
+    # n counting the addresses from base + (n << shift) up, and one more bucket after the last one
+    # counting the samples outside of them. Only reads whose ID matches id_match on the bits of
+    # id_mask are sampled, and with fetch_only only instruction fetches (AxPROT[2]). After a sample
+    # the profiler lets `interval` cycles go by, then samples the next read that passes the filters,
+    # with an interval of 0 every one of them is counted.
+    # The histogram is read live, one bucket at a time through select and data. It's cleared on reset
+    # of `domain` and by clear, which takes `buckets` + 1 cycles, busy stays high from a clear
+    # write until it's been taken up in `domain`. The other registers are only meant to be changed
+    # while disabled.
+    class Control(csr.Register, access="rw"):
+        enable: csr.Field(csr.action.RW, 1)
+        clear: csr.Field(csr.action.W, 1)
+        fetch_only: csr.Field(csr.action.RW, 1, init=1)
+        busy: csr.Field(csr.action.R, 1)
+        _pad0: csr.Field(csr.action.ResR0WA, 4)
+        shift: csr.Field(csr.action.RW, 5, init=2)
+
+    class Interval(csr.Register, access="rw"):
+        cycles: csr.Field(csr.action.RW, 32)
+
+    class Base(csr.Register, access="rw"):
+        address: csr.Field(csr.action.RW, 32)
+
+    class IdFilter(csr.Register, access="rw"):
+        match: csr.Field(csr.action.RW, 16)
+        mask: csr.Field(csr.action.RW, 16)
+
+    class Select(csr.Register, access="rw"):
+        bucket: csr.Field(csr.action.RW, 16)
+
+    class Data(csr.Register, access="r"):
+        count: csr.Field(csr.action.R, 32)
+
+    def __init__(self, signature, *, buckets: int = 1024, domain: str = "sync"):
+        if buckets < 1 or buckets >= 0xffff:
+            raise ValueError(f"Bucket count must be from 1 to 65534, not {buckets!r}")
+        self._buckets = buckets
+        self._domain = domain
+        super().__init__({
+            "bus": In(tap_signature(signature)),
+        })
+
+        regs = csr.Builder(addr_width=3, data_width=32)
+
+        self._control = regs.add("control", self.Control())
+        self._interval = regs.add("interval", self.Interval())
+        self._base = regs.add("base", self.Base())
+        self._id_filter = regs.add("id_filter", self.IdFilter())
+        self._select = regs.add("select", self.Select())
+        self._data = regs.add("data", self.Data())
+
+        self._bridge = csr.Bridge(regs.as_memory_map())
+        self.csr_bus = self._bridge.bus
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.bridge = self._bridge
+
+        domain = self._domain
+        enable = Signal()
+        fetch_only = Signal()
+        shift = Signal(5)
+        interval = Signal(32)
+        base = Signal(32)
+        id_match = Signal(16)
+        id_mask = Signal(16)
+        for name, i, o in (
+            ("enable", self._control.f.enable.data, enable),
+            ("fetch_only", self._control.f.fetch_only.data, fetch_only),
+            ("shift", self._control.f.shift.data, shift),
+            ("interval", self._interval.f.cycles.data, interval),
+            ("base", self._base.f.address.data, base),
+            ("id_match", self._id_filter.f.match.data, id_match),
+            ("id_mask", self._id_filter.f.mask.data, id_mask),
+        ):
+            m.submodules[f"sync_{name}"] = FFSynchronizer(i, o, o_domain=domain)
+        m.submodules.sync_clear = sync_clear = RequestSynchronizer(o_domain=domain)
+        m.d.comb += [
+            sync_clear.i.eq(self._control.f.clear.w_stb & self._control.f.clear.w_data),
+            self._control.f.busy.r_data.eq(sync_clear.busy),
+        ]
+
+        # The histogram is swept to zero after reset and on clear
+        clearing = Signal(init=1)
+        clear_bucket = Signal(range(self._buckets + 1))
+        with m.If(sync_clear.o):
+            m.d[domain] += [
+                clearing.eq(1),
+                clear_bucket.eq(0),
+            ]
+        with m.Elif(clearing):
+            m.d[domain] += clear_bucket.eq(clear_bucket + 1)
+            with m.If(clear_bucket == self._buckets):
+                m.d[domain] += clearing.eq(0)
+
+        ar = self.bus.read_address
+        wait = Signal(32)
+        sample = Signal()
+        m.d.comb += sample.eq(
+            enable & ~clearing & (wait == 0) &
+            ar.valid & ar.ready &
+            (((ar.id ^ id_match) & id_mask) == 0) &
+            (~fetch_only | ar.prot[2])
+        )
+        with m.If(sample):
+            m.d[domain] += wait.eq(interval)
+        with m.Elif(wait != 0):
+            m.d[domain] += wait.eq(wait - 1)
+
+        offset = Signal(32)
+        bucket = Signal(range(self._buckets + 1))
+        m.d.comb += offset.eq((ar.addr - base)[:32] >> shift)
+        with m.If(offset < self._buckets):
+            m.d.comb += bucket.eq(offset)
+        with m.Else():
+            m.d.comb += bucket.eq(self._buckets)
+
+        m.d.comb += self._data.f.count.r_data.eq(_histogram(
+            m, "hist", depth=self._buckets + 1, domain=domain,
+            bin=bucket, count=sample, clearing=clearing, clear_bin=clear_bucket,
+            host_bin=self._select.f.bucket.data,
+        ))
+
+        return m
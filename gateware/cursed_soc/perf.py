@@ -0,0 +1,124 @@
+from amaranth import *
+from amaranth.lib import wiring
+from amaranth.lib.cdc import FFSynchronizer
+from amaranth.lib.wiring import In, Out
+from amaranth_soc import csr
+
+
+__all__ = ["RequestSynchronizer", "PerfCounters"]
+
+
+class RequestSynchronizer(wiring.Component):
+    # Brings a pulse on `i` over to a pulse on `o` in `o_domain` like a PulseSynchronizer, with
+    # `busy` high in `i_domain` until it's been given, so the requester can tell when it's done.
+    # The request is a level, one made while `o_domain` is stopped waits for its clock, and one
+    # made while busy is given right after. A reset of `o_domain` may give an extra pulse.
+    i: In(1)
+    o: Out(1)
+    busy: Out(1)
+
+    def __init__(self, *, i_domain: str = "sync", o_domain: str):
+        self._i_domain = i_domain
+        self._o_domain = o_domain
+        super().__init__()
+
+    def elaborate(self, platform):
+        m = Module()
+
+        request = Signal()
+        request_sync = Signal()
+        done = Signal()
+        done_sync = Signal()
+        again = Signal()
+        m.submodules.sync_request = FFSynchronizer(request, request_sync, o_domain=self._o_domain)
+        m.submodules.sync_done = FFSynchronizer(done, done_sync, o_domain=self._i_domain)
+
+        with m.If(request == done_sync):
+            with m.If(self.i | again):
+                m.d[self._i_domain] += [
+                    request.eq(~request),
+                    again.eq(0),
+                ]
+        with m.Elif(self.i):
+            m.d[self._i_domain] += again.eq(1)
+        m.d.comb += self.busy.eq((request != done_sync) | again)
+
+        m.d[self._o_domain] += done.eq(request_sync)
+        m.d.comb += self.o.eq(request_sync != done)
+
+        return m
+
+
+class PerfCounters(wiring.Component):
+    # Counts the cycles of `domain`, the cycles each of the `events` strobes is high, and keeps the
+    # highest value seen on each of the `levels`, all of it from the last clear or reset of `domain`.
+    # The registers hold a snapshot of the counters, taken all at once by writing snapshot, so they
+    # can be read one by one and still agree with each other. Counting stops while frozen.
+    # The CSRs are in the sync domain, `domain` may be any other clock, even a stopped one: busy
+    # stays high from a snapshot or clear write until it's been done in `domain`.
+    def __init__(self, *, events: tuple, levels: dict, domain: str = "sync"):
+        self._events = tuple(events)
+        self._levels = dict(levels)
+        self._domain = domain
+        super().__init__({
+            "events": In(wiring.Signature({name: wiring.Out(1) for name in self._events})),
+            "levels": In(wiring.Signature({name: wiring.Out(width) for name, width in self._levels.items()})),
+        })
+
+        class Control(csr.Register, access="rw"):
+            freeze: csr.Field(csr.action.RW, 1)
+            snapshot: csr.Field(csr.action.W, 1)
+            clear: csr.Field(csr.action.W, 1)
+            busy: csr.Field(csr.action.R, 1)
+
+        class Cycles(csr.Register, access="r"):
+            count: csr.Field(csr.action.R, 64)
+
+        class Count(csr.Register, access="r"):
+            count: csr.Field(csr.action.R, 32)
+
+        regs = csr.Builder(addr_width=5, data_width=32)
+
+        self._control = regs.add("control", Control())
+        self._cycles = regs.add("cycles", Cycles())
+        self._counts = {name: regs.add(name, Count()) for name in self._events}
+        self._maxima = {name: regs.add(f"{name}_max", Count()) for name in self._levels}
+
+        self._bridge = csr.Bridge(regs.as_memory_map())
+        self.csr_bus = self._bridge.bus
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.bridge = self._bridge
+
+        freeze = Signal()
+        m.submodules.sync_freeze = FFSynchronizer(self._control.f.freeze.data, freeze, o_domain=self._domain)
+        m.submodules.sync_snapshot = sync_snapshot = RequestSynchronizer(o_domain=self._domain)
+        m.submodules.sync_clear = sync_clear = RequestSynchronizer(o_domain=self._domain)
+        m.d.comb += [
+            sync_snapshot.i.eq(self._control.f.snapshot.w_stb & self._control.f.snapshot.w_data),
+            sync_clear.i.eq(self._control.f.clear.w_stb & self._control.f.clear.w_data),
+            self._control.f.busy.r_data.eq(sync_snapshot.busy | sync_clear.busy),
+        ]
+
+        def counter(reg, value, width):
+            live = Signal(width)
+            snapshot = Signal(width)
+            with m.If(sync_clear.o):
+                m.d[self._domain] += live.eq(0)
+            with m.Elif(~freeze):
+                m.d[self._domain] += live.eq(value(live))
+            with m.If(sync_snapshot.o):
+                m.d[self._domain] += snapshot.eq(live)
+            m.d.comb += reg.f.count.r_data.eq(snapshot)
+
+        counter(self._cycles, lambda live: live + 1, 64)
+        for name, reg in self._counts.items():
+            event = getattr(self.events, name)
+            counter(reg, lambda live, event=event: live + event, 32)
+        for name, reg in self._maxima.items():
+            level = getattr(self.levels, name)
+            counter(reg, lambda live, level=level: Mux(level > live, level, live), 32)
+
+        return m
@@ -0,0 +1,175 @@
+from amaranth import *
+from amaranth.lib import wiring
+from amaranth.lib.wiring import In, Out
+from .zynq_ifaces import SAxiHP
+
+
+__all__ = ["MailboxRing"]
+
+
+AXI_BURST_INCR = 0b01
+AXI_RESP_OKAY = 0b00
+
+
+def _min(a, b):
+    return Mux(a < b, a, b)
+
+
+class MailboxRing(wiring.Component):
+    # Feeds the mailbox FIFOs from and to two rings of 32-bit words in DDR. The pointers are
+    # free-running word counters, a ring holds head - tail words:
+    #   tx : ARM -> RISC-V, the host stores words at tx_head and bumps it, the fabric pushes them
+    #        into the FIFO and advances tx_tail
+    #   rx : RISC-V -> ARM, the fabric pops the FIFO into the ring at rx_head and advances it once
+    #        the write response is back, the host consumes the words at rx_tail and bumps it
+    # Both rings are 1 << size_log2 words, with size_log2 >= 4, and based on a 64 byte boundary, so
+    # a burst kept within a 16 word block never wraps around the ring or crosses 4KiB.
+    # While disabled the fabric pointers follow the host ones, enabling starts with empty rings.
+    bus: Out(SAxiHP)
+    config: In(wiring.Signature({
+        "enable": Out(1),
+        "size_log2": Out(5),
+        "tx_base": Out(32),
+        "tx_head": Out(32),
+        "tx_tail": In(32),
+        "rx_base": Out(32),
+        "rx_head": In(32),
+        "rx_tail": Out(32),
+        "error": In(1),
+    }))
+    read: In(wiring.Signature({
+        "data": Out(32),
+        "valid": Out(1),
+        "ready": In(1),
+        "level": Out(16),
+    }))
+    write: Out(wiring.Signature({
+        "data": Out(32),
+        "valid": Out(1),
+        "ready": In(1),
+        "space": In(16),
+    }))
+
+    def elaborate(self, platform):
+        m = Module()
+
+        ar = self.bus.read_address
+        r = self.bus.read
+        aw = self.bus.write_address
+        w = self.bus.write_data
+        b = self.bus.write_response
+        m.d.comb += self.bus.aclk.eq(ClockSignal())
+
+        mask = Signal(32)
+        m.d.comb += mask.eq((Const(1, 32) << self.config.size_log2) - 1)
+
+        tx_tail = Signal(32)
+        rx_head = Signal(32)
+        error = Signal()
+        m.d.comb += [
+            self.config.tx_tail.eq(tx_tail),
+            self.config.rx_head.eq(rx_head),
+            self.config.error.eq(error),
+        ]
+
+        # Words are moved with 32-bit beats, on the lane picked by bit 2 of their address
+        m.d.comb += [
+            ar.size.eq(0b10),
+            ar.burst.eq(AXI_BURST_INCR),
+            aw.size.eq(0b10),
+            aw.burst.eq(AXI_BURST_INCR),
+        ]
+
+        tx_avail = Signal(32)
+        tx_len = Signal(range(17))
+        m.d.comb += [
+            tx_avail.eq(self.config.tx_head - tx_tail),
+            tx_len.eq(_min(_min(tx_avail, self.write.space), 16 - tx_tail[:4])),
+        ]
+        tx_lane = Signal()
+
+        # The FIFO space is checked before the read is issued and nothing else pushes while the ring
+        # is in use, so the read data is never held up
+        with m.FSM(name="tx") as tx_fsm:
+            with m.State("IDLE"):
+                with m.If(self.config.enable & ~error & (tx_len != 0)):
+                    m.d.sync += [
+                        ar.addr.eq(self.config.tx_base + ((tx_tail & mask) << 2)),
+                        ar.len.eq(tx_len - 1),
+                        tx_lane.eq(tx_tail[0]),
+                    ]
+                    m.next = "ADDRESS"
+            with m.State("ADDRESS"):
+                m.d.comb += ar.valid.eq(1)
+                with m.If(ar.ready):
+                    m.next = "DATA"
+            with m.State("DATA"):
+                m.d.comb += [
+                    r.ready.eq(1),
+                    self.write.data.eq(Mux(tx_lane, r.data[32:], r.data[:32])),
+                    self.write.valid.eq(r.valid & (r.resp == AXI_RESP_OKAY) & ~error),
+                ]
+                with m.If(r.valid):
+                    m.d.sync += tx_lane.eq(~tx_lane)
+                    with m.If(r.resp != AXI_RESP_OKAY):
+                        m.d.sync += error.eq(1)
+                    with m.Elif(~error):
+                        m.d.sync += tx_tail.eq(tx_tail + 1)
+                    with m.If(r.last):
+                        m.next = "IDLE"
+
+        rx_space = Signal(32)
+        rx_len = Signal(range(17))
+        m.d.comb += [
+            rx_space.eq(mask + 1 - (rx_head - self.config.rx_tail)),
+            rx_len.eq(_min(_min(self.read.level, rx_space), 16 - rx_head[:4])),
+        ]
+        rx_lane = Signal()
+        rx_beat = Signal(4)
+
+        with m.FSM(name="rx") as rx_fsm:
+            with m.State("IDLE"):
+                with m.If(self.config.enable & ~error & (rx_len != 0)):
+                    m.d.sync += [
+                        aw.addr.eq(self.config.rx_base + ((rx_head & mask) << 2)),
+                        aw.len.eq(rx_len - 1),
+                        rx_lane.eq(rx_head[0]),
+                        rx_beat.eq(0),
+                    ]
+                    m.next = "ADDRESS"
+            with m.State("ADDRESS"):
+                m.d.comb += aw.valid.eq(1)
+                with m.If(aw.ready):
+                    m.next = "DATA"
+            with m.State("DATA"):
+                m.d.comb += [
+                    w.valid.eq(self.read.valid),
+                    w.data.eq(Cat(self.read.data, self.read.data)),
+                    w.strb.eq(Mux(rx_lane, 0xF0, 0x0F)),
+                    w.last.eq(rx_beat == aw.len),
+                    self.read.ready.eq(w.ready & self.read.valid),
+                ]
+                with m.If(w.valid & w.ready):
+                    m.d.sync += [
+                        rx_lane.eq(~rx_lane),
+                        rx_beat.eq(rx_beat + 1),
+                    ]
+                    with m.If(w.last):
+                        m.next = "RESPONSE"
+            with m.State("RESPONSE"):
+                m.d.comb += b.ready.eq(1)
+                with m.If(b.valid):
+                    with m.If(b.resp == AXI_RESP_OKAY):
+                        m.d.sync += rx_head.eq(rx_head + aw.len + 1)
+                    with m.Else():
+                        m.d.sync += error.eq(1)
+                    m.next = "IDLE"
+
+        with m.If(~self.config.enable & tx_fsm.ongoing("IDLE") & rx_fsm.ongoing("IDLE")):
+            m.d.sync += [
+                tx_tail.eq(self.config.tx_head),
+                rx_head.eq(self.config.rx_tail),
+                error.eq(0),
+            ]
+
+        return m
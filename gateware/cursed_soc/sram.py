@@ -0,0 +1,49 @@
+from amaranth import *
+from amaranth.lib import wiring
+from amaranth.lib.memory import Memory
+from amaranth.lib.wiring import In
+from amaranth.utils import exact_log2
+from amaranth_soc import wishbone
+from amaranth_soc.memory import MemoryMap
+
+
+__all__ = ["SharedMemory"]
+
+
+class SharedMemory(wiring.Component):
+    # A true dual port BRAM, `host_bus` in the sync domain for the ARM and `cpu_bus` in `cpu_domain`
+    # for the RISC-V. Both ports take one cycle per access. Writing the same word from both sides
+    # in the same cycle leaves either value, there's no arbitration.
+    def __init__(self, *, size: int = 8192, cpu_domain: str = "sync", prefix: tuple = ()):
+        if size < 4 or size & (size - 1):
+            raise ValueError(f"Size must be a power of two of at least 4 bytes, not {size!r}")
+        self._depth = size // 4
+        self._cpu_domain = cpu_domain
+        super().__init__({
+            "host_bus": In(wishbone.Signature(addr_width=exact_log2(self._depth), data_width=32, granularity=8)),
+            "cpu_bus": In(wishbone.Signature(addr_width=exact_log2(self._depth), data_width=32, granularity=8)),
+        })
+        for bus in (self.host_bus, self.cpu_bus):
+            bus.memory_map = MemoryMap(addr_width=exact_log2(size), data_width=8)
+            bus.memory_map.add_resource(self, name=prefix + ("shared_memory",), size=size)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.memory = memory = Memory(shape=32, depth=self._depth, init=[])
+
+        for bus, domain in ((self.host_bus, "sync"), (self.cpu_bus, self._cpu_domain)):
+            read_port = memory.read_port(domain=domain)
+            write_port = memory.write_port(domain=domain, granularity=8)
+            access = bus.cyc & bus.stb & ~bus.ack
+            m.d.comb += [
+                read_port.addr.eq(bus.adr),
+                write_port.addr.eq(bus.adr),
+                write_port.data.eq(bus.dat_w),
+                bus.dat_r.eq(read_port.data),
+            ]
+            with m.If(access & bus.we):
+                m.d.comb += write_port.en.eq(bus.sel)
+            m.d[domain] += bus.ack.eq(access)
+
+        return m
@@ -0,0 +1,106 @@
+from amaranth import *
+from amaranth.lib import wiring
+from amaranth.lib.cdc import FFSynchronizer
+from amaranth.lib.wiring import In, Out
+from amaranth_soc import csr
+
+
+__all__ = ["Timestamp", "TimestampSynchronizer", "TimestampTimer"]
+
+
+class Timestamp(wiring.Component):
+    # A free-running count of sync cycles since reset, the time base shared by the host and the
+    # cores. The host reads it from `csr_bus`, reading the low word latches the high one, so the
+    # two words always belong together.
+    count: Out(64)
+
+    class Count(csr.Register, access="r"):
+        count: csr.Field(csr.action.R, 64)
+
+    def __init__(self):
+        super().__init__()
+
+        regs = csr.Builder(addr_width=1, data_width=32)
+
+        self._count = regs.add("count", self.Count())
+
+        self._bridge = csr.Bridge(regs.as_memory_map())
+        self.csr_bus = self._bridge.bus
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.bridge = self._bridge
+
+        m.d.sync += self.count.eq(self.count + 1)
+        m.d.comb += self._count.f.count.r_data.eq(self.count)
+
+        return m
+
+
+class TimestampSynchronizer(wiring.Component):
+    # Brings a count from Timestamp over to `o_domain`, through a Gray code so whatever value gets
+    # sampled is one the count actually had, a few cycles late.
+    i: In(64)
+    o: Out(64)
+
+    def __init__(self, *, o_domain: str):
+        self._o_domain = o_domain
+        super().__init__()
+
+    def elaborate(self, platform):
+        m = Module()
+
+        gray = Signal(64)
+        m.d.sync += gray.eq(self.i ^ (self.i >> 1))
+
+        gray_sync = Signal(64)
+        m.submodules.sync_gray = FFSynchronizer(gray, gray_sync, o_domain=self._o_domain)
+
+        binary = Signal(64)
+        m.d.comb += binary[63].eq(gray_sync[63])
+        for i in reversed(range(63)):
+            m.d.comb += binary[i].eq(binary[i + 1] ^ gray_sync[i])
+        m.d[self._o_domain] += self.o.eq(binary)
+
+        return m
+
+
+class TimestampTimer(wiring.Component):
+    # The cores' view of the timestamp, `count` already in their domain. Like the host, reading the
+    # low word of time latches the high one, and compare takes effect once its high word is
+    # written. While enabled, `irq` stays high as long as time >= compare, moving compare past
+    # time or disabling it acknowledges the interrupt.
+    count: In(64)
+    irq: Out(1)
+
+    class Control(csr.Register, access="rw"):
+        enable: csr.Field(csr.action.RW, 1)
+
+    class Time(csr.Register, access="r"):
+        count: csr.Field(csr.action.R, 64)
+
+    class Compare(csr.Register, access="rw"):
+        count: csr.Field(csr.action.RW, 64)
+
+    def __init__(self):
+        super().__init__()
+
+        regs = csr.Builder(addr_width=3, data_width=32)
+
+        self._time = regs.add("time", self.Time())
+        self._compare = regs.add("compare", self.Compare())
+        self._control = regs.add("control", self.Control())
+
+        self._bridge = csr.Bridge(regs.as_memory_map())
+        self.csr_bus = self._bridge.bus
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.bridge = self._bridge
+
+        m.d.comb += self._time.f.count.r_data.eq(self.count)
+        m.d.sync += self.irq.eq(self._control.f.enable.data & (self.count >= self._compare.f.count.data))
+
+        return m
@@ -0,0 +1,237 @@
+from amaranth import *
+from amaranth.lib import wiring
+from amaranth.lib.cdc import FFSynchronizer
+from amaranth.lib.fifo import AsyncFIFO, SyncFIFO
+from amaranth.lib.wiring import In, Out
+from amaranth_soc import csr
+from .axi import AXI_BURST_INCR, AXI_RESP_OKAY
+from .monitor import tap_signature
+from .zynq_ifaces import SAxiHP
+
+
+__all__ = ["AxiTrace"]
+
+
+class AxiTrace(wiring.Component):
+    # Records the transfers seen on `tap` in `domain` into a ring of 16 byte records in DDR, written
+    # through `bus` in sync. One record per AR, AW, B and last R beat:
+    #   bytes 0-7   : timestamp, in `domain` cycles since its reset
+    #   bytes 8-11  : address of an AR or AW, 0 otherwise
+    #   bytes 12-15 : channel (AR 0, AW 1, R 2, B 3) in bits 0-1, resp in 2-3, len in 4-7, ID in
+    #                 8-19, and in 24-31 the number of records of the same channel lost just before
+    #                 this one, saturated
+    # Records are written in timestamp order, then channel order. The pointers are free-running record counters
+    # like the mailbox rings, the fabric writes at head and the host consumes at tail, records that
+    # find the ring full are lost. The ring is 1 << size_log2 records, based on a 16 byte boundary.
+    # Recording runs while enabled, and when armed only from the first AR or AW whose address
+    # matches trigger_address on the bits of trigger_mask. While disabled the head follows the tail.
+    class Control(csr.Register, access="rw"):
+        enable: csr.Field(csr.action.RW, 1)
+        arm: csr.Field(csr.action.RW, 1)
+        triggered: csr.Field(csr.action.R, 1)
+        # Records were lost since the trace was enabled
+        overflow: csr.Field(csr.action.R, 1)
+        error: csr.Field(csr.action.R, 1)
+        _pad0: csr.Field(csr.action.ResR0WA, 3)
+        size_log2: csr.Field(csr.action.RW, 5, init=8)
+
+    class Address(csr.Register, access="rw"):
+        address: csr.Field(csr.action.RW, 32)
+
+    class HostPointer(csr.Register, access="rw"):
+        pointer: csr.Field(csr.action.RW, 32)
+
+    class FabricPointer(csr.Register, access="r"):
+        pointer: csr.Field(csr.action.R, 32)
+
+    def __init__(self, signature, *, domain: str = "sync", depth: int = 16):
+        self._domain = domain
+        self._depth = depth
+        super().__init__({
+            "tap": In(tap_signature(signature)),
+            "bus": Out(SAxiHP),
+        })
+
+        regs = csr.Builder(addr_width=3, data_width=32)
+
+        self._control = regs.add("control", self.Control())
+        self._base = regs.add("base", self.Address())
+        self._head = regs.add("head", self.FabricPointer())
+        self._tail = regs.add("tail", self.HostPointer())
+        self._trigger_address = regs.add("trigger_address", self.Address())
+        self._trigger_mask = regs.add("trigger_mask", self.Address())
+
+        self._bridge = csr.Bridge(regs.as_memory_map())
+        self.csr_bus = self._bridge.bus
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.bridge = self._bridge
+
+        domain = self._domain
+        enable = Signal()
+        arm = Signal()
+        trigger_address = Signal(32)
+        trigger_mask = Signal(32)
+        m.submodules.sync_enable = FFSynchronizer(self._control.f.enable.data, enable, o_domain=domain)
+        m.submodules.sync_arm = FFSynchronizer(self._control.f.arm.data, arm, o_domain=domain)
+        m.submodules.sync_trigger_address = FFSynchronizer(
+            self._trigger_address.f.address.data, trigger_address, o_domain=domain)
+        m.submodules.sync_trigger_mask = FFSynchronizer(
+            self._trigger_mask.f.address.data, trigger_mask, o_domain=domain)
+
+        timestamp = Signal(64)
+        m.d[domain] += timestamp.eq(timestamp + 1)
+
+        ar = self.tap.read_address
+        r = self.tap.read
+        aw = self.tap.write_address
+        b = self.tap.write_response
+        # (event, address, len, id, resp) per channel
+        channels = [
+            (ar.valid & ar.ready, ar.addr, ar.len, ar.id, 0),
+            (aw.valid & aw.ready, aw.addr, aw.len, aw.id, 0),
+            (r.valid & r.ready & r.last, 0, 0, r.id, r.resp),
+            (b.valid & b.ready, 0, 0, b.id, b.resp),
+        ]
+
+        def matches(address):
+            return ((address ^ trigger_address) & trigger_mask) == 0
+
+        triggered = Signal()
+        hit = Signal()
+        m.d.comb += hit.eq(arm & ~triggered & (
+            (ar.valid & ar.ready & matches(ar.addr)) |
+            (aw.valid & aw.ready & matches(aw.addr))
+        ))
+        with m.If(~enable):
+            m.d[domain] += triggered.eq(0)
+        with m.Elif(hit):
+            m.d[domain] += triggered.eq(1)
+        recording = Signal()
+        m.d.comb += recording.eq(enable & (~arm | triggered | hit))
+
+        # Each channel queues its own records, so transfers on several channels in the same cycle
+        # are all kept, they're then merged oldest first into the FIFO to the sync domain. Records
+        # are only ever lost on the way into a channel queue, which counts them into the next one
+        # it takes.
+        m.submodules.records = records = AsyncFIFO(width=128, depth=self._depth, w_domain=domain, r_domain="sync")
+        overflow = Signal()
+        dropped = []
+        queues = []
+        for n, (event, address, length, transaction_id, resp) in enumerate(channels):
+            queue = DomainRenamer(domain)(SyncFIFO(width=128, depth=4))
+            m.submodules[f"queue_{n}"] = queue
+            record = Signal(128, name=f"record_{n}")
+            lost = Signal(8, name=f"lost_{n}")
+            m.d.comb += [
+                record[:64].eq(timestamp),
+                record[64:96].eq(address),
+                record[96:98].eq(n),
+                record[98:100].eq(resp),
+                record[100:104].eq(length),
+                record[104:116].eq(transaction_id),
+                record[120:128].eq(lost),
+                queue.w_data.eq(record),
+                queue.w_en.eq(event & recording),
+            ]
+            with m.If(~enable | (queue.w_en & queue.w_rdy)):
+                m.d[domain] += lost.eq(0)
+            with m.Elif(queue.w_en & (lost != 0xff)):
+                m.d[domain] += lost.eq(lost + 1)
+            dropped.append(queue.w_en & ~queue.w_rdy)
+            queues.append(queue)
+
+        for n, queue in enumerate(queues):
+            # Ties go to the lowest channel
+            oldest = queue.r_rdy
+            for k, other in enumerate(queues):
+                if k < n:
+                    oldest &= ~other.r_rdy | (queue.r_data[:64] < other.r_data[:64])
+                elif k > n:
+                    oldest &= ~other.r_rdy | (queue.r_data[:64] <= other.r_data[:64])
+            with m.If(~enable):
+                m.d.comb += queue.r_en.eq(1)
+            with m.Elif(oldest & records.w_rdy):
+                m.d.comb += [
+                    records.w_data.eq(queue.r_data),
+                    records.w_en.eq(1),
+                    queue.r_en.eq(1),
+                ]
+
+        with m.If(~enable):
+            m.d[domain] += overflow.eq(0)
+        with m.Elif(Cat(dropped).any()):
+            m.d[domain] += overflow.eq(1)
+
+        m.submodules.sync_triggered = FFSynchronizer(triggered, self._control.f.triggered.r_data)
+        m.submodules.sync_overflow = FFSynchronizer(overflow, self._control.f.overflow.r_data)
+
+        aw = self.bus.write_address
+        w = self.bus.write_data
+        b = self.bus.write_response
+        m.d.comb += self.bus.aclk.eq(ClockSignal())
+
+        mask = Signal(32)
+        m.d.comb += mask.eq((Const(1, 32) << self._control.f.size_log2.data) - 1)
+
+        head = Signal(32)
+        error = Signal()
+        m.d.comb += [
+            self._head.f.pointer.r_data.eq(head),
+            self._control.f.error.r_data.eq(error),
+        ]
+
+        # A record is a burst of two 64-bit beats
+        m.d.comb += [
+            aw.size.eq(0b11),
+            aw.burst.eq(AXI_BURST_INCR),
+            aw.len.eq(1),
+            w.strb.eq(0xff),
+        ]
+
+        full = Signal()
+        m.d.comb += full.eq(head - self._tail.f.pointer.data == mask + 1)
+        beat = Signal()
+
+        with m.FSM() as fsm:
+            with m.State("IDLE"):
+                with m.If(self._control.f.enable.data & ~error & records.r_rdy & ~full):
+                    m.d.sync += [
+                        aw.addr.eq(self._base.f.address.data + ((head & mask) << 4)),
+                        beat.eq(0),
+                    ]
+                    m.next = "ADDRESS"
+            with m.State("ADDRESS"):
+                m.d.comb += aw.valid.eq(1)
+                with m.If(aw.ready):
+                    m.next = "DATA"
+            with m.State("DATA"):
+                m.d.comb += [
+                    w.valid.eq(1),
+                    w.data.eq(Mux(beat, records.r_data[64:], records.r_data[:64])),
+                    w.last.eq(beat),
+                ]
+                with m.If(w.ready):
+                    m.d.sync += beat.eq(1)
+                    with m.If(beat):
+                        m.d.comb += records.r_en.eq(1)
+                        m.next = "RESPONSE"
+            with m.State("RESPONSE"):
+                m.d.comb += b.ready.eq(1)
+                with m.If(b.valid):
+                    with m.If(b.resp == AXI_RESP_OKAY):
+                        m.d.sync += head.eq(head + 1)
+                    with m.Else():
+                        m.d.sync += error.eq(1)
+                    m.next = "IDLE"
+
+        with m.If(~self._control.f.enable.data & fsm.ongoing("IDLE")):
+            m.d.comb += records.r_en.eq(1)
+            m.d.sync += [
+                head.eq(self._tail.f.pointer.data),
+                error.eq(0),
+            ]
+
+        return m
@@ -0,0 +1,292 @@
+import unittest
+from amaranth.sim import Simulator
+from cursed_soc.axi_to_wishbone import Axi2Wishbone, PipelinedAxi2Wishbone
+
+
+BURST_FIXED = 0b00
+BURST_INCR = 0b01
+BURST_WRAP = 0b10
+
+OKAY = 0b00
+SLVERR = 0b10
+
+# Words from here on answer with err
+ERR_BASE = 0x100
+
+
+class WishboneMemory:
+    # Answers one cycle after each access, pipelined ones when the bus has stall, and stalls every
+    # third cycle to make the bridge wait
+    def __init__(self, bus, *, pipelined):
+        self.bus = bus
+        self.pipelined = pipelined
+        self.words = {i: 0x1000_0000 + i for i in range(ERR_BASE)}
+        self.accesses = []
+
+    async def run(self, ctx):
+        bus = self.bus
+        stall = False
+        cycle = 0
+        while True:
+            signals = [bus.cyc, bus.stb, bus.we, bus.adr, bus.sel, bus.dat_w, bus.ack, bus.err]
+            *_, cyc, stb, we, adr, sel, dat_w, ack, err = await ctx.tick().sample(*signals)
+            cycle += 1
+            if self.pipelined:
+                request = cyc and stb and not stall
+                stall = cycle % 3 == 0
+                ctx.set(bus.stall, stall)
+            else:
+                request = cyc and stb and not (ack or err)
+            ack = err = False
+            if request:
+                self.accesses.append((we, adr, sel))
+                if adr >= ERR_BASE:
+                    err = True
+                else:
+                    ack = True
+                    if we:
+                        mask = sum(0xff << 8 * i for i in range(4) if sel & (1 << i))
+                        self.words[adr] = (self.words[adr] & ~mask) | (dat_w & mask)
+                    ctx.set(bus.dat_r, self.words[adr])
+            ctx.set(bus.ack, ack)
+            ctx.set(bus.err, err)
+
+
+async def axi_read(ctx, axi, addr, *, length=1, size=0b10, burst=BURST_INCR, id=0):
+    # Returns the (data, resp, id, last) of every beat
+    ar, r = axi.read_address, axi.read
+    ctx.set(ar.addr, addr)
+    ctx.set(ar.len, length - 1)
+    ctx.set(ar.size, size)
+    ctx.set(ar.burst, burst)
+    ctx.set(ar.id, id)
+    ctx.set(ar.valid, 1)
+    ctx.set(r.ready, 1)
+    beats = []
+    for _ in range(200):
+        _, _, ar_ready, r_valid, *beat = await ctx.tick().sample(
+            ar.ready, r.valid, r.data, r.resp, r.id, r.last)
+        if ar_ready:
+            ctx.set(ar.valid, 0)
+        if r_valid:
+            beats.append(tuple(beat))
+            if beat[-1]:
+                break
+    else:
+        raise AssertionError("read burst timed out")
+    ctx.set(r.ready, 0)
+    return beats
+
+
+async def axi_write(ctx, axi, addr, beats, *, size=0b10, burst=BURST_INCR, id=0):
+    # `beats` are (data, strb), returns the (resp, id) of the burst
+    aw, w, b = axi.write_address, axi.write_data, axi.write_response
+    ctx.set(aw.addr, addr)
+    ctx.set(aw.len, len(beats) - 1)
+    ctx.set(aw.size, size)
+    ctx.set(aw.burst, burst)
+    ctx.set(aw.id, id)
+    ctx.set(aw.valid, 1)
+    ctx.set(b.ready, 1)
+    beat = 0
+    def set_beat():
+        if beat < len(beats):
+            ctx.set(w.data, beats[beat][0])
+            ctx.set(w.strb, beats[beat][1])
+            ctx.set(w.last, beat == len(beats) - 1)
+        ctx.set(w.valid, beat < len(beats))
+    set_beat()
+    for _ in range(200):
+        *_, aw_ready, w_ready, w_valid, b_valid, b_resp, b_id = await ctx.tick().sample(
+            aw.ready, w.ready, w.valid, b.valid, b.resp, b.id)
+        if aw_ready:
+            ctx.set(aw.valid, 0)
+        if w_ready and w_valid:
+            beat += 1
+            set_beat()
+        if b_valid:
+            break
+    else:
+        raise AssertionError("write burst timed out")
+    ctx.set(b.ready, 0)
+    return b_resp, b_id
+
+
+class AxiBridgeTests:
+    # Subclasses set how to build the bridge and what bus it expects
+    pipelined = False
+    drops_after_error = True
+
+    def make_dut(self):
+        raise NotImplementedError
+
+    def run_sim(self, testbench):
+        dut = self.make_dut()
+        memory = WishboneMemory(dut.wishbone, pipelined=self.pipelined)
+        sim = Simulator(dut)
+        sim.add_clock(1e-8)
+        sim.add_testbench(memory.run, background=True)
+        async def run(ctx):
+            await testbench(ctx, dut, memory)
+        sim.add_testbench(run)
+        sim.run()
+
+    def test_incr_read(self):
+        async def testbench(ctx, dut, memory):
+            beats = await axi_read(ctx, dut.axi, 0x40, length=4, id=5)
+            self.assertEqual(beats, [(0x1000_0010 + i, OKAY, 5, i == 3) for i in range(4)])
+        self.run_sim(testbench)
+
+    def test_fixed_read(self):
+        async def testbench(ctx, dut, memory):
+            beats = await axi_read(ctx, dut.axi, 0x20, length=3, burst=BURST_FIXED, id=1)
+            self.assertEqual(beats, [(0x1000_0008, OKAY, 1, i == 2) for i in range(3)])
+            self.assertEqual([adr for _, adr, _ in memory.accesses], [0x8] * 3)
+        self.run_sim(testbench)
+
+    def test_narrow_read(self):
+        async def testbench(ctx, dut, memory):
+            beats = await axi_read(ctx, dut.axi, 0x31, length=3, size=0b00)
+            self.assertEqual([resp for _, resp, _, _ in beats], [OKAY] * 3)
+            self.assertEqual(memory.accesses, [(0, 0xc, 0b0010), (0, 0xc, 0b0100), (0, 0xc, 0b1000)])
+        self.run_sim(testbench)
+
+    def test_read_back_to_back(self):
+        async def testbench(ctx, dut, memory):
+            for i in range(3):
+                beats = await axi_read(ctx, dut.axi, 0x80 + 8 * i, length=2, id=i)
+                self.assertEqual(beats, [(0x1000_0020 + 2 * i, OKAY, i, False),
+                                         (0x1000_0021 + 2 * i, OKAY, i, True)])
+        self.run_sim(testbench)
+
+    def test_read_error(self):
+        async def testbench(ctx, dut, memory):
+            beats = await axi_read(ctx, dut.axi, 4 * ERR_BASE - 8, length=4, id=2)
+            self.assertEqual([(resp, id, last) for _, resp, id, last in beats],
+                             [(OKAY, 2, False), (OKAY, 2, False), (SLVERR, 2, False), (SLVERR, 2, True)])
+        self.run_sim(testbench)
+
+    def test_unsupported_read(self):
+        async def testbench(ctx, dut, memory):
+            beats = await axi_read(ctx, dut.axi, 0x40, length=4, burst=BURST_WRAP, id=3)
+            self.assertEqual([(resp, id, last) for _, resp, id, last in beats],
+                             [(SLVERR, 3, i == 3) for i in range(4)])
+            beats = await axi_read(ctx, dut.axi, 0x42, length=2)
+            self.assertEqual([resp for _, resp, _, _ in beats], [SLVERR] * 2)
+            self.assertEqual(memory.accesses, [])
+            # The bridge still works afterwards
+            self.assertEqual(await axi_read(ctx, dut.axi, 0x40), [(0x1000_0010, OKAY, 0, True)])
+        self.run_sim(testbench)
+
+    def test_incr_write(self):
+        async def testbench(ctx, dut, memory):
+            resp = await axi_write(ctx, dut.axi, 0x40, [
+                (0xaaaa_aaaa, 0b1111),
+                (0xbbbb_bbbb, 0b0011),
+                (0xcccc_cccc, 0b0000),
+                (0xdddd_dddd, 0b1100),
+            ], id=7)
+            self.assertEqual(resp, (OKAY, 7))
+            self.assertEqual(await axi_read(ctx, dut.axi, 0x40, length=4), [
+                (0xaaaa_aaaa, OKAY, 0, False),
+                (0x1000_bbbb, OKAY, 0, False),
+                (0x1000_0012, OKAY, 0, False),
+                (0xdddd_0013, OKAY, 0, True),
+            ])
+            # The beat without any strobe never reaches the bus
+            self.assertEqual([adr for we, adr, _ in memory.accesses if we], [0x10, 0x11, 0x13])
+        self.run_sim(testbench)
+
+    def test_fixed_write(self):
+        async def testbench(ctx, dut, memory):
+            resp = await axi_write(ctx, dut.axi, 0x20, [(0x1111_1111, 0b1111), (0x2222_2222, 0b0001)],
+                                   burst=BURST_FIXED)
+            self.assertEqual(resp, (OKAY, 0))
+            self.assertEqual(await axi_read(ctx, dut.axi, 0x20), [(0x1111_1122, OKAY, 0, True)])
+            self.assertEqual([adr for we, adr, _ in memory.accesses if we], [0x8, 0x8])
+        self.run_sim(testbench)
+
+    def test_write_error(self):
+        async def testbench(ctx, dut, memory):
+            await self.write_expecting_error(ctx, dut, 4 * ERR_BASE - 4, [
+                (0xaaaa_aaaa, 0b1111),
+                (0xbbbb_bbbb, 0b1111),
+                (0xcccc_cccc, 0b1111),
+            ], id=4)
+            self.assertEqual(memory.words[ERR_BASE - 1], 0xaaaa_aaaa)
+            if self.drops_after_error:
+                # The rest of the burst is dropped after the error
+                self.assertEqual([adr for we, adr, _ in memory.accesses if we], [ERR_BASE - 1, ERR_BASE])
+        self.run_sim(testbench)
+
+    def test_unsupported_write(self):
+        async def testbench(ctx, dut, memory):
+            await self.write_expecting_error(ctx, dut, 0x40, [(0xeeee_eeee, 0b1111)] * 4,
+                                             burst=BURST_WRAP, id=6)
+            await self.write_expecting_error(ctx, dut, 0x41, [(0xeeee_eeee, 0b0010)] * 2, size=0b01)
+            self.assertEqual(memory.accesses, [])
+            self.assertEqual(await axi_write(ctx, dut.axi, 0x40, [(0x1234_5678, 0b1111)]), (OKAY, 0))
+            self.assertEqual(await axi_read(ctx, dut.axi, 0x40), [(0x1234_5678, OKAY, 0, True)])
+        self.run_sim(testbench)
+
+    async def write_expecting_error(self, ctx, dut, addr, beats, *, id=0, **kwargs):
+        self.assertEqual(await axi_write(ctx, dut.axi, addr, beats, id=id, **kwargs), (SLVERR, id))
+
+
+class PostedWriteTests(AxiBridgeTests):
+    # Posted writes are answered OKAY once buffered, their errors only show on `write_error`
+    async def write_expecting_error(self, ctx, dut, addr, beats, *, id=0, **kwargs):
+        self.assertEqual(await axi_write(ctx, dut.axi, addr, beats, id=id, **kwargs), (OKAY, id))
+        errors = 0
+        for _ in range(50):
+            *_, write_error = await ctx.tick().sample(dut.write_error)
+            errors += write_error
+        self.assertEqual(errors, 1)
+
+    def test_read_after_posted_writes(self):
+        async def testbench(ctx, dut, memory):
+            for i in range(3):
+                self.assertEqual(await axi_write(ctx, dut.axi, 0x40 + 8 * i, [
+                    (0x5000_0000 + 2 * i, 0b1111),
+                    (0x5000_0001 + 2 * i, 0b1111),
+                ], id=i), (OKAY, i))
+            # The read can't overtake the writes already answered
+            beats = await axi_read(ctx, dut.axi, 0x40, length=6)
+            self.assertEqual([data for data, _, _, _ in beats], [0x5000_0000 + i for i in range(6)])
+        self.run_sim(testbench)
+
+
+class Axi2WishboneTestCase(AxiBridgeTests, unittest.TestCase):
+    def make_dut(self):
+        return Axi2Wishbone()
+
+
+class PostedAxi2WishboneTestCase(PostedWriteTests, unittest.TestCase):
+    def make_dut(self):
+        return Axi2Wishbone(posted=True)
+
+
+class PipelinedAxi2WishboneTestCase(AxiBridgeTests, unittest.TestCase):
+    def make_dut(self):
+        return PipelinedAxi2Wishbone(features={"err"})
+
+
+class PipelinedStallAxi2WishboneTestCase(AxiBridgeTests, unittest.TestCase):
+    pipelined = True
+    # Beats already issued when the error comes back go through
+    drops_after_error = False
+
+    def make_dut(self):
+        return PipelinedAxi2Wishbone(features={"err", "stall"})
+
+
+class PostedPipelinedAxi2WishboneTestCase(PostedWriteTests, unittest.TestCase):
+    pipelined = True
+    drops_after_error = False
+
+    def make_dut(self):
+        return PipelinedAxi2Wishbone(features={"err", "stall"}, posted=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+import unittest
+from amaranth import *
+from amaranth.lib.fifo import SyncFIFOBuffered
+from amaranth.sim import Simulator
+from cursed_soc.mailbox import MailboxWindow
+
+
+class MailboxHarness(Elaboratable):
+    # The window between its two FIFOs, wired the way Cpu does it
+    def __init__(self):
+        self.window = MailboxWindow()
+        self.to_arm = SyncFIFOBuffered(width=32, depth=16)
+        self.to_riscv = SyncFIFOBuffered(width=32, depth=16)
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.window = window = self.window
+        m.submodules.to_arm = to_arm = self.to_arm
+        m.submodules.to_riscv = to_riscv = self.to_riscv
+        m.d.comb += [
+            window.read.data.eq(to_arm.r_data),
+            window.read.valid.eq(to_arm.r_rdy),
+            window.read.level.eq(to_arm.r_level),
+            to_arm.r_en.eq(window.read.ready),
+            to_riscv.w_data.eq(window.write.data),
+            to_riscv.w_en.eq(window.write.valid),
+            window.write.ready.eq(to_riscv.w_rdy),
+            window.write.space.eq(to_riscv.depth - to_riscv.w_level),
+        ]
+        return m
+
+
+async def bus_access(ctx, bus, word, data=None):
+    # A single classic cycle, returns (ack, err, dat_r)
+    ctx.set(bus.adr, word)
+    ctx.set(bus.sel, 0b1111)
+    ctx.set(bus.we, data is not None)
+    ctx.set(bus.dat_w, data or 0)
+    ctx.set(bus.cyc, 1)
+    ctx.set(bus.stb, 1)
+    *_, ack, err, dat_r = await ctx.tick().sample(bus.ack, bus.err, bus.dat_r)
+    ctx.set(bus.cyc, 0)
+    ctx.set(bus.stb, 0)
+    return ack, err, dat_r
+
+
+async def bus_read(ctx, bus, word):
+    ack, err, dat_r = await bus_access(ctx, bus, word)
+    assert ack and not err
+    return dat_r
+
+
+async def push_to_arm(ctx, fifo, words):
+    for word in words:
+        ctx.set(fifo.w_data, word)
+        ctx.set(fifo.w_en, 1)
+        await ctx.tick()
+    ctx.set(fifo.w_en, 0)
+    # Let the words reach the buffered output
+    await ctx.tick().repeat(2)
+
+
+async def pop_to_riscv(ctx, fifo):
+    words = []
+    ctx.set(fifo.r_en, 1)
+    while True:
+        *_, r_rdy, r_data = await ctx.tick().sample(fifo.r_rdy, fifo.r_data)
+        if not r_rdy:
+            break
+        words.append(r_data)
+    ctx.set(fifo.r_en, 0)
+    return words
+
+
+class MailboxWindowTestCase(unittest.TestCase):
+    def run_sim(self, testbench):
+        dut = MailboxHarness()
+        sim = Simulator(dut)
+        sim.add_clock(1e-8)
+        async def run(ctx):
+            await testbench(ctx, dut)
+        sim.add_testbench(run)
+        sim.run()
+
+    def test_status(self):
+        async def testbench(ctx, dut):
+            self.assertEqual(await bus_read(ctx, dut.window.bus, 0), 16 << 16)
+            await push_to_arm(ctx, dut.to_arm, [1, 2, 3])
+            self.assertEqual(await bus_read(ctx, dut.window.bus, 0), (16 << 16) | 3)
+            ack, err, _ = await bus_access(ctx, dut.window.bus, 0, 0xffff_ffff)
+            self.assertTrue(ack)
+            self.assertFalse(err)
+            self.assertEqual(await bus_read(ctx, dut.window.bus, 0), (16 << 16) | 3)
+            self.assertEqual(await pop_to_riscv(ctx, dut.to_riscv), [])
+        self.run_sim(testbench)
+
+    def test_frame_pops_in_order(self):
+        async def testbench(ctx, dut):
+            await push_to_arm(ctx, dut.to_arm, [0x100 + i for i in range(3)])
+            self.assertEqual(await bus_read(ctx, dut.window.bus, 0) & 0xffff, 3)
+            words = [await bus_read(ctx, dut.window.bus, word) for word in range(1, 16)]
+            self.assertEqual(words, [0x100, 0x101, 0x102] + [0] * 12)
+            self.assertEqual(await bus_read(ctx, dut.window.bus, 0) & 0xffff, 0)
+        self.run_sim(testbench)
+
+    def test_frame_is_at_most_15_words(self):
+        async def testbench(ctx, dut):
+            await push_to_arm(ctx, dut.to_arm, [0x200 + i for i in range(16)])
+            self.assertEqual(await bus_read(ctx, dut.window.bus, 0) & 0xffff, 16)
+            words = [await bus_read(ctx, dut.window.bus, word) for word in range(1, 16)]
+            self.assertEqual(words, [0x200 + i for i in range(15)])
+            self.assertEqual(await bus_read(ctx, dut.window.bus, 0) & 0xffff, 1)
+            self.assertEqual(await bus_read(ctx, dut.window.bus, 1), 0x20f)
+        self.run_sim(testbench)
+
+    def test_unlatched_reads_are_zero(self):
+        async def testbench(ctx, dut):
+            await push_to_arm(ctx, dut.to_arm, [0x300, 0x301])
+            # Nothing pops before the status has been read
+            self.assertEqual(await bus_read(ctx, dut.window.bus, 1), 0)
+            self.assertEqual(await bus_read(ctx, dut.window.bus, 0) & 0xffff, 2)
+            # Out of order and repeated reads don't pop either
+            self.assertEqual(await bus_read(ctx, dut.window.bus, 2), 0)
+            self.assertEqual(await bus_read(ctx, dut.window.bus, 1), 0x300)
+            self.assertEqual(await bus_read(ctx, dut.window.bus, 1), 0)
+            self.assertEqual(await bus_read(ctx, dut.window.bus, 2), 0x301)
+            self.assertEqual(await bus_read(ctx, dut.window.bus, 0) & 0xffff, 0)
+        self.run_sim(testbench)
+
+    def test_words_pushed_mid_frame_stay(self):
+        async def testbench(ctx, dut):
+            await push_to_arm(ctx, dut.to_arm, [0x400])
+            self.assertEqual(await bus_read(ctx, dut.window.bus, 0) & 0xffff, 1)
+            await push_to_arm(ctx, dut.to_arm, [0x401])
+            self.assertEqual(await bus_read(ctx, dut.window.bus, 1), 0x400)
+            self.assertEqual(await bus_read(ctx, dut.window.bus, 2), 0)
+            self.assertEqual(await bus_read(ctx, dut.window.bus, 0) & 0xffff, 1)
+            self.assertEqual(await bus_read(ctx, dut.window.bus, 1), 0x401)
+        self.run_sim(testbench)
+
+    def test_write(self):
+        async def testbench(ctx, dut):
+            for word in range(1, 4):
+                ack, err, _ = await bus_access(ctx, dut.window.bus, word, 0x500 + word)
+                self.assertTrue(ack)
+                self.assertFalse(err)
+            await ctx.tick()
+            self.assertEqual(await bus_read(ctx, dut.window.bus, 0) >> 16, 13)
+            self.assertEqual(await pop_to_riscv(ctx, dut.to_riscv), [0x501, 0x502, 0x503])
+        self.run_sim(testbench)
+
+    def test_write_to_full_fifo_errs(self):
+        async def testbench(ctx, dut):
+            for i in range(16):
+                ack, err, _ = await bus_access(ctx, dut.window.bus, 1 + i % 15, 0x600 + i)
+                self.assertTrue(ack)
+            await ctx.tick()
+            self.assertEqual(await bus_read(ctx, dut.window.bus, 0) >> 16, 0)
+            ack, err, _ = await bus_access(ctx, dut.window.bus, 1, 0x6ff)
+            self.assertFalse(ack)
+            self.assertTrue(err)
+            self.assertEqual(await pop_to_riscv(ctx, dut.to_riscv), [0x600 + i for i in range(16)])
+        self.run_sim(testbench)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,17 +1,32 @@
 from amaranth import *
 from amaranth.lib import wiring
 from amaranth.build import *
+from typing import Optional
 from board import ebaz4205
 from cursed_soc import SoC
+from cursed_soc.clocking import ClockGenerator
 from cursed_soc.ps7 import PS7
 
 
 class Top(Elaboratable):
+    def __init__(self, *, cpu_port: str = "gp", cpu_freq: Optional[float] = None, cores: int = 1,
+                 posted_writes: bool = False):
+        self._cpu_port = cpu_port
+        self._cores = cores
+        self._posted_writes = posted_writes
+        # Without a frequency the core runs from fclk
+        self._cpu_freq = cpu_freq
+
     def elaborate(self, platform):
         m = Module()
 
         m.submodules.ps7 = ps7 = PS7()
-        m.submodules.soc = soc = SoC()
+        m.submodules.soc = soc = SoC(
+            cpu_port=self._cpu_port,
+            cpu_domain=None if self._cpu_freq is None else "cpu",
+            cores=self._cores,
+            posted_writes=self._posted_writes,
+        )
 
         m.domains += ClockDomain("fclk", local=True)
         clk, rst = ps7.fclk(0, 100e6, raw=True)
@@ -28,8 +43,32 @@ class Top(Elaboratable):
             o_O=ClockSignal("sync"),
         )
 
-        wiring.connect(m, soc.cpu_to_sys, wiring.flipped(ps7.axi_gp_s()))
+        if self._cpu_freq is not None:
+            m.domains += ClockDomain("cpu", local=True)
+            m.submodules.cpu_clock = cpu_clock = ClockGenerator("cpu", freq=self._cpu_freq, in_freq=100e6)
+            print(f"CPU clock @ {cpu_clock.actual_freq / 1e6:.3f} MHz")
+
+        # On an HP port the core goes through the DDR controller's own queues instead of the central
+        # interconnect, it gets HP1 so the mailbox ring keeps HP0. Through the ACP its accesses are
+        # coherent with the ARM caches.
+        if self._cpu_port == "hp":
+            wiring.connect(m, soc.cpu_to_sys, wiring.flipped(ps7.axi_hp(1)))
+        elif self._cpu_port == "acp":
+            wiring.connect(m, soc.cpu_to_sys, wiring.flipped(ps7.axi_acp()))
+        else:
+            wiring.connect(m, soc.cpu_to_sys, wiring.flipped(ps7.axi_gp_s()))
         wiring.connect(m, soc.sys_to_csr, wiring.flipped(ps7.axi_gp_m(0)))
+        wiring.connect(m, soc.mailbox_to_sys, wiring.flipped(ps7.axi_hp(0)))
+        # The bus trace gets its own HP port, so it doesn't slow down what it's tracing
+        wiring.connect(m, soc.trace_to_sys, wiring.flipped(ps7.axi_hp(2)))
+
+        # Three mailbox interrupts per core, from IRQ_F2P[3 * n]
+        for n in range(self._cores):
+            m.d.comb += [
+                ps7.irq_f2p(3 * n + 0).eq(soc.mailbox_irq[n].read_not_empty),
+                ps7.irq_f2p(3 * n + 1).eq(soc.mailbox_irq[n].read_watermark),
+                ps7.irq_f2p(3 * n + 2).eq(soc.mailbox_irq[n].write_watermark),
+            ]
 
         uart = platform.request("uart", 0)
         m.d.comb += [
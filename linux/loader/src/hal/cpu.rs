@@ -1,9 +1,9 @@
 use std::fs::OpenOptions;
-use std::io::Error;
-use std::os::fd::IntoRawFd;
+use std::io::{Error, ErrorKind};
+use std::os::fd::AsRawFd;
 use std::os::unix::fs::OpenOptionsExt;
 use std::ptr::{addr_of, addr_of_mut};
-use crate::hal::MemoryMap;
+use crate::hal::{MailboxRing, MemoryMap, TraceBuffer, TraceRecord};
 
 #[repr(C)]
 struct ClockingRegister {
@@ -45,6 +45,191 @@ struct MailboxWrite {
     write_data: u32,
 }
 
+#[repr(C)]
+struct MailboxIrqThreshold {
+    read_level: u16,
+    write_level: u16,
+}
+
+/// Memory attributes of the RISC-V accesses to the system, AXI encodings. Reads with the core's
+/// instruction flag use `fetch_qos`, and keep that flag in AxPROT[2].
+#[derive(Clone, Copy, Debug, Default, PartialEq, Eq)]
+pub struct SysAttributes {
+    pub read_cache: u8,
+    pub read_qos: u8,
+    pub read_prot: u8,
+    pub fetch_qos: u8,
+    pub write_cache: u8,
+    pub write_qos: u8,
+    pub write_prot: u8,
+}
+
+impl SysAttributes {
+    fn from_bits(bits: u32) -> Self {
+        let field = |shift: u32, width: u32| ((bits >> shift) & ((1 << width) - 1)) as u8;
+        Self {
+            read_cache: field(0, 4),
+            read_qos: field(4, 4),
+            read_prot: field(8, 3),
+            fetch_qos: field(12, 4),
+            write_cache: field(16, 4),
+            write_qos: field(20, 4),
+            write_prot: field(24, 3),
+        }
+    }
+
+    fn bits(&self) -> u32 {
+        (self.read_cache as u32 & 0xF)
+            | (self.read_qos as u32 & 0xF) << 4
+            | (self.read_prot as u32 & 0x7) << 8
+            | (self.fetch_qos as u32 & 0xF) << 12
+            | (self.write_cache as u32 & 0xF) << 16
+            | (self.write_qos as u32 & 0xF) << 20
+            | (self.write_prot as u32 & 0x7) << 24
+    }
+}
+
+/// The performance counters of the core, as of the last snapshot. Bus counts are on the core's own
+/// bus, the waits are cycles with transfers outstanding and no response, `to_riscv` is the ARM ->
+/// RISC-V mailbox FIFO and `to_arm` the other one.
+#[derive(Clone, Copy, Debug, Default)]
+pub struct PerfCounters {
+    pub cycles: u64,
+    pub ar: u32,
+    pub aw: u32,
+    pub r: u32,
+    pub w: u32,
+    pub ar_stall: u32,
+    pub aw_stall: u32,
+    pub w_stall: u32,
+    pub read_wait: u32,
+    pub write_wait: u32,
+    pub to_riscv_full: u32,
+    pub to_riscv_empty: u32,
+    pub to_arm_full: u32,
+    pub to_arm_empty: u32,
+    pub to_riscv_max: u32,
+    pub to_arm_max: u32,
+}
+
+#[repr(C)]
+struct PerfRegisters {
+    control: u32,
+    _pad0: u32,
+    cycles: [u32; 2],
+    counts: [u32; 13],
+    maxima: [u32; 2],
+}
+
+/// Latencies of the core's system transactions that got past the read cache, in core cycles, as of
+/// the last snapshot. Reads are timed from AR to the last R beat, writes from AW to B. Bin 0 of the
+/// histogram counts latencies of 0, bin n > 0 those from 1 << (n - 1) up, and the last bin all the
+/// longer ones, after shifting the latencies right by the scale of `latency_configure`.
+#[derive(Clone, Copy, Debug, Default)]
+pub struct LatencyStats {
+    pub count: u32,
+    pub total: u64,
+    pub min: u32,
+    pub max: u32,
+    pub histogram: [u32; LATENCY_BINS],
+}
+
+#[repr(C)]
+struct LatencyRegisters {
+    control: u32,
+    hist_select: u32,
+    hist_data: u32,
+    read_count: u32,
+    read_total: [u32; 2],
+    read_min: u32,
+    read_max: u32,
+    write_total: [u32; 2],
+    write_count: u32,
+    write_min: u32,
+    write_max: u32,
+}
+
+#[repr(C)]
+struct ProfilerRegisters {
+    control: u32,
+    interval: u32,
+    base: u32,
+    id_filter: u32,
+    select: u32,
+    data: u32,
+}
+
+#[repr(C)]
+struct TraceRegisters {
+    control: u32,
+    base: u32,
+    head: u32,
+    tail: u32,
+    trigger_address: u32,
+    trigger_mask: u32,
+}
+
+/// 16 word frames, word 0 is the status (read level and write space), the others pop/push the
+/// mailbox FIFOs. Reading the status then the words it counts, in order, drains up to 15 words
+/// without polling, anything else reads zero. Pushing to a full FIFO is a bus error.
+#[repr(C)]
+struct MailboxWindow {
+    frame: [u32; MAILBOX_FRAME_WORDS],
+}
+
+const CLOCKING_CLOCK_ENABLE: u32 = 1 << 1;
+const MAILBOX_FRAME_WORDS: usize = 16;
+const MAILBOX_RING_ENABLE: u32 = 1 << 0;
+const MAILBOX_RING_ERROR: u32 = 1 << 1;
+const MAILBOX_RING_SIZE_SHIFT: u32 = 8;
+pub const MAILBOX_IRQ_READ_NOT_EMPTY: u32 = 1 << 0;
+pub const MAILBOX_IRQ_READ_WATERMARK: u32 = 1 << 1;
+pub const MAILBOX_IRQ_WRITE_WATERMARK: u32 = 1 << 2;
+const DEBUG_SRC_HOST: u32 = 0b10;
+const DEBUG_DST_SHIFT: u32 = 2;
+const JTAG_BUSY: u32 = 1 << 6;
+const READ_CACHE_ENABLE: u32 = 1 << 0;
+const READ_CACHE_FETCH_ONLY: u32 = 1 << 1;
+const READ_CACHE_INVALIDATE: u32 = 1 << 2;
+const PERF_FREEZE: u32 = 1 << 0;
+const PERF_SNAPSHOT: u32 = 1 << 1;
+const PERF_CLEAR: u32 = 1 << 2;
+const PERF_BUSY: u32 = 1 << 3;
+const PERF_OFFSET: usize = 0x400;
+const LATENCY_SNAPSHOT: u32 = 1 << 1;
+const LATENCY_CLEAR: u32 = 1 << 2;
+const LATENCY_BUSY: u32 = 1 << 3;
+const LATENCY_SHIFT_SHIFT: u32 = 8;
+const LATENCY_SHIFT_MASK: u32 = 0x1f << LATENCY_SHIFT_SHIFT;
+const LATENCY_HIST_WRITE: u32 = 1 << 8;
+const LATENCY_BINS: usize = 16;
+const LATENCY_OFFSET: usize = 0x800;
+const PROFILER_ENABLE: u32 = 1 << 0;
+const PROFILER_CLEAR: u32 = 1 << 1;
+const PROFILER_FETCH_ONLY: u32 = 1 << 2;
+const PROFILER_BUSY: u32 = 1 << 3;
+const PROFILER_SHIFT_SHIFT: u32 = 8;
+const PROFILER_BUCKETS: usize = 1024;
+const PROFILER_OFFSET: usize = 0x200;
+const TRACE_ENABLE: u32 = 1 << 0;
+const TRACE_ARM: u32 = 1 << 1;
+const TRACE_TRIGGERED: u32 = 1 << 2;
+const TRACE_OVERFLOW: u32 = 1 << 3;
+const TRACE_ERROR: u32 = 1 << 4;
+const TRACE_SIZE_SHIFT: u32 = 8;
+const TRACE_OFFSET: usize = 0xC00;
+const JTAG_DIVIDER_SHIFT: u32 = 16;
+const MAILBOX_WINDOW_OFFSET: usize = 0x1000;
+const CPU_BASE: usize = 0x4000_0000;
+const MAP_SIZE: usize = 0x2000;
+const SOC_BASE: usize = 0x4080_0000;
+const SOC_MAP_SIZE: usize = 0x1000;
+const TIMESTAMP_OFFSET: usize = 0x100;
+const SHARED_MEMORY_BASE: usize = 0x4100_0000;
+const SHARED_MEMORY_STRIDE: usize = 0x1_0000;
+/// Default size of the shared memory in the gateware
+const SHARED_MEMORY_SIZE: usize = 0x2000;
+
 #[repr(C)]
 struct CpuRegisters {
     clocking: ClockingRegister,
@@ -56,34 +241,71 @@ struct CpuRegisters {
     mailbox_write_status: MailboxWriteStatus,
     mailbox_read: MailboxRead,
     mailbox_write: MailboxWrite,
+    mailbox_ring_control: u32,
+    mailbox_ring_tx_base: u32,
+    mailbox_ring_rx_base: u32,
+    mailbox_ring_tx_head: u32,
+    mailbox_ring_tx_tail: u32,
+    mailbox_ring_rx_head: u32,
+    mailbox_ring_rx_tail: u32,
+    mailbox_irq_enable: u32,
+    mailbox_irq_pending: u32,
+    mailbox_irq_threshold: MailboxIrqThreshold,
+    jtag_control: u32,
+    jtag_tms: u32,
+    jtag_tdi: u32,
+    jtag_tdo: u32,
+    sys_attributes: u32,
+    read_cache: u32,
+    gpio_set: u32,
+    gpio_clear: u32,
+    gpio_toggle: u32,
+    gpio_rise: u32,
+    gpio_fall: u32,
+    gpio_changes: u32,
 }
 
 pub struct Cpu {
     map: MemoryMap,
+    shared: MemoryMap,
+    soc: MemoryMap,
+}
+
+unsafe fn map_phys(f: &std::fs::File, addr: usize, size: usize) -> std::io::Result<MemoryMap> {
+    let res = libc::mmap(
+        core::ptr::null_mut(),
+        size,
+        libc::PROT_READ|libc::PROT_WRITE,
+        libc::MAP_SHARED,
+        f.as_raw_fd(),
+        addr as libc::off_t,
+    );
+    if res == libc::MAP_FAILED {
+        return Err(Error::last_os_error());
+    }
+
+    Ok(MemoryMap {
+        ptr: res,
+        size,
+    })
 }
 
 impl Cpu {
     pub unsafe fn open() -> std::io::Result<Self> {
+        Self::open_core(0)
+    }
+
+    /// Opens the `index`-th core of a multi-core bitstream, each one has its CSRs and mailbox
+    /// window in the next MAP_SIZE block, and its shared memory in the next SHARED_MEMORY_STRIDE
+    /// block from SHARED_MEMORY_BASE.
+    pub unsafe fn open_core(index: usize) -> std::io::Result<Self> {
         let f = OpenOptions::new().read(true).write(true)
             .custom_flags(libc::O_SYNC).open("/dev/mem")?;
 
-        let res = libc::mmap(
-            core::ptr::null_mut(),
-            4096,
-            libc::PROT_READ|libc::PROT_WRITE,
-            libc::MAP_SHARED,
-            f.into_raw_fd(),
-            0x4000_0000,
-        );
-        if res == libc::MAP_FAILED {
-            return Err(Error::last_os_error());
-        }
-
-        return Ok(Self {
-            map: MemoryMap {
-                ptr: res,
-                size: 4096,
-            }
+        Ok(Self {
+            map: map_phys(&f, CPU_BASE + index * MAP_SIZE, MAP_SIZE)?,
+            shared: map_phys(&f, SHARED_MEMORY_BASE + index * SHARED_MEMORY_STRIDE, SHARED_MEMORY_SIZE)?,
+            soc: map_phys(&f, SOC_BASE, SOC_MAP_SIZE)?,
         })
     }
 
@@ -103,6 +325,7 @@ impl Cpu {
         });
     }
 
+    /// The core's clock stops and its reset applies once its system bus transactions are over.
     pub unsafe fn kill(&mut self) {
         let regs = self.regs_mut();
         //RESET
@@ -141,6 +364,522 @@ impl Cpu {
         }
     }
 
+    /// Pushes as many words of `vals` as currently fit, returns how many were sent. Only the host
+    /// pushes, so the space read first can't shrink before the words are written.
+    pub fn mailbox_send_burst(&mut self, vals: &[u32]) -> usize {
+        let window = self.mailbox_window();
+        unsafe {
+            let space = (addr_of!((*window).frame[0]).read_volatile() >> 16) as usize;
+            let n = vals.len().min(space).min(MAILBOX_FRAME_WORDS - 1);
+            for (i, v) in vals[..n].iter().enumerate() {
+                addr_of_mut!((*window).frame[1 + i]).write_volatile(*v);
+            }
+            n
+        }
+    }
+
+    /// Pops up to 15 words out of a frame, returns how many were popped into `buf`. The window
+    /// only pops the words counted in the frame's status, read in order after it, so the status
+    /// is read first and then each word on its own.
+    pub fn mailbox_recv_burst(&mut self, buf: &mut [u32; MAILBOX_FRAME_WORDS - 1]) -> usize {
+        let window = self.mailbox_window();
+        unsafe {
+            let status = addr_of!((*window).frame[0]).read_volatile();
+            let n = ((status & 0xFFFF) as usize).min(MAILBOX_FRAME_WORDS - 1);
+            for (i, v) in buf[..n].iter_mut().enumerate() {
+                *v = addr_of!((*window).frame[1 + i]).read_volatile();
+            }
+            n
+        }
+    }
+
+    /// Hands the host side of the mailbox FIFOs over to `ring`, both rings start empty.
+    pub fn mailbox_ring_start(&mut self, ring: &mut MailboxRing) {
+        self.mailbox_ring_stop();
+        ring.tx_head = 0;
+        ring.rx_tail = 0;
+        let regs = self.regs_mut();
+        unsafe {
+            addr_of_mut!((*regs).mailbox_ring_tx_base).write_volatile(ring.tx_phys() as u32);
+            addr_of_mut!((*regs).mailbox_ring_rx_base).write_volatile(ring.rx_phys() as u32);
+            addr_of_mut!((*regs).mailbox_ring_tx_head).write_volatile(0);
+            addr_of_mut!((*regs).mailbox_ring_rx_tail).write_volatile(0);
+            addr_of_mut!((*regs).mailbox_ring_control).write_volatile(
+                MAILBOX_RING_ENABLE | (ring.size_log2() << MAILBOX_RING_SIZE_SHIFT)
+            );
+        }
+    }
+
+    pub fn mailbox_ring_stop(&mut self) {
+        let regs = self.regs_mut();
+        unsafe {
+            addr_of_mut!((*regs).mailbox_ring_control).write_volatile(0);
+        }
+    }
+
+    /// An AXI error stops the ring until it's restarted.
+    pub fn mailbox_ring_error(&self) -> bool {
+        let regs = self.regs();
+        unsafe {
+            addr_of!((*regs).mailbox_ring_control).read_volatile() & MAILBOX_RING_ERROR != 0
+        }
+    }
+
+    /// Queues as many words of `vals` as currently fit in the ring, returns how many were queued.
+    pub fn mailbox_ring_send(&mut self, ring: &mut MailboxRing, vals: &[u32]) -> usize {
+        let regs = self.regs_mut();
+        let tail = unsafe {
+            addr_of!((*regs).mailbox_ring_tx_tail).read_volatile()
+        };
+        let space = ring.words() - ring.tx_head.wrapping_sub(tail) as usize;
+        let n = vals.len().min(space);
+        if n == 0 {
+            return 0;
+        }
+        ring.store(ring.tx_head, &vals[..n]);
+        ring.tx_head = ring.tx_head.wrapping_add(n as u32);
+        unsafe {
+            addr_of_mut!((*regs).mailbox_ring_tx_head).write_volatile(ring.tx_head);
+        }
+        n
+    }
+
+    /// Takes up to `buf.len()` words out of the ring, returns how many were received.
+    pub fn mailbox_ring_recv(&mut self, ring: &mut MailboxRing, buf: &mut [u32]) -> usize {
+        let regs = self.regs_mut();
+        let head = unsafe {
+            addr_of!((*regs).mailbox_ring_rx_head).read_volatile()
+        };
+        let n = buf.len().min(head.wrapping_sub(ring.rx_tail) as usize);
+        if n == 0 {
+            return 0;
+        }
+        ring.load(ring.rx_tail, &mut buf[..n]);
+        ring.rx_tail = ring.rx_tail.wrapping_add(n as u32);
+        unsafe {
+            addr_of_mut!((*regs).mailbox_ring_rx_tail).write_volatile(ring.rx_tail);
+        }
+        n
+    }
+
+    /// Enables the `MAILBOX_IRQ_*` interrupts in `mask`. The read watermark fires with more than
+    /// `read_level` words to receive, the write watermark with fewer than `write_level` words
+    /// still queued for the RISC-V.
+    pub fn mailbox_irq_configure(&mut self, mask: u32, read_level: u16, write_level: u16) {
+        let regs = self.regs_mut();
+        unsafe {
+            addr_of_mut!((*regs).mailbox_irq_threshold).write_volatile(MailboxIrqThreshold {
+                read_level,
+                write_level,
+            });
+            addr_of_mut!((*regs).mailbox_irq_pending).write_volatile(mask);
+            addr_of_mut!((*regs).mailbox_irq_enable).write_volatile(mask);
+        }
+    }
+
+    pub fn mailbox_irq_pending(&self) -> u32 {
+        let regs = self.regs();
+        unsafe {
+            addr_of!((*regs).mailbox_irq_pending).read_volatile()
+        }
+    }
+
+    /// Pending interrupts whose condition still holds are raised again right away.
+    pub fn mailbox_irq_ack(&mut self, mask: u32) {
+        let regs = self.regs_mut();
+        unsafe {
+            addr_of_mut!((*regs).mailbox_irq_pending).write_volatile(mask);
+        }
+    }
+
+    /// Connects the host CSRs to the VexRiscv debug plugin (`dst` 0) or the RISC-V debug module (`dst` 1).
+    pub fn jtag_select(&mut self, dst: u32) {
+        let regs = self.regs_mut();
+        unsafe {
+            addr_of_mut!((*regs).debug).write_volatile(DEBUG_SRC_HOST | (dst << DEBUG_DST_SHIFT));
+        }
+    }
+
+    /// Shifts out the low `count` bits (1 to 32) of `tms` and `tdi`, LSB first, with TCK at
+    /// fclk / (2 * (`divider` + 1)), and returns the TDO bits captured on the way. TDO is
+    /// synchronized, so `divider` is at least 1.
+    pub fn jtag_shift(&mut self, tms: u32, tdi: u32, count: u32, divider: u16) -> u32 {
+        let divider = divider.max(1);
+        let regs = self.regs_mut();
+        unsafe {
+            addr_of_mut!((*regs).jtag_tms).write_volatile(tms);
+            addr_of_mut!((*regs).jtag_tdi).write_volatile(tdi);
+            addr_of_mut!((*regs).jtag_control).write_volatile(
+                count.min(32) | ((divider as u32) << JTAG_DIVIDER_SHIFT)
+            );
+            while addr_of!((*regs).jtag_control).read_volatile() & JTAG_BUSY != 0 {
+                std::hint::spin_loop();
+            }
+            addr_of!((*regs).jtag_tdo).read_volatile()
+        }
+    }
+
+    pub fn sys_attributes(&self) -> SysAttributes {
+        let regs = self.regs();
+        unsafe {
+            SysAttributes::from_bits(addr_of!((*regs).sys_attributes).read_volatile())
+        }
+    }
+
+    /// Takes effect on the next address the core issues, best changed while it's held in reset.
+    pub fn set_sys_attributes(&mut self, attributes: SysAttributes) {
+        let regs = self.regs_mut();
+        unsafe {
+            addr_of_mut!((*regs).sys_attributes).write_volatile(attributes.bits());
+        }
+    }
+
+    /// The read cache between the core and the system is dropped on each boot, `fetch_only` keeps
+    /// it to instruction fetches so data shared with the host is always read from memory.
+    pub fn read_cache_configure(&mut self, enable: bool, fetch_only: bool) {
+        let regs = self.regs_mut();
+        let mut bits = 0;
+        if enable {
+            bits |= READ_CACHE_ENABLE;
+        }
+        if fetch_only {
+            bits |= READ_CACHE_FETCH_ONLY;
+        }
+        unsafe {
+            addr_of_mut!((*regs).read_cache).write_volatile(bits);
+        }
+    }
+
+    /// Drops the read cache lines, once the host changed memory the core may have read before.
+    pub fn read_cache_invalidate(&mut self) {
+        let regs = self.regs_mut();
+        unsafe {
+            let bits = addr_of!((*regs).read_cache).read_volatile();
+            addr_of_mut!((*regs).read_cache).write_volatile(bits | READ_CACHE_INVALIDATE);
+        }
+    }
+
+    /// The word the core reads on its GPIO inputs
+    pub fn gpio_input(&self) -> u32 {
+        let regs = self.regs();
+        unsafe {
+            addr_of!((*regs).gpio.read).read_volatile()
+        }
+    }
+
+    /// Sets the GPIO inputs of the core in `mask`, in a single write
+    pub fn gpio_set(&mut self, mask: u32) {
+        let regs = self.regs_mut();
+        unsafe {
+            addr_of_mut!((*regs).gpio_set).write_volatile(mask);
+        }
+    }
+
+    pub fn gpio_clear(&mut self, mask: u32) {
+        let regs = self.regs_mut();
+        unsafe {
+            addr_of_mut!((*regs).gpio_clear).write_volatile(mask);
+        }
+    }
+
+    pub fn gpio_toggle(&mut self, mask: u32) {
+        let regs = self.regs_mut();
+        unsafe {
+            addr_of_mut!((*regs).gpio_toggle).write_volatile(mask);
+        }
+    }
+
+    /// Returns and acknowledges the rising and falling edges seen on the GPIO outputs of the core
+    /// since the last call
+    pub fn gpio_edges(&mut self) -> (u32, u32) {
+        let regs = self.regs_mut();
+        unsafe {
+            let rise = addr_of!((*regs).gpio_rise).read_volatile();
+            let fall = addr_of!((*regs).gpio_fall).read_volatile();
+            addr_of_mut!((*regs).gpio_rise).write_volatile(rise);
+            addr_of_mut!((*regs).gpio_fall).write_volatile(fall);
+            (rise, fall)
+        }
+    }
+
+    /// Number of changes of the GPIO outputs of the core, wrapping around
+    pub fn gpio_changes(&self) -> u32 {
+        let regs = self.regs();
+        unsafe {
+            addr_of!((*regs).gpio_changes).read_volatile()
+        }
+    }
+
+    /// Takes a snapshot of all the performance counters at once and returns it. The counters are
+    /// cleared on each boot. The snapshot is taken on the core's clock, so it fails while that's
+    /// stopped.
+    pub fn perf_snapshot(&mut self) -> std::io::Result<PerfCounters> {
+        let perf = self.perf();
+        unsafe {
+            let control = addr_of!((*perf).control).read_volatile() & PERF_FREEZE;
+            addr_of_mut!((*perf).control).write_volatile(control | PERF_SNAPSHOT);
+            self.wait_core(addr_of!((*perf).control), PERF_BUSY)?;
+            let count = |i: usize| addr_of!((*perf).counts[i]).read_volatile();
+            let cycles_lo = addr_of!((*perf).cycles[0]).read_volatile();
+            let cycles_hi = addr_of!((*perf).cycles[1]).read_volatile();
+            Ok(PerfCounters {
+                cycles: (cycles_hi as u64) << 32 | cycles_lo as u64,
+                ar: count(0),
+                aw: count(1),
+                r: count(2),
+                w: count(3),
+                ar_stall: count(4),
+                aw_stall: count(5),
+                w_stall: count(6),
+                read_wait: count(7),
+                write_wait: count(8),
+                to_riscv_full: count(9),
+                to_riscv_empty: count(10),
+                to_arm_full: count(11),
+                to_arm_empty: count(12),
+                to_riscv_max: addr_of!((*perf).maxima[0]).read_volatile(),
+                to_arm_max: addr_of!((*perf).maxima[1]).read_volatile(),
+            })
+        }
+    }
+
+    /// Stops (or resumes) all the performance counters
+    pub fn perf_freeze(&mut self, freeze: bool) {
+        let perf = self.perf();
+        unsafe {
+            addr_of_mut!((*perf).control).write_volatile(if freeze { PERF_FREEZE } else { 0 });
+        }
+    }
+
+    pub fn perf_clear(&mut self) -> std::io::Result<()> {
+        let perf = self.perf();
+        unsafe {
+            let control = addr_of!((*perf).control).read_volatile() & PERF_FREEZE;
+            addr_of_mut!((*perf).control).write_volatile(control | PERF_CLEAR);
+            self.wait_core(addr_of!((*perf).control), PERF_BUSY)
+        }
+    }
+
+    /// Takes a snapshot of the latency statistics and returns those of reads and writes. The
+    /// histograms aren't part of the snapshot, they keep counting while they're read. Like
+    /// `perf_snapshot`, it fails while the core's clock is stopped.
+    pub fn latency_snapshot(&mut self) -> std::io::Result<(LatencyStats, LatencyStats)> {
+        let latency = self.latency();
+        unsafe {
+            let control = addr_of!((*latency).control).read_volatile() & LATENCY_SHIFT_MASK;
+            addr_of_mut!((*latency).control).write_volatile(control | LATENCY_SNAPSHOT);
+            self.wait_core(addr_of!((*latency).control), LATENCY_BUSY)?;
+            let histogram = |select: u32| {
+                let mut histogram = [0; LATENCY_BINS];
+                for (bin, count) in histogram.iter_mut().enumerate() {
+                    addr_of_mut!((*latency).hist_select).write_volatile(select | bin as u32);
+                    *count = addr_of!((*latency).hist_data).read_volatile();
+                }
+                histogram
+            };
+            let total = |total: *const [u32; 2]| {
+                let lo = addr_of!((*total)[0]).read_volatile();
+                let hi = addr_of!((*total)[1]).read_volatile();
+                (hi as u64) << 32 | lo as u64
+            };
+            let read = LatencyStats {
+                count: addr_of!((*latency).read_count).read_volatile(),
+                total: total(addr_of!((*latency).read_total)),
+                min: addr_of!((*latency).read_min).read_volatile(),
+                max: addr_of!((*latency).read_max).read_volatile(),
+                histogram: histogram(0),
+            };
+            let write = LatencyStats {
+                count: addr_of!((*latency).write_count).read_volatile(),
+                total: total(addr_of!((*latency).write_total)),
+                min: addr_of!((*latency).write_min).read_volatile(),
+                max: addr_of!((*latency).write_max).read_volatile(),
+                histogram: histogram(LATENCY_HIST_WRITE),
+            };
+            Ok((read, write))
+        }
+    }
+
+    /// Sets the histogram scale, latencies are shifted right by `shift` before they're binned, and
+    /// clears the statistics so they all use the same scale
+    pub fn latency_configure(&mut self, shift: u32) -> std::io::Result<()> {
+        assert!(shift < 32);
+        let latency = self.latency();
+        unsafe {
+            addr_of_mut!((*latency).control).write_volatile(shift << LATENCY_SHIFT_SHIFT | LATENCY_CLEAR);
+            self.wait_core(addr_of!((*latency).control), LATENCY_BUSY)
+        }
+    }
+
+    /// Clears the fetch profile and starts sampling the core's reads, one every `interval` cycles
+    /// at most, into buckets of `1 << shift` bytes from `base` on. With `fetch_only` only
+    /// instruction fetches are sampled, with an `id_filter` of (id, mask) only the reads whose ID
+    /// matches `id` on the bits of `mask`. Like `perf_clear`, it fails while the core's clock is
+    /// stopped, and the profiler is then left disabled.
+    pub fn profiler_start(&mut self, base: u32, shift: u32, interval: u32, fetch_only: bool,
+                          id_filter: Option<(u16, u16)>) -> std::io::Result<()> {
+        assert!(shift < 32);
+        self.profiler_stop();
+        let regs = self.profiler();
+        let (id, mask) = id_filter.unwrap_or((0, 0));
+        let control = shift << PROFILER_SHIFT_SHIFT | if fetch_only { PROFILER_FETCH_ONLY } else { 0 };
+        unsafe {
+            addr_of_mut!((*regs).base).write_volatile(base);
+            addr_of_mut!((*regs).interval).write_volatile(interval);
+            addr_of_mut!((*regs).id_filter).write_volatile((mask as u32) << 16 | id as u32);
+            addr_of_mut!((*regs).control).write_volatile(control | PROFILER_CLEAR);
+            self.wait_core(addr_of!((*regs).control), PROFILER_BUSY)?;
+            addr_of_mut!((*regs).control).write_volatile(control | PROFILER_ENABLE);
+        }
+        Ok(())
+    }
+
+    pub fn profiler_stop(&mut self) {
+        let regs = self.profiler();
+        unsafe {
+            let control = addr_of!((*regs).control).read_volatile() & !PROFILER_ENABLE;
+            addr_of_mut!((*regs).control).write_volatile(control);
+        }
+    }
+
+    /// Reads the fetch profile, the buckets in address order followed by the count of samples
+    /// that fell outside of them. The profiler keeps sampling while it's read.
+    pub fn profiler_read(&mut self) -> Vec<u32> {
+        let regs = self.profiler();
+        (0..=PROFILER_BUCKETS).map(|bucket| unsafe {
+            addr_of_mut!((*regs).select).write_volatile(bucket as u32);
+            addr_of!((*regs).data).read_volatile()
+        }).collect()
+    }
+
+    /// Starts tracing the core's system bus into `trace`, which starts empty. With a `trigger`
+    /// of (address, mask), recording only starts at the first AR or AW whose address matches
+    /// `address` on the bits of `mask`.
+    pub fn trace_start(&mut self, trace: &mut TraceBuffer, trigger: Option<(u32, u32)>) {
+        self.trace_stop();
+        trace.tail = 0;
+        let regs = self.trace();
+        let (address, mask, arm) = match trigger {
+            Some((address, mask)) => (address, mask, TRACE_ARM),
+            None => (0, 0, 0),
+        };
+        unsafe {
+            addr_of_mut!((*regs).base).write_volatile(trace.phys() as u32);
+            addr_of_mut!((*regs).tail).write_volatile(0);
+            addr_of_mut!((*regs).trigger_address).write_volatile(address);
+            addr_of_mut!((*regs).trigger_mask).write_volatile(mask);
+            addr_of_mut!((*regs).control).write_volatile(
+                TRACE_ENABLE | arm | (trace.size_log2() << TRACE_SIZE_SHIFT)
+            );
+        }
+    }
+
+    pub fn trace_stop(&mut self) {
+        let regs = self.trace();
+        unsafe {
+            addr_of_mut!((*regs).control).write_volatile(0);
+        }
+    }
+
+    /// Returns (triggered, overflow, error). An AXI error stops the trace until it's restarted,
+    /// overflow means records were lost since the start.
+    pub fn trace_status(&mut self) -> (bool, bool, bool) {
+        let regs = self.trace();
+        let control = unsafe {
+            addr_of!((*regs).control).read_volatile()
+        };
+        (control & TRACE_TRIGGERED != 0, control & TRACE_OVERFLOW != 0, control & TRACE_ERROR != 0)
+    }
+
+    /// Takes up to `max` records out of the trace, the core keeps running.
+    pub fn trace_recv(&mut self, trace: &mut TraceBuffer, max: usize) -> Vec<TraceRecord> {
+        let regs = self.trace();
+        let head = unsafe {
+            addr_of!((*regs).head).read_volatile()
+        };
+        let n = max.min(head.wrapping_sub(trace.tail) as usize);
+        if n == 0 {
+            return Vec::new();
+        }
+        let records = trace.load(trace.tail, n);
+        trace.tail = trace.tail.wrapping_add(n as u32);
+        unsafe {
+            addr_of_mut!((*regs).tail).write_volatile(trace.tail);
+        }
+        records
+    }
+
+    /// Reads the fabric timestamp, a count of fclk cycles the core also reads at 0x0006_0000
+    pub fn timestamp(&self) -> u64 {
+        let count = unsafe {
+            (*self.soc as *const u8).add(TIMESTAMP_OFFSET) as *const u32
+        };
+        // Reading the low word latches the high one
+        unsafe {
+            let lo = count.read_volatile();
+            let hi = count.add(1).read_volatile();
+            (hi as u64) << 32 | lo as u64
+        }
+    }
+
+    /// Reads a word of the BRAM shared with the core, the core sees it at 0x0005_0000
+    pub fn shared_read(&self, index: usize) -> u32 {
+        assert!(index < SHARED_MEMORY_SIZE / 4);
+        unsafe {
+            (*self.shared as *const u32).add(index).read_volatile()
+        }
+    }
+
+    pub fn shared_write(&mut self, index: usize, val: u32) {
+        assert!(index < SHARED_MEMORY_SIZE / 4);
+        unsafe {
+            (*self.shared as *mut u32).add(index).write_volatile(val)
+        }
+    }
+
+    fn mailbox_window(&mut self) -> *mut MailboxWindow {
+        unsafe {
+            (*self.map as *mut u8).add(MAILBOX_WINDOW_OFFSET) as *mut MailboxWindow
+        }
+    }
+
+    fn perf(&mut self) -> *mut PerfRegisters {
+        unsafe {
+            (*self.map as *mut u8).add(PERF_OFFSET) as *mut PerfRegisters
+        }
+    }
+
+    fn latency(&mut self) -> *mut LatencyRegisters {
+        unsafe {
+            (*self.map as *mut u8).add(LATENCY_OFFSET) as *mut LatencyRegisters
+        }
+    }
+
+    fn profiler(&mut self) -> *mut ProfilerRegisters {
+        unsafe {
+            (*self.map as *mut u8).add(PROFILER_OFFSET) as *mut ProfilerRegisters
+        }
+    }
+
+    fn trace(&mut self) -> *mut TraceRegisters {
+        unsafe {
+            (*self.map as *mut u8).add(TRACE_OFFSET) as *mut TraceRegisters
+        }
+    }
+
+    /// Waits for the core's clock domain to be done with a request, while `busy` is set in
+    /// `control`. Fails if the core's clock is stopped, the request is then done once it restarts.
+    unsafe fn wait_core(&self, control: *const u32, busy: u32) -> std::io::Result<()> {
+        let regs = self.regs();
+        while control.read_volatile() & busy != 0 {
+            if addr_of!((*regs).clocking).read_volatile().bits & CLOCKING_CLOCK_ENABLE == 0 {
+                return Err(Error::new(ErrorKind::Other, "The core's clock is stopped"));
+            }
+            std::thread::yield_now();
+        }
+        Ok(())
+    }
+
     fn regs(&self) -> *const CpuRegisters {
         *self.map as *const CpuRegisters
     }
@@ -38,6 +38,7 @@ struct DmaBufImportSyncFile {
 pub struct DmaBuf {
     pub fd: libc::c_int,
     size: usize,
+    coherent: bool,
 }
 
 impl DmaBuf {
@@ -45,6 +46,7 @@ impl DmaBuf {
         Self {
             fd,
             size,
+            coherent: false,
         }
     }
 
@@ -52,6 +54,12 @@ impl DmaBuf {
         self.size
     }
 
+    /// Marks the buffer as only being accessed by the fabric through the ACP, whose accesses are
+    /// snooped in the ARM caches. Syncs then only order the CPU's own accesses.
+    pub fn set_coherent(&mut self, coherent: bool) {
+        self.coherent = coherent;
+    }
+
     pub fn map(&mut self) -> Result<MemoryMap> {
         let map = unsafe {
             libc::mmap(
@@ -88,6 +96,10 @@ impl DmaBuf {
     }
 
     fn sync(&mut self, flags: u64) {
+        if self.coherent {
+            std::sync::atomic::fence(std::sync::atomic::Ordering::SeqCst);
+            return;
+        }
         let sync = DmaBufSync {
             flags,
         };
@@ -0,0 +1,78 @@
+use std::io::{Error, ErrorKind, Result};
+use super::{DmaBuf, MemoryMap, Userdma};
+
+/// A pair of DDR rings the fabric moves to and from the mailbox FIFOs through an HP port.
+/// The buffer holds the ARM -> RISC-V ring followed by the RISC-V -> ARM one.
+pub struct MailboxRing {
+    buf: DmaBuf,
+    map: MemoryMap,
+    phys: usize,
+    size_log2: u32,
+    pub(super) tx_head: u32,
+    pub(super) rx_tail: u32,
+}
+
+impl MailboxRing {
+    pub fn new(alloc: &Userdma, size_log2: u32) -> Result<Self> {
+        if !(4..=20).contains(&size_log2) {
+            return Err(Error::new(ErrorKind::InvalidInput, "Ring size must be 2^4 to 2^20 words"));
+        }
+        let (mut buf, phys) = alloc.alloc_buf(8 << size_log2)?;
+        if phys % 64 != 0 {
+            return Err(Error::new(ErrorKind::Other, "Ring buffer isn't aligned to 64 bytes"));
+        }
+        let map = buf.map()?;
+        Ok(Self {
+            buf,
+            map,
+            phys,
+            size_log2,
+            tx_head: 0,
+            rx_tail: 0,
+        })
+    }
+
+    pub fn size_log2(&self) -> u32 {
+        self.size_log2
+    }
+
+    pub fn words(&self) -> usize {
+        1 << self.size_log2
+    }
+
+    pub fn tx_phys(&self) -> usize {
+        self.phys
+    }
+
+    pub fn rx_phys(&self) -> usize {
+        self.phys + 4 * self.words()
+    }
+
+    /// Copies `vals` into the ARM -> RISC-V ring at `head`, the caller checked they fit.
+    pub(super) fn store(&mut self, head: u32, vals: &[u32]) {
+        let mask = self.words() - 1;
+        let ring = *self.map as *mut u32;
+        self.buf.with_sync(|| {
+            for (i, v) in vals.iter().enumerate() {
+                unsafe {
+                    ring.add((head as usize + i) & mask).write_volatile(*v);
+                }
+            }
+        });
+    }
+
+    /// Copies words from the RISC-V -> ARM ring at `tail` into `buf`, the caller checked they're there.
+    pub(super) fn load(&mut self, tail: u32, buf: &mut [u32]) {
+        let mask = self.words() - 1;
+        let ring = unsafe {
+            (*self.map as *const u32).add(self.words())
+        };
+        self.buf.with_sync(|| {
+            for (i, v) in buf.iter_mut().enumerate() {
+                unsafe {
+                    *v = ring.add((tail as usize + i) & mask).read_volatile();
+                }
+            }
+        });
+    }
+}
@@ -3,10 +3,14 @@ use std::ops::Deref;
 mod alloc;
 mod cpu;
 mod dma_buf;
+mod mailbox_ring;
+mod trace_buffer;
 
 pub use alloc::Userdma;
-pub use cpu::Cpu;
+pub use cpu::{Cpu, LatencyStats, PerfCounters, SysAttributes};
 pub use dma_buf::DmaBuf;
+pub use mailbox_ring::MailboxRing;
+pub use trace_buffer::{TraceBuffer, TraceChannel, TraceRecord};
 
 pub struct MemoryMap {
     ptr: *mut libc::c_void,
@@ -0,0 +1,101 @@
+use std::io::{Error, ErrorKind, Result};
+use super::{DmaBuf, MemoryMap, Userdma};
+
+/// The AXI channel a trace record was taken on
+#[derive(Clone, Copy, Debug, PartialEq, Eq)]
+pub enum TraceChannel {
+    ReadAddress,
+    WriteAddress,
+    /// The last beat of a read burst
+    Read,
+    WriteResponse,
+}
+
+/// One transfer on the core's system bus. `address` and `len` are only set on the address
+/// channels, `resp` only on the response ones. `lost` counts the records of the same channel
+/// dropped just before this one because the ring was full, saturated to 255.
+#[derive(Clone, Copy, Debug)]
+pub struct TraceRecord {
+    pub timestamp: u64,
+    pub channel: TraceChannel,
+    pub address: u32,
+    pub len: u8,
+    pub id: u16,
+    pub resp: u8,
+    pub lost: u8,
+}
+
+impl TraceRecord {
+    fn decode(words: [u32; 4]) -> Self {
+        let info = words[3];
+        Self {
+            timestamp: (words[1] as u64) << 32 | words[0] as u64,
+            channel: match info & 0b11 {
+                0 => TraceChannel::ReadAddress,
+                1 => TraceChannel::WriteAddress,
+                2 => TraceChannel::Read,
+                _ => TraceChannel::WriteResponse,
+            },
+            address: words[2],
+            len: ((info >> 4) & 0xF) as u8,
+            id: ((info >> 8) & 0xFFF) as u16,
+            resp: ((info >> 2) & 0b11) as u8,
+            lost: (info >> 24) as u8,
+        }
+    }
+}
+
+/// A DDR ring of 16 byte records the fabric traces the core's system bus into through an HP port.
+pub struct TraceBuffer {
+    buf: DmaBuf,
+    map: MemoryMap,
+    phys: usize,
+    size_log2: u32,
+    pub(super) tail: u32,
+}
+
+impl TraceBuffer {
+    pub fn new(alloc: &Userdma, size_log2: u32) -> Result<Self> {
+        if !(4..=20).contains(&size_log2) {
+            return Err(Error::new(ErrorKind::InvalidInput, "Trace size must be 2^4 to 2^20 records"));
+        }
+        let (mut buf, phys) = alloc.alloc_buf(16 << size_log2)?;
+        if phys % 16 != 0 {
+            return Err(Error::new(ErrorKind::Other, "Trace buffer isn't aligned to 16 bytes"));
+        }
+        let map = buf.map()?;
+        Ok(Self {
+            buf,
+            map,
+            phys,
+            size_log2,
+            tail: 0,
+        })
+    }
+
+    pub fn size_log2(&self) -> u32 {
+        self.size_log2
+    }
+
+    pub fn records(&self) -> usize {
+        1 << self.size_log2
+    }
+
+    pub fn phys(&self) -> usize {
+        self.phys
+    }
+
+    /// Decodes `n` records from `tail` on, the caller checked they're there.
+    pub(super) fn load(&mut self, tail: u32, n: usize) -> Vec<TraceRecord> {
+        let mask = self.records() - 1;
+        let ring = *self.map as *const [u32; 4];
+        self.buf.with_sync(|| {
+            (0..n).map(|i| {
+                let words = unsafe {
+                    ring.add((tail as usize + i) & mask).read_volatile()
+                };
+                TraceRecord::decode(words)
+            }).collect()
+        })
+    }
+}
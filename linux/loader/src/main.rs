@@ -17,6 +17,18 @@ struct Args {
     #[arg()]
     path: String,
 
+    /// The bitstream puts the CPU on the ACP, skip cache maintenance on the program buffer.
+    #[arg(long)]
+    coherent: bool,
+
+    /// Serve the core's instruction fetches from the fabric read cache.
+    #[arg(long)]
+    fetch_cache: bool,
+
+    /// Core to run the program on, in a multi-core bitstream.
+    #[arg(long, default_value_t = 0)]
+    core: usize,
+
     /// Program to run on the host to interact with the CPU.
     #[arg(trailing_var_arg = true, allow_hyphen_values = true)]
     args: Vec<String>,
@@ -117,6 +129,7 @@ fn main() {
     let alloc = hal::Userdma::open().expect("userdma driver not loaded");
     let (mut code_buf, load_addr) = alloc.alloc_buf(alloc_size).expect("Failed to allocate buffer");
     debug!("Allocated {alloc_size} bytes at 0x{load_addr:08X}");
+    code_buf.set_coherent(args.coherent);
 
     {
         let base_map = code_buf.map().unwrap();
@@ -208,10 +221,11 @@ fn main() {
     }
 
     let mut cpu = unsafe {
-        hal::Cpu::open().unwrap()
+        hal::Cpu::open_core(args.core).unwrap()
     };
     let start = load_addr + (elf.ehdr.e_entry - min_vaddr) as usize;
     info!("Starting CPU at vaddr 0x{:08X} (phys 0x{:08x})", elf.ehdr.e_entry, start);
+    cpu.read_cache_configure(args.fetch_cache, true);
     unsafe {
         cpu.boot(start);
     }